@@ -1,9 +1,46 @@
+from typing import Optional
+
 import jwt
+from apps.utils import cache_decorator
 from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
 from drf_spectacular.extensions import OpenApiAuthenticationExtension
 from rest_framework import authentication, exceptions
 
-from .models import User
+from .models import TOKEN_CLAIMS, User
+
+# Everything but the password hash, which no request handler needs.
+PRINCIPAL_FIELDS = [
+    field.attname for field in User._meta.concrete_fields if field.attname != "password"
+]
+
+
+def decode_token(token: str) -> dict:
+    return jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+
+
+@cache_decorator(
+    "auth.principal",
+    timeout=settings.AUTH_PRINCIPAL_CACHE_TIMEOUT,
+    negative_timeout=0,
+    local_timeout=settings.AUTH_PRINCIPAL_LOCAL_TIMEOUT,
+)
+def get_principal(user_id: int) -> Optional[dict]:
+    """
+    Field values of the user with user_id, cached per worker and in Redis.
+
+    Read from the primary: a lagging replica would put a stale is_active into the
+    cache right after the signal that invalidated it. QuerySet.update() sends no
+    signal, so code deactivating users that way must call get_principal.invalidate()
+    for each of them, or they keep access until the cache entry expires.
+    """
+    return User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id).values(*PRINCIPAL_FIELDS).first()
+
+
+def build_user(fields: dict) -> User:
+    """A User as loaded from the database; fields not given are deferred."""
+    names = [field.attname for field in User._meta.concrete_fields if field.attname in fields]
+    return User.from_db(DEFAULT_DB_ALIAS, names, [fields[name] for name in names])
 
 
 class JWTAuthentication(authentication.BaseAuthentication):
@@ -14,6 +51,13 @@ class JWTAuthentication(authentication.BaseAuthentication):
         Authenticate the request and return a two-tuple of (user, token).
         """
         request.user = None
+        token = self._get_token(request)
+        if token is None:
+            return None
+
+        return self._authenticate_credentials(request, token)
+
+    def _get_token(self, request) -> Optional[str]:
         auth_header = authentication.get_authorization_header(request).split()
         auth_header_prefix = self.authentication_header_prefix.lower()
 
@@ -31,26 +75,59 @@ class JWTAuthentication(authentication.BaseAuthentication):
         if prefix.lower() != auth_header_prefix:
             return None
 
-        return self._authenticate_credentials(request, token)
+        return token
 
     def _authenticate_credentials(self, request, token):
+        payload = self._decode(token)
+        if (user := self._claims_user(payload)) is not None:
+            return user, token
+
+        return self._active_user(get_principal(payload["id"])), token
+
+    def _decode(self, token: str) -> dict:
         try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+            payload = decode_token(token)
         except Exception:
             msg = "Cannot decode token"
             raise exceptions.AuthenticationFailed(msg)
+        if "id" not in payload:
+            msg = "Token has no user id."
+            raise exceptions.AuthenticationFailed(msg)
+        return payload
 
-        try:
-            user = User.objects.get(pk=payload["id"])
-        except User.DoesNotExist:
+    def _claims_user(self, payload: dict) -> Optional[User]:
+        if settings.AUTH_TOKEN_CLAIMS and TOKEN_CLAIMS.issubset(payload):
+            # The signature vouches for the claims; deactivation applies at token expiry.
+            fields = {claim: payload[claim] for claim in TOKEN_CLAIMS}
+            return build_user({**fields, "is_active": True})
+        return None
+
+    def _active_user(self, fields: Optional[dict]) -> User:
+        if fields is None:
             msg = "No user with token."
             raise exceptions.AuthenticationFailed(msg)
 
+        user = build_user(fields)
         if not user.is_active:
             msg = "User is deactivated."
             raise exceptions.AuthenticationFailed(msg)
 
-        return user, token
+        return user
+
+
+class AsyncJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication for async views; a warm principal cache costs no thread hop."""
+
+    async def authenticate(self, request):
+        token = self._get_token(request)
+        if token is None:
+            return None
+
+        payload = self._decode(token)
+        if (user := self._claims_user(payload)) is not None:
+            return user, token
+
+        return self._active_user(await get_principal.acall(payload["id"])), token
 
 
 class SwaggerAuthentication(OpenApiAuthenticationExtension):
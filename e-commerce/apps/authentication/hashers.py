@@ -0,0 +1,77 @@
+import logging
+import time
+from typing import Callable, Dict, Optional
+
+from config.metrics import PASSWORD_HASH_LATENCY, PASSWORD_HASHES_IN_FLIGHT
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from gevent import monkey
+from gevent.threadpool import ThreadPool
+
+logger = logging.getLogger(__name__)
+
+
+class HashingPool:
+    """
+    Bounded pool of native threads that password hashes are computed on.
+
+    hashlib drops the GIL while deriving a key, so under the gevent worker the
+    greenlet waiting for a hash yields and the rest of the worker keeps serving.
+    Outside a monkey-patched process (runserver, tests, management commands) or
+    with size 0 hashes are computed inline.
+
+    Counters are only touched from the event loop, so they need no locking. In-flight
+    hashes and hash latency are also exported to Prometheus.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.in_flight = 0
+        self.completed = 0
+        self.max_queue_depth = 0
+        self._pool: Optional[ThreadPool] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return max(self.in_flight - self.size, 0)
+
+    def run(self, func: Callable, *args):
+        if not self.size or not monkey.is_module_patched("threading"):
+            return func(*args)
+
+        if self._pool is None:
+            self._pool = ThreadPool(self.size)
+        self.in_flight += 1
+        PASSWORD_HASHES_IN_FLIGHT.inc()
+        if depth := self.queue_depth:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+            logger.info("Password hash queued behind %d others", depth)
+        started = time.monotonic()
+        try:
+            return self._pool.apply(func, args)
+        finally:
+            elapsed = time.monotonic() - started
+            self.in_flight -= 1
+            self.completed += 1
+            PASSWORD_HASHES_IN_FLIGHT.dec()
+            PASSWORD_HASH_LATENCY.observe(elapsed)
+            logger.debug("Password hash took %.1f ms", elapsed * 1000)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": self.size,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "completed": self.completed,
+        }
+
+
+hashing_pool = HashingPool(settings.PASSWORD_HASHING_THREADS)
+
+
+class ThreadPoolPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2 (same algorithm and hash format) computed on the hashing pool."""
+
+    def encode(self, password, salt, iterations=None):
+        return hashing_pool.run(super().encode, password, salt, iterations)
@@ -0,0 +1,89 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from apps.benchmark import request, summary
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure GET orders/ latency on a running server, first alone and then during a "
+        "storm of logins. Run it against the server with PASSWORD_HASHING_THREADS=0 and "
+        "with the default to compare hashing on and off the event loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://localhost:8000")
+        parser.add_argument("--duration", type=float, default=20, help="Seconds per phase.")
+        parser.add_argument("--readers", type=int, default=10)
+        parser.add_argument("--login-concurrency", type=int, default=20)
+
+    def handle(self, *args, base_url, duration, readers, login_concurrency, **options):
+        self.base_url = base_url.rstrip("/")
+        password = "bench-password"
+        reader_token = self._register(password)
+        storm_phone = self._phone()
+        self._register(password, storm_phone)
+
+        quiet = self._read_orders(reader_token, readers, duration)
+
+        stop = threading.Event()
+        logins = []
+
+        def login():
+            while not stop.is_set():
+                status, _, elapsed = request(
+                    "POST",
+                    f"{self.base_url}/api/auth/users/login/",
+                    {"phone_number": storm_phone, "password": password},
+                )
+                if status == 200:
+                    logins.append(elapsed)
+
+        with ThreadPoolExecutor(max_workers=login_concurrency) as executor:
+            for _ in range(login_concurrency):
+                executor.submit(login)
+            storm = self._read_orders(reader_token, readers, duration)
+            stop.set()
+
+        result = {
+            "orders_quiet": quiet,
+            "orders_during_login_storm": storm,
+            "logins": summary(logins, duration),
+        }
+        self.stdout.write(json.dumps(result, indent=2))
+
+    def _read_orders(self, token: str, readers: int, duration: float) -> dict:
+        samples = []
+        deadline = time.monotonic() + duration
+
+        def read():
+            while time.monotonic() < deadline:
+                status, _, elapsed = request(
+                    "GET", f"{self.base_url}/api/core/orders/", token=token
+                )
+                if status == 200:
+                    samples.append(elapsed)
+
+        with ThreadPoolExecutor(max_workers=readers) as executor:
+            for _ in range(readers):
+                executor.submit(read)
+        return summary(samples, duration)
+
+    def _register(self, password: str, phone_number: str = None) -> str:
+        phone_number = phone_number or self._phone()
+        status, body, _ = request(
+            "POST",
+            f"{self.base_url}/api/auth/users/",
+            {"phone_number": phone_number, "username": phone_number, "password": password},
+        )
+        if status != 201:
+            raise CommandError(f"Cannot register a benchmark user: {status} {body}")
+        return body["token"]
+
+    @staticmethod
+    def _phone() -> str:
+        return f"+77{random.randrange(10**9):09d}"
@@ -1,11 +1,14 @@
 from datetime import datetime, timedelta
 
 import jwt
-from config import settings
+from django.conf import settings
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
 from django.contrib.auth.models import PermissionsMixin
 from django.db import models
 
+# User fields carried by the token for AUTH_TOKEN_CLAIMS mode.
+TOKEN_CLAIMS = {"id", "username", "phone_number", "is_staff", "is_superuser"}
+
 
 class UserManager(BaseUserManager):
     """
@@ -80,8 +83,11 @@ class User(AbstractBaseUser, PermissionsMixin):
     def _generate_jwt_token(self):
         dt = datetime.now() + timedelta(days=1)
 
+        # Without AUTH_TOKEN_CLAIMS nothing reads the other fields: keep them out of the token.
+        names = TOKEN_CLAIMS if settings.AUTH_TOKEN_CLAIMS else {"id"}
+        claims = {claim: getattr(self, claim) for claim in names}
         token = jwt.encode(
-            {"id": self.pk, "exp": int(dt.strftime("%s"))}, settings.SECRET_KEY, algorithm="HS256"
+            {**claims, "exp": int(dt.strftime("%s"))}, settings.SECRET_KEY, algorithm="HS256"
         )
 
         return token
@@ -58,10 +58,13 @@ class UserSerializer(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         password = validated_data.pop("password", None)
+        update_fields = list(validated_data)
         for key, value in validated_data.items():
             setattr(instance, key, value)
 
         if password is not None:
             instance.set_password(password)
-        instance.save()
+            update_fields.append("password")
+        # Write back only what the client sent, never columns changed meanwhile.
+        instance.save(update_fields=update_fields)
         return instance
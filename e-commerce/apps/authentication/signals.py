@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .backends import get_principal
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_principal(sender, instance, using, **kwargs):
+    # Covers profile updates through UserSerializer and is_active flips in the admin.
+    # Not QuerySet.update(), which sends no signals; see get_principal.
+    user_id = instance.pk
+    transaction.on_commit(lambda: get_principal.invalidate(user_id), using=using)
@@ -0,0 +1,153 @@
+from unittest import mock
+
+from apps.testing import QueryBudgetMixin
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password, make_password
+from django.db import connections
+from django.test import SimpleTestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from .backends import decode_token, get_principal
+from .hashers import hashing_pool
+from .models import User
+from .serializers import UserSerializer
+
+
+class PrincipalCacheTests(TransactionTestCase):
+    databases = {"default", "readonly"}
+
+    def setUp(self):
+        self.user = User.objects.create_user("buyer", "+77000000000", "password")
+        self.auth = {
+            "HTTP_AUTHORIZATION": f"Bearer {self.user.token}",
+            "HTTP_ACCEPT": "application/json",
+        }
+        self.addCleanup(get_principal.invalidate, self.user.id)
+
+    def _profile(self):
+        return self.client.get("/api/auth/user", **self.auth)
+
+    def test_authenticated_requests_run_no_auth_queries_once_cached(self):
+        self._profile()
+
+        with self.assertNumQueries(0), self.assertNumQueries(0, using="readonly"):
+            response = self._profile()
+        self.assertEqual(response.json()["username"], "buyer")
+
+    def test_deactivation_takes_effect_immediately(self):
+        self._profile()
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self._profile().status_code, 403)
+
+    def test_profile_update_is_visible_to_the_next_request(self):
+        self._profile()
+
+        self.client.patch(
+            "/api/auth/user", {"username": "renamed"}, content_type="application/json", **self.auth
+        )
+
+        self.assertEqual(self._profile().json()["username"], "renamed")
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("password"))
+
+    def test_profile_update_leaves_other_columns_alone(self):
+        stale = User.objects.get(id=self.user.id)
+        User.objects.filter(id=self.user.id).update(is_active=False)
+
+        serializer = UserSerializer(stale, data={"username": "renamed"}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.username, "renamed")
+        self.assertFalse(self.user.is_active)
+
+    def test_profile_update_reads_the_primary(self):
+        self._profile()
+
+        with CaptureQueriesContext(connections["default"]) as primary:
+            self.client.patch(
+                "/api/auth/user",
+                {"username": "renamed"},
+                content_type="application/json",
+                **self.auth,
+            )
+
+        reads = [query["sql"] for query in primary.captured_queries]
+        self.assertTrue(
+            any(sql.startswith("SELECT") and "authentication_user" in sql for sql in reads)
+        )
+
+    def test_deactivation_through_update_needs_an_explicit_invalidation(self):
+        self._profile()
+
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        self.assertEqual(self._profile().status_code, 200)
+
+        get_principal.invalidate(self.user.id)
+        self.assertEqual(self._profile().status_code, 403)
+
+    def test_tokens_carry_only_the_user_id(self):
+        self.assertEqual(set(decode_token(self.user.token)) - {"exp"}, {"id"})
+
+    @mock.patch("django.conf.settings.AUTH_TOKEN_CLAIMS", True)
+    def test_signed_claims_skip_the_lookup(self):
+        self.auth["HTTP_AUTHORIZATION"] = f"Bearer {self.user.token}"
+
+        with self.assertNumQueries(0), self.assertNumQueries(0, using="readonly"):
+            response = self._profile()
+        self.assertEqual(response.json()["phone_number"], "+77000000000")
+
+
+class ThreadPoolHasherTests(SimpleTestCase):
+    def test_hashes_stay_compatible_with_stock_pbkdf2(self):
+        encoded = make_password("password")
+
+        self.assertTrue(encoded.startswith("pbkdf2_sha256$"))
+        self.assertTrue(PBKDF2PasswordHasher().verify("password", encoded))
+        self.assertTrue(
+            check_password("password", PBKDF2PasswordHasher().encode("password", "salt"))
+        )
+
+    @mock.patch("apps.authentication.hashers.monkey.is_module_patched", return_value=True)
+    def test_hashes_run_on_the_pool_under_gevent(self, _):
+        completed = hashing_pool.completed
+
+        self.assertTrue(check_password("password", make_password("password")))
+
+        self.assertEqual(hashing_pool.completed, completed + 2)
+        self.assertEqual(hashing_pool.in_flight, 0)
+
+
+class QueryBudgetTests(QueryBudgetMixin, TransactionTestCase):
+    """Query budgets of the auth endpoints, with principals not cached."""
+
+    databases = {"default", "readonly"}
+
+    def setUp(self):
+        self.credentials = {"phone_number": "+77000000000", "password": "password"}
+        self.user = User.objects.create_user("buyer", **self.credentials)
+        self.headers = {"HTTP_ACCEPT": "application/json"}
+        self.auth = {**self.headers, "HTTP_AUTHORIZATION": f"Bearer {self.user.token}"}
+        self.addCleanup(get_principal.invalidate, self.user.id)
+
+    def _request(self, budget, method, path, data=None, headers=None):
+        get_principal.invalidate(self.user.id)
+        with self.assertQueryBudget(budget, f"{method.upper()} {path}"):
+            response = getattr(self.client, method)(
+                path, data, content_type="application/json", **(headers or self.auth)
+            )
+        self.assertLess(response.status_code, 400, response.content)
+
+    def test_registration(self):
+        data = {"phone_number": "+77000000001", "username": "other", "password": "password"}
+        self._request(3, "post", "/api/auth/users/", data, self.headers)
+
+    def test_login(self):
+        self._request(1, "post", "/api/auth/users/login/", self.credentials, self.headers)
+
+    def test_profile(self):
+        self._request(1, "get", "/api/auth/user")
+        self._request(4, "patch", "/api/auth/user", {"username": "renamed"})
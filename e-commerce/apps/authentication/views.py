@@ -5,6 +5,7 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from .models import User
 from .serializers import LoginSerializer, RegistrationSerializer, UserSerializer
 
 
@@ -64,7 +65,10 @@ class UserRetrieveUpdateAPIView(RetrieveUpdateAPIView):
 
     @extend_schema(request=serializer_class, responses=UserSerializer)
     def update(self, request, *args, **kwargs):
-        serializer = self.serializer_class(request.user, data=request.data, partial=True)
+        # request.user may come from the principal cache or token claims, never save it back;
+        # read from the primary, as a lagging replica row would be the one we write to.
+        user = User.objects.using("default").get(pk=request.user.pk)
+        serializer = self.serializer_class(user, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         serializer.save()
 
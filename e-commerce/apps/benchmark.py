@@ -0,0 +1,47 @@
+import json
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+def percentiles(samples: Sequence[float], points: Sequence[int] = (50, 95, 99)) -> Dict[str, float]:
+    """Nearest-rank percentiles of latencies in seconds, reported in milliseconds."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {f"p{point}": 0.0 for point in points}
+    return {
+        f"p{point}": round(ordered[max(round(point / 100 * len(ordered)) - 1, 0)] * 1000, 2)
+        for point in points
+    }
+
+
+def request(
+    method: str, url: str, data: Optional[dict] = None, token: Optional[str] = None
+) -> Tuple[int, dict, float]:
+    """Sends a JSON request and returns (status, body, seconds taken)."""
+    headers = {"Accept": "application/json", "Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    body = json.dumps(data).encode() if data is not None else None
+    req = urllib.request.Request(url, data=body, headers=headers, method=method)
+
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=30) as response:
+            status, payload = response.status, response.read()
+    except urllib.error.HTTPError as error:
+        status, payload = error.code, error.read()
+    elapsed = time.perf_counter() - started
+    try:
+        return status, json.loads(payload or b"{}"), elapsed
+    except ValueError:
+        return status, {}, elapsed
+
+
+def summary(samples: List[float], wall_time: float) -> Dict[str, float]:
+    return {
+        "requests": len(samples),
+        "throughput": round(len(samples) / wall_time, 2) if wall_time else 0.0,
+        **percentiles(samples),
+    }
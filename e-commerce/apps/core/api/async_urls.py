@@ -0,0 +1,55 @@
+from apps.core.api.views import (
+    AsyncCategoriesView,
+    AsyncOrderActionView,
+    AsyncOrderCancelView,
+    AsyncOrderDetailView,
+    AsyncOrderItemsView,
+    AsyncOrderProductView,
+    AsyncOrdersView,
+    AsyncProductsView,
+    OrderRemoveProductView,
+)
+from django.urls import path
+
+# Same routes as apps.core.api.urls, served by async views under ASGI.
+urlpatterns = [
+    path("orders/", AsyncOrdersView.as_view(), name="async_create_order"),
+    path("orders/<int:pk>", AsyncOrderDetailView.as_view(), name="async_get_orders"),
+    path(
+        "orders/<int:pk>/add",
+        AsyncOrderProductView.as_view(action="add_products"),
+        name="async_add_product_orders",
+    ),
+    path(
+        "orders/<int:pk>/remove",
+        AsyncOrderProductView.as_view(
+            action="remove_products",
+            serializer_class=OrderRemoveProductView.RemoveProductSerializer,
+        ),
+        name="async_remove_product_orders",
+    ),
+    path("orders/<int:pk>/items", AsyncOrderItemsView.as_view(), name="async_items_orders"),
+    path(
+        "orders/<int:pk>/remove-all",
+        AsyncOrderActionView.as_view(action="remove_all_products"),
+        name="async_remove_all_product_orders",
+    ),
+    path(
+        "orders/<int:pk>/payment",
+        AsyncOrderActionView.as_view(action="payment_release"),
+        name="async_payment_orders",
+    ),
+    path(
+        "orders/<int:pk>/delivery",
+        AsyncOrderActionView.as_view(action="delivery_release"),
+        name="async_delivery_orders",
+    ),
+    path(
+        "orders/<int:pk>/finish",
+        AsyncOrderActionView.as_view(action="finishing"),
+        name="async_finish_orders",
+    ),
+    path("orders/<int:pk>/cancel", AsyncOrderCancelView.as_view(), name="async_cancel_orders"),
+    path("products/", AsyncProductsView.as_view(), name="async_list_products"),
+    path("categories/", AsyncCategoriesView.as_view(), name="async_list_categories"),
+]
@@ -0,0 +1,158 @@
+import hashlib
+import random
+import time
+from collections import Counter
+from typing import Any, Callable, List
+from urllib.parse import urlencode
+
+from apps.utils import get_redis
+from config.metrics import CACHE_REQUESTS
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+VERSION_KEY = "catalog:version"
+BUMPED_AT_KEY = "catalog:bumped_at"
+POPULAR_KEY = "catalog:popular"
+
+# The only query parameters catalog list views read; anything else shares their page.
+PAGE_QUERY_PARAMS = ("count", "cursor", "page_size")
+
+cache_hits = CACHE_REQUESTS.labels("catalog", "hit")
+cache_misses = CACHE_REQUESTS.labels("catalog", "miss")
+
+
+def catalog_version() -> int:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version() -> None:
+    """Moves the catalog to a fresh key namespace; old entries simply expire."""
+    cache.set(BUMPED_AT_KEY, time.time(), settings.CATALOG_CACHE_TIMEOUT)
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 2, timeout=None)
+
+
+def catalog_page(request) -> str:
+    """The path and page parameters of a catalog request, in a canonical order."""
+    params = [
+        (name, request.GET[name]) for name in PAGE_QUERY_PARAMS if request.GET.get(name) is not None
+    ]
+    return f"{request.path}?{urlencode(params)}" if params else request.path
+
+
+def _popular_key(window: int) -> str:
+    return f"{POPULAR_KEY}:{window}"
+
+
+def count_popular_page(page: str) -> None:
+    """
+    Counts a sampled fraction of requests per page, in hourly sets capped at
+    CATALOG_POPULAR_MAX_PAGES members that expire after the next hour.
+    """
+    if random.random() >= settings.CATALOG_POPULAR_SAMPLE_RATE:
+        return
+    key = _popular_key(int(time.time() // settings.CATALOG_POPULAR_WINDOW))
+    pipeline = get_redis().pipeline(transaction=False)
+    pipeline.zincrby(key, 1, page)
+    pipeline.zremrangebyrank(key, 0, -settings.CATALOG_POPULAR_MAX_PAGES - 1)
+    pipeline.expire(key, settings.CATALOG_POPULAR_WINDOW * 2)
+    pipeline.execute()
+
+
+def popular_pages(limit: int) -> List[str]:
+    """Most requested catalog pages over this and the previous hour, most popular first."""
+    window = int(time.time() // settings.CATALOG_POPULAR_WINDOW)
+    scores = Counter()
+    for key in (_popular_key(window - 1), _popular_key(window)):
+        for page, score in get_redis().zrevrange(key, 0, limit - 1, withscores=True):
+            scores[page.decode()] += score
+    return [page for page, _ in scores.most_common(limit)]
+
+
+def get_or_compute(key: str, compute: Callable[[], Any]) -> Any:
+    """
+    Returns the cached value for key, computing it at most once across all workers.
+
+    Entries carry a soft deadline well before their TTL. The first worker to see an
+    entry past that deadline takes a lock and recomputes it while the others keep
+    serving the cached copy. On a cold key the lock holder computes and the rest
+    poll for its result instead of all hitting the database at once.
+    """
+    lock_key = f"{key}:lock"
+    entry = cache.get(key)
+    if entry is not None:
+        cache_hits.inc()
+        refresh_at, value = entry
+        if refresh_at > time.time():
+            return value
+        if not cache.add(lock_key, 1, settings.CATALOG_CACHE_LOCK_TIMEOUT):
+            return value
+        return _fill(key, lock_key, compute)
+
+    cache_misses.inc()
+    if cache.add(lock_key, 1, settings.CATALOG_CACHE_LOCK_TIMEOUT):
+        return _fill(key, lock_key, compute)
+
+    deadline = time.monotonic() + settings.CATALOG_CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(settings.CATALOG_CACHE_POLL_INTERVAL)
+        if (entry := cache.get(key)) is not None:
+            return entry[1]
+        # The holder failed and released the lock, or it expired: take over.
+        if cache.add(lock_key, 1, settings.CATALOG_CACHE_LOCK_TIMEOUT):
+            return _fill(key, lock_key, compute)
+    return compute()
+
+
+def _fill(key: str, lock_key: str, compute: Callable[[], Any]) -> Any:
+    try:
+        value = compute()
+        now = time.time()
+        refresh_at = now + settings.CATALOG_CACHE_REFRESH_AFTER
+        # Computed on a replica that may not have replayed the last bump yet: refresh
+        # once every replica in rotation is bound to have it.
+        settled_at = cache.get(BUMPED_AT_KEY, 0) + settings.DATABASE_REPLICA_MAX_LAG
+        if settled_at > now:
+            refresh_at = settled_at
+        cache.set(key, (refresh_at, value), settings.CATALOG_CACHE_TIMEOUT)
+        return value
+    finally:
+        cache.delete(lock_key)
+
+
+def cached_catalog_page(view_name: str, request, compute: Callable[[], Any]) -> Any:
+    """Response data for the request under the current catalog version; counts the page."""
+    page = catalog_page(request)
+    count_popular_page(page)
+    # Only the path and page parameters: keys must not multiply with the Host header.
+    imprint = hashlib.md5(page.encode()).hexdigest()
+    key = f"catalog:{catalog_version()}:{view_name}:{imprint}"
+    return get_or_compute(key, compute)
+
+
+class CatalogCacheMixin:
+    """
+    Caches list responses of catalog views under the current catalog version.
+
+    Product and Category signals bump the version on commit, so entries can live
+    for a long time without serving stale prices. Checkouts change stock without
+    a bump, so listed stock may lag by up to CATALOG_CACHE_REFRESH_AFTER. Fills
+    read from a replica; those made within DATABASE_REPLICA_MAX_LAG of a bump are
+    refreshed once it has passed. Views paginate with CatalogPagination, so cached
+    links do not depend on the request's host.
+    """
+
+    def list(self, request, *args, **kwargs):
+        data = cached_catalog_page(
+            type(self).__name__,
+            request,
+            lambda: super(CatalogCacheMixin, self).list(request).data,
+        )
+        return Response(data)
@@ -0,0 +1,76 @@
+from typing import Optional
+
+from apps.core.api.cache import catalog_page
+from django.conf import settings
+from django.utils.encoding import force_str
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over an indexed, unique ordering: every page is an index range
+    scan starting right after the previous one, so deep pages cost as much as the
+    first. The total count is a separate COUNT(*) that grows with the table, so it
+    is computed only for clients that ask for it with ?count=true.
+    """
+
+    ordering = "id"
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    count_query_param = "count"
+    count_query_description = "Set to true to also return the total number of results."
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = self.get_count(queryset, request)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count(self, queryset, request) -> Optional[int]:
+        if request.query_params.get(self.count_query_param, "").lower() in ("true", "1"):
+            return queryset.count()
+        return None
+
+    def get_paginated_response(self, data):
+        response = {"next": self.get_next_link(), "previous": self.get_previous_link()}
+        if self.count is not None:
+            response = {"count": self.count, **response}
+        return Response({**response, "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"] = {
+            "count": {"type": "integer", "example": 123},
+            **response_schema["properties"],
+        }
+        return response_schema
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                "name": self.count_query_param,
+                "required": False,
+                "in": "query",
+                "description": force_str(self.count_query_description),
+                "schema": {"type": "boolean", "default": False},
+            }
+        ]
+
+
+class CatalogPagination(KeysetPagination):
+    """
+    Links to CATALOG_CACHE_WARM_URL with only the page parameters, whatever the Host
+    and query string of the request: cached pages are served to every client.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = super().paginate_queryset(queryset, request, view)
+        self.base_url = settings.CATALOG_CACHE_WARM_URL.rstrip("/") + catalog_page(request)
+        return page
+
+
+class NewestFirstPagination(KeysetPagination):
+    ordering = "-id"
+
+
+class RankedPagination(KeysetPagination):
+    ordering = ("-rank", "id")
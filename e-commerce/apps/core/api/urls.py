@@ -5,10 +5,12 @@ from apps.core.api.views import (
     OrderDeliveryView,
     OrderDetailView,
     OrderFinishView,
+    OrderItemsView,
     OrderPaymentView,
     OrderRemoveAllProductView,
     OrderRemoveProductView,
     OrdersView,
+    ProductSearchView,
     ProductsView,
 )
 from django.urls import path
@@ -18,6 +20,7 @@ urlpatterns = [
     path("orders/<int:pk>", OrderDetailView.as_view(), name="get_orders"),
     path("orders/<int:pk>/add", OrderAddProductView.as_view(), name="add_product_orders"),
     path("orders/<int:pk>/remove", OrderRemoveProductView.as_view(), name="remove_product_orders"),
+    path("orders/<int:pk>/items", OrderItemsView.as_view(), name="items_orders"),
     path(
         "orders/<int:pk>/remove-all",
         OrderRemoveAllProductView.as_view(),
@@ -28,5 +31,6 @@ urlpatterns = [
     path("orders/<int:pk>/finish", OrderFinishView.as_view(), name="finish_orders"),
     path("orders/<int:pk>/cancel", OrderCancelView.as_view(), name="cancel_orders"),
     path("products/", ProductsView.as_view(), name="list_products"),
+    path("products/search", ProductSearchView.as_view(), name="search_products"),
     path("categories/", CategoriesView.as_view(), name="list_categories"),
 ]
@@ -1,3 +1,13 @@
+from .async_views import (
+    AsyncCategoriesView,
+    AsyncOrderActionView,
+    AsyncOrderCancelView,
+    AsyncOrderDetailView,
+    AsyncOrderItemsView,
+    AsyncOrderProductView,
+    AsyncOrdersView,
+    AsyncProductsView,
+)
 from .category_views import CategoriesView
 from .order_views import (
     OrderAddProductView,
@@ -5,18 +15,20 @@ from .order_views import (
     OrderDeliveryView,
     OrderDetailView,
     OrderFinishView,
+    OrderItemsView,
     OrderPaymentView,
     OrderRemoveAllProductView,
     OrderRemoveProductView,
     OrdersView,
 )
-from .product_views import ProductsView
+from .product_views import ProductSearchView, ProductsView
 
 __all__ = [
     "OrdersView",
     "OrderDetailView",
     "OrderCancelView",
     "ProductsView",
+    "ProductSearchView",
     "CategoriesView",
     "OrderPaymentView",
     "OrderDeliveryView",
@@ -24,4 +36,13 @@ __all__ = [
     "OrderAddProductView",
     "OrderRemoveProductView",
     "OrderRemoveAllProductView",
+    "OrderItemsView",
+    "AsyncOrdersView",
+    "AsyncOrderDetailView",
+    "AsyncOrderProductView",
+    "AsyncOrderItemsView",
+    "AsyncOrderActionView",
+    "AsyncOrderCancelView",
+    "AsyncProductsView",
+    "AsyncCategoriesView",
 ]
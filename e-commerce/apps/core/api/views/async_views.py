@@ -0,0 +1,176 @@
+import json
+from typing import Any, Optional, Tuple
+
+from apps.authentication.backends import AsyncJWTAuthentication
+from apps.core.api.cache import cached_catalog_page
+from apps.core.api.pagination import CatalogPagination, NewestFirstPagination
+from apps.core.models import Category, Order, Product
+from apps.core.serializers import (
+    CategorySerializer,
+    FullOrderSerializer,
+    ProductSerializer,
+    SimpleOrderSerializer,
+)
+from apps.core.services import OrderService
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from exceptions import core_exception_handler
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .order_views import OrderAddProductView, OrderItemsView
+
+
+class AsyncAPIView(View):
+    """
+    Async counterpart of the APIView endpoints for the ASGI deployment.
+
+    Requests are authenticated by AsyncJWTAuthentication, responses are rendered
+    and errors formatted as in the sync API. Handlers return (data, status).
+
+    psycopg2 has no async interface, so Django runs async ORM calls in a worker
+    thread. Cursor pagination and the OrderService mutations, which need
+    transactions, are handed to that thread explicitly with sync_to_async.
+    """
+
+    authenticator = AsyncJWTAuthentication()
+    renderer = JSONRenderer()
+    requires_authentication = True
+    # Preflight requests are answered by CorsMiddleware before they get here.
+    http_method_names = ["get", "post", "put"]
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Token authentication, not cookies, so CSRF does not apply (as with APIView).
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            handler = getattr(self, request.method.lower(), None)
+            if request.method.lower() not in self.http_method_names or handler is None:
+                raise exceptions.MethodNotAllowed(request.method)
+
+            credentials = await self.authenticator.authenticate(request)
+            request.user = credentials[0] if credentials else AnonymousUser()
+            if self.requires_authentication and credentials is None:
+                raise exceptions.NotAuthenticated()
+
+            data, status_code = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            data, status_code = self.handle_exception(exc)
+
+        if data is None:
+            return HttpResponse(status=status_code)
+        return HttpResponse(
+            self.renderer.render(data), status=status_code, content_type="application/json"
+        )
+
+    def handle_exception(self, exc: Exception) -> Tuple[Any, int]:
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            # Like APIView when the authenticator sends no WWW-Authenticate header.
+            exc.status_code = status.HTTP_403_FORBIDDEN
+        response = core_exception_handler(exc, {"view": self})
+        if response is None:
+            raise exc
+        return response.data, response.status_code
+
+    def parse(self, request) -> Any:
+        try:
+            return json.loads(request.body or b"null")
+        except ValueError as exc:
+            raise exceptions.ParseError(f"JSON parse error - {exc}")
+
+
+class AsyncCatalogView(AsyncAPIView):
+    queryset = None
+    serializer_class = None
+    requires_authentication = False
+
+    async def get(self, request):
+        def compute():
+            paginator = CatalogPagination()
+            drf_request = Request(request)
+            page = paginator.paginate_queryset(self.queryset.all(), drf_request, view=self)
+            return paginator.get_paginated_response(
+                self.serializer_class(page, many=True).data
+            ).data
+
+        data = await sync_to_async(cached_catalog_page)(type(self).__name__, request, compute)
+        return data, status.HTTP_200_OK
+
+
+class AsyncProductsView(AsyncCatalogView):
+    queryset = Product.objects.defer("search_vector")
+    serializer_class = ProductSerializer
+
+
+class AsyncCategoriesView(AsyncCatalogView):
+    queryset = Category.objects.all()
+    serializer_class = CategorySerializer
+
+
+class AsyncOrdersView(AsyncAPIView):
+    async def get(self, request):
+        paginator = NewestFirstPagination()
+        orders = await sync_to_async(paginator.paginate_queryset)(
+            OrderService().get_all_orders(request.user), Request(request), view=self
+        )
+        data = SimpleOrderSerializer(orders, many=True).data
+        return paginator.get_paginated_response(data).data, status.HTTP_200_OK
+
+    async def post(self, request):
+        order = await Order.objects.acreate(user=request.user)
+        return {"order_id": order.id}, status.HTTP_201_CREATED
+
+
+class AsyncOrderDetailView(AsyncAPIView):
+    async def get(self, request, pk):
+        order_service = await OrderService.aload(pk)
+        order = await order_service.aget_order()
+        return FullOrderSerializer(order).data, status.HTTP_200_OK
+
+
+class AsyncOrderProductView(AsyncAPIView):
+    action: str = "add_products"
+    serializer_class = OrderAddProductView.AddProductSerializer
+
+    async def post(self, request, pk):
+        serializer = self.serializer_class(data=self.parse(request))
+        serializer.is_valid(raise_exception=True)
+        order_service = await OrderService.aload(pk)
+        await sync_to_async(getattr(order_service, self.action))(**serializer.data)
+        return None, status.HTTP_204_NO_CONTENT
+
+
+class AsyncOrderItemsView(AsyncAPIView):
+    async def post(self, request, pk):
+        serializer = OrderItemsView.ItemDeltaSerializer(
+            data=self.parse(request),
+            many=True,
+            allow_empty=False,
+            max_length=OrderItemsView.max_items,
+        )
+        serializer.is_valid(raise_exception=True)
+        order_service = await OrderService.aload(pk)
+        await sync_to_async(order_service.update_products)(serializer.data)
+        return None, status.HTTP_204_NO_CONTENT
+
+
+class AsyncOrderActionView(AsyncAPIView):
+    action: Optional[str] = None
+
+    async def post(self, request, pk):
+        order_service = await OrderService.aload(pk)
+        await sync_to_async(getattr(order_service, self.action))()
+        return None, status.HTTP_204_NO_CONTENT
+
+
+class AsyncOrderCancelView(AsyncAPIView):
+    async def put(self, request, pk):
+        order_service = await OrderService.aload(pk)
+        await sync_to_async(order_service.cancel)()
+        return None, status.HTTP_204_NO_CONTENT
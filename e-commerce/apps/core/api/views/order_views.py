@@ -1,3 +1,4 @@
+from apps.core.api.pagination import NewestFirstPagination
 from apps.core.serializers import (
     FullOrderSerializer,
     SimpleOrderSerializer,
@@ -16,18 +17,22 @@ from rest_framework.views import APIView
 )
 class OrdersView(APIView):
     permission_classes = [IsAuthenticated]
+    pagination_class = NewestFirstPagination
     get_serializer_class = SimpleOrderSerializer
 
     @extend_schema(
         request=None,
-        responses={status.HTTP_200_OK: get_serializer_class},
+        responses={status.HTTP_200_OK: get_serializer_class(many=True)},
         summary="Get all user orders.",
     )
     def get(self, request):
         order_service = OrderService()
-        orders = order_service.get_all_orders(request.user)
+        paginator = self.pagination_class()
+        orders = paginator.paginate_queryset(
+            order_service.get_all_orders(request.user), request, view=self
+        )
         serializer = self.get_serializer_class(orders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return paginator.get_paginated_response(serializer.data)
 
     @extend_schema(
         request=None, responses={"201": create_order_out_serializer}, summary="Create a new order."
@@ -64,7 +69,7 @@ class OrderAddProductView(APIView):
 
     class AddProductSerializer(serializers.Serializer):
         product_id = serializers.IntegerField()
-        quantity = serializers.IntegerField(default=1)
+        quantity = serializers.IntegerField(default=1, min_value=1)
 
     @extend_schema(
         request=AddProductSerializer,
@@ -84,7 +89,7 @@ class OrderRemoveProductView(APIView):
 
     class RemoveProductSerializer(serializers.Serializer):
         product_id = serializers.IntegerField()
-        quantity = serializers.IntegerField(default=1)
+        quantity = serializers.IntegerField(default=1, min_value=1)
 
     @extend_schema(
         request=RemoveProductSerializer,
@@ -98,6 +103,29 @@ class OrderRemoveProductView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+@extend_schema(tags=["orders"], summary="Add and remove many products in one request.")
+class OrderItemsView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_items = 500
+
+    class ItemDeltaSerializer(serializers.Serializer):
+        product_id = serializers.IntegerField()
+        quantity = serializers.IntegerField(help_text="Positive to add, negative to remove.")
+
+    @extend_schema(
+        request=ItemDeltaSerializer(many=True),
+        responses={status.HTTP_204_NO_CONTENT: None},
+    )
+    def post(self, request, pk):
+        serializer = self.ItemDeltaSerializer(
+            data=request.data, many=True, allow_empty=False, max_length=self.max_items
+        )
+        serializer.is_valid(raise_exception=True)
+        order_service = OrderService(pk)
+        order_service.update_products(serializer.data)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 @extend_schema(tags=["orders"], summary="Remove all products from order.")
 class OrderRemoveAllProductView(APIView):
     permission_classes = [IsAuthenticated]
@@ -1,20 +1,37 @@
+from apps.core.api.cache import CatalogCacheMixin
+from apps.core.api.pagination import CatalogPagination, RankedPagination
 from apps.core.models import Product
 from apps.core.serializers import ProductSerializer
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from apps.core.services import ProductService
 from drf_spectacular.utils import extend_schema
+from rest_framework import serializers
 from rest_framework.generics import ListAPIView
-from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.permissions import AllowAny
 
 
 @extend_schema(tags=["products"], summary="Get all products.")
-class ProductsView(ListAPIView):
-    queryset = Product.objects.all()
+class ProductsView(CatalogCacheMixin, ListAPIView):
+    queryset = Product.objects.defer("search_vector")
     permission_classes = (AllowAny,)
-    pagination_class = LimitOffsetPagination
+    pagination_class = CatalogPagination
     serializer_class = ProductSerializer
 
-    @method_decorator(cache_page(60 * 60 * 2))
+
+@extend_schema(tags=["products"], summary="Search products by name and description.")
+class ProductSearchView(ListAPIView):
+    permission_classes = (AllowAny,)
+    pagination_class = RankedPagination
+    serializer_class = ProductSerializer
+
+    class SearchQuerySerializer(serializers.Serializer):
+        q = serializers.CharField(min_length=2, max_length=255)
+
+    @extend_schema(parameters=[SearchQuerySerializer])
     def get(self, *args, **kwargs):
         return super().get(*args, **kwargs)
+
+    def get_queryset(self):
+        serializer = self.SearchQuerySerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        product_service = ProductService()
+        return product_service.search(serializer.validated_data["q"])
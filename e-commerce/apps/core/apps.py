@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = "apps.core"
+
+    def ready(self):
+        from apps.core import signals  # noqa: F401
+        from config import metrics  # noqa: F401
+        from config.tracing import configure_tracing
+
+        configure_tracing()
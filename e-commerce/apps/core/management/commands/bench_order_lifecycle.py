@@ -0,0 +1,167 @@
+import json
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from decimal import Decimal
+
+from apps.benchmark import summary
+from apps.core.models import Category, Product
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+BENCH_CATEGORY = "Benchmark"
+BENCH_STOCK = 10**9
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the whole order lifecycle in process against the configured database: "
+        "register, login, browse, create an order, add products, pay, ship and finish, "
+        "plus a second order that is emptied and cancelled. Prints latency percentiles, "
+        "throughput and queries per request for every endpoint as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50, help="Lifecycles to run.")
+        parser.add_argument("--concurrency", type=int, default=10)
+        parser.add_argument("--items", type=int, default=5, help="Products added per order.")
+        parser.add_argument(
+            "--products", type=int, default=20, help="Benchmark products to make sure exist."
+        )
+        parser.add_argument("--output", help="Also write the JSON report to this file.")
+
+    def handle(self, *args, users, concurrency, items, products, output, **options):
+        product_ids = self._seed(products)
+        self.items = items
+        self.samples = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for _ in executor.map(self._lifecycle, [product_ids] * users):
+                pass
+        wall_time = time.perf_counter() - started
+
+        report = {
+            "settings": {
+                "users": users,
+                "concurrency": concurrency,
+                "items": items,
+                "products": len(product_ids),
+            },
+            "wall_time": round(wall_time, 2),
+            "endpoints": {
+                endpoint: self._report(endpoint, wall_time)
+                for endpoint in sorted({*self.samples, *self.errors})
+            },
+        }
+        result = json.dumps(report, indent=2)
+        if output:
+            with open(output, "w") as file:
+                file.write(result + "\n")
+        self.stdout.write(result)
+
+    def _report(self, endpoint: str, wall_time: float) -> dict:
+        samples, queries = self.samples[endpoint], self.queries[endpoint]
+        return {
+            **summary(samples, wall_time),
+            "errors": self.errors[endpoint],
+            "queries_avg": round(sum(queries) / len(queries), 2) if queries else 0.0,
+            "queries_max": max(queries, default=0),
+        }
+
+    def _seed(self, products: int):
+        category, _ = Category.objects.get_or_create(name=BENCH_CATEGORY)
+        existing = Product.objects.filter(category=category).count()
+        Product.objects.bulk_create(
+            Product(
+                name=f"Benchmark product {number}",
+                price=Decimal("9.99"),
+                stock=BENCH_STOCK,
+                category=category,
+            )
+            for number in range(existing, products)
+        )
+        # Earlier runs sold some of it; make sure payments never fail on stock.
+        Product.objects.filter(category=category).update(stock=BENCH_STOCK)
+        return list(
+            Product.objects.filter(category=category).values_list("id", flat=True)[:products]
+        )
+
+    def _call(self, client: Client, method: str, endpoint: str, path: str, data=None):
+        """Sends one request, recording latency and queries against endpoint."""
+        with ExitStack() as stack:
+            # Every alias: reads may go to the primary or any replica.
+            captured = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in connections
+            ]
+            started = time.perf_counter()
+            response = getattr(client, method)(path, data, content_type="application/json")
+            elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            self.errors[endpoint] += 1
+            raise CommandError(
+                f"{method.upper()} {path}: {response.status_code} {response.content}"
+            )
+        self.samples[endpoint].append(elapsed)
+        self.queries[endpoint].append(sum(len(context) for context in captured))
+        return response.json() if response.content else None
+
+    def _lifecycle(self, product_ids):
+        try:
+            self._run_lifecycle(product_ids)
+        except CommandError as error:
+            self.stderr.write(str(error))
+        finally:
+            for connection in connections.all():
+                connection.close()
+
+    def _run_lifecycle(self, product_ids):
+        client = Client()
+        phone_number = f"+77{random.randrange(10**9):09d}"
+        credentials = {"phone_number": phone_number, "password": "bench-password"}
+
+        def call(method, endpoint, path, data=None):
+            return self._call(client, method, endpoint, path, data)
+
+        call("post", "POST users/", "/api/auth/users/", {**credentials, "username": phone_number})
+        token = call("post", "POST users/login/", "/api/auth/users/login/", credentials)["token"]
+        client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+        call("get", "GET user", "/api/auth/user")
+
+        call("get", "GET categories/", "/api/core/categories/")
+        call("get", "GET products/", "/api/core/products/")
+        call("get", "GET products/search", "/api/core/products/search?q=benchmark")
+
+        core = "/api/core/orders/"
+        chosen = random.sample(product_ids, min(self.items, len(product_ids)))
+        order_id = call("post", "POST orders/", core)["order_id"]
+        for product_id in chosen:
+            call(
+                "post", "POST orders/<pk>/add", f"{core}{order_id}/add", {"product_id": product_id}
+            )
+        call(
+            "post",
+            "POST orders/<pk>/items",
+            f"{core}{order_id}/items",
+            [{"product_id": product_id, "quantity": 1} for product_id in chosen],
+        )
+        call(
+            "post", "POST orders/<pk>/remove", f"{core}{order_id}/remove", {"product_id": chosen[0]}
+        )
+        call("get", "GET orders/<pk>", f"{core}{order_id}")
+        call("get", "GET orders/", core)
+        call("post", "POST orders/<pk>/payment", f"{core}{order_id}/payment")
+        call("post", "POST orders/<pk>/delivery", f"{core}{order_id}/delivery")
+        call("post", "POST orders/<pk>/finish", f"{core}{order_id}/finish")
+
+        order_id = call("post", "POST orders/", core)["order_id"]
+        call("post", "POST orders/<pk>/add", f"{core}{order_id}/add", {"product_id": chosen[0]})
+        call("post", "POST orders/<pk>/remove-all", f"{core}{order_id}/remove-all")
+        call("put", "PUT orders/<pk>/cancel", f"{core}{order_id}/cancel")
@@ -0,0 +1,98 @@
+import itertools
+import json
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from apps.benchmark import request, summary
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the same order and catalog read workload against several API prefixes, e.g. "
+        "the gevent deployment at /api/core and the ASGI one at /api/async/core, and "
+        "print latency percentiles per endpoint side by side."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://localhost")
+        parser.add_argument(
+            "--target",
+            action="append",
+            metavar="NAME=PREFIX",
+            help="Repeatable, defaults to gevent=/api/core and asgi=/api/async/core.",
+        )
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--duration", type=float, default=30, help="Seconds per target.")
+        parser.add_argument("--orders", type=int, default=20, help="Orders seeded per target.")
+
+    def handle(self, *args, base_url, target, concurrency, duration, orders, **options):
+        self.base_url = base_url.rstrip("/")
+        targets = dict(
+            item.split("=", 1) for item in target or ["gevent=/api/core", "asgi=/api/async/core"]
+        )
+
+        results = {}
+        for name, prefix in targets.items():
+            token, order_ids = self._seed(prefix, orders)
+            results[name] = self._run(prefix, token, order_ids, concurrency, duration)
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def _seed(self, prefix: str, orders: int):
+        phone_number = f"+77{random.randrange(10**9):09d}"
+        status, body, _ = request(
+            "POST",
+            f"{self.base_url}/api/auth/users/",
+            {"phone_number": phone_number, "username": phone_number, "password": "bench-password"},
+        )
+        if status != 201:
+            raise CommandError(f"Cannot register a benchmark user: {status} {body}")
+        token = body["token"]
+
+        _, products, _ = request("GET", f"{self.base_url}{prefix}/products/")
+        product_ids = [product["id"] for product in products.get("results", [])]
+        order_ids = []
+        for _ in range(orders):
+            _, body, _ = request("POST", f"{self.base_url}{prefix}/orders/", token=token)
+            order_ids.append(body["order_id"])
+            if product_ids:
+                request(
+                    "POST",
+                    f"{self.base_url}{prefix}/orders/{order_ids[-1]}/add",
+                    {"product_id": random.choice(product_ids), "quantity": 2},
+                    token=token,
+                )
+        return token, order_ids
+
+    def _run(self, prefix: str, token: str, order_ids, concurrency: int, duration: float):
+        endpoints = {
+            "GET orders/": lambda: f"{prefix}/orders/",
+            "GET orders/<pk>": lambda: f"{prefix}/orders/{random.choice(order_ids)}",
+            "GET products/": lambda: f"{prefix}/products/",
+        }
+        samples = defaultdict(list)
+        errors = defaultdict(int)
+        deadline = time.monotonic() + duration
+
+        def worker(offset: int):
+            names = itertools.islice(itertools.cycle(endpoints), offset, None)
+            for name in names:
+                if time.monotonic() >= deadline:
+                    return
+                status, _, elapsed = request(
+                    "GET", f"{self.base_url}{endpoints[name]()}", token=token
+                )
+                if status == 200:
+                    samples[name].append(elapsed)
+                else:
+                    errors[name] += 1
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for offset in range(concurrency):
+                executor.submit(worker, offset)
+
+        return {
+            name: {**summary(samples[name], duration), "errors": errors[name]} for name in endpoints
+        }
@@ -0,0 +1,36 @@
+import time
+
+from apps.core.services import OutboxRelay
+from django.core.management.base import BaseCommand
+from prometheus_client import start_http_server
+
+
+class Command(BaseCommand):
+    help = "Publish outbox messages to RabbitMQ, polling the outbox table for new ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=0.5,
+            help="Seconds to wait before checking an empty outbox again.",
+        )
+        parser.add_argument("--once", action="store_true", help="Drain the outbox and exit.")
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            help="Serve publish latency and outbox delay metrics for Prometheus on this port.",
+        )
+
+    def handle(self, *args, batch_size, poll_interval, once, metrics_port, **options):
+        if metrics_port:
+            start_http_server(metrics_port)
+        relay = OutboxRelay(batch_size)
+        while True:
+            published = relay.drain()
+            if published:
+                self.stdout.write(f"Published {published} outbox messages.")
+            if once:
+                return
+            time.sleep(poll_interval)
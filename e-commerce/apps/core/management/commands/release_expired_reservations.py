@@ -0,0 +1,43 @@
+import time
+
+from apps.core.models import Order
+from apps.core.services import OrderService
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from exceptions import ServiceException
+
+
+class Command(BaseCommand):
+    help = "Cancel PAID orders whose stock reservation expired and return their stock."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep running and sweep every N seconds instead of exiting.",
+        )
+
+    def handle(self, *args, batch_size, interval, **options):
+        while True:
+            released = self.sweep(batch_size)
+            self.stdout.write(f"Released {released} expired reservations.")
+            if not interval:
+                return
+            time.sleep(interval)
+
+    def sweep(self, batch_size: int) -> int:
+        expired = Order.objects.filter(
+            status=Order.Status.PAID, reserved_until__lt=timezone.now()
+        ).values_list("id", flat=True)[:batch_size]
+
+        released = 0
+        for order_id in expired:
+            try:
+                OrderService(order_id).expire_reservation()
+            except ServiceException:
+                # Shipped or cancelled since the sweep started.
+                continue
+            released += 1
+        return released
@@ -0,0 +1,38 @@
+import asyncio
+import inspect
+from urllib.parse import urlsplit
+
+from apps.core.api.cache import bump_catalog_version, popular_pages
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.urls import resolve
+
+
+class Command(BaseCommand):
+    help = "Fill the catalog cache with the most requested product and category pages."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, default=settings.CATALOG_CACHE_WARM_PAGES)
+        parser.add_argument(
+            "--invalidate",
+            action="store_true",
+            help="Start a new catalog version first, e.g. when serializers changed.",
+        )
+
+    def handle(self, *args, pages, invalidate, **options):
+        if invalidate:
+            bump_catalog_version()
+
+        factory = RequestFactory()
+        warmed = 0
+        for page in popular_pages(pages):
+            match = resolve(urlsplit(page).path)
+            request = factory.get(page)
+            response = match.func(request, *match.args, **match.kwargs)
+            if inspect.isawaitable(response):
+                response = asyncio.run(response)
+            if response.status_code == 200:
+                warmed += 1
+
+        self.stdout.write(f"Warmed {warmed} catalog pages.")
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:16
+
+from django.db import migrations, models
+
+MERGE_DUPLICATE_ITEMS = """
+WITH duplicates AS (
+    SELECT MIN(id) AS keep_id, order_id, product_id, SUM(quantity) AS quantity
+    FROM core_orderitem
+    GROUP BY order_id, product_id
+    HAVING COUNT(*) > 1
+), merged AS (
+    UPDATE core_orderitem
+    SET quantity = duplicates.quantity
+    FROM duplicates
+    WHERE core_orderitem.id = duplicates.keep_id
+)
+DELETE FROM core_orderitem
+USING duplicates
+WHERE core_orderitem.order_id = duplicates.order_id
+    AND core_orderitem.product_id = duplicates.product_id
+    AND core_orderitem.id <> duplicates.keep_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(MERGE_DUPLICATE_ITEMS, migrations.RunSQL.noop),
+        migrations.RemoveIndex(
+            model_name='orderitem',
+            name='order_product_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='orderitem',
+            constraint=models.UniqueConstraint(fields=('order', 'product'), name='order_product_unique'),
+        ),
+    ]
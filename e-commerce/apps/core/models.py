@@ -1,4 +1,6 @@
 from apps.authentication.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
 
 
@@ -20,6 +22,14 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField()
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector("name", weight="A", config="english")
+            + SearchVector("description", weight="B", config="english")
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
 
     def __str__(self):
         return self.name
@@ -28,6 +38,8 @@ class Product(models.Model):
         indexes = [
             models.Index(fields=["name", "category"], name="product_category_name_idx"),
             models.Index(fields=["price"], name="price_idx"),
+            GinIndex(fields=["search_vector"], name="product_search_idx"),
+            GinIndex(fields=["name"], opclasses=["gin_trgm_ops"], name="product_name_trgm_idx"),
         ]
 
 
@@ -46,6 +58,7 @@ class Order(models.Model):
     status = models.CharField(
         choices=Status.choices, default=Status.CREATED, max_length=10, editable=False
     )
+    reserved_until = models.DateTimeField(null=True, blank=True, editable=False)
 
     @property
     def can_add_products(self):
@@ -53,15 +66,24 @@ class Order(models.Model):
 
     @property
     def products_count(self):
+        # Counting prefetched items keeps a list of orders from issuing a query per order.
+        if "items" in getattr(self, "_prefetched_objects_cache", {}):
+            return len(self.items.all())
         return self.items.count()
 
     def __str__(self):
-        return f"Order {self.pk}, {self.user.username}, {self.status}"
+        user = self.user.username if Order.user.is_cached(self) else f"user {self.user_id}"
+        return f"Order {self.pk}, {user}, {self.status}"
 
     class Meta:
         indexes = [
-            models.Index(fields=["user"], name="user_idx"),
+            models.Index(fields=["user", "-id"], name="user_newest_idx"),
             models.Index(fields=["status"], name="status_idx"),
+            models.Index(
+                fields=["reserved_until"],
+                name="reservation_expiry_idx",
+                condition=models.Q(status="PAID"),
+            ),
         ]
 
 
@@ -71,7 +93,26 @@ class OrderItem(models.Model):
     quantity = models.PositiveIntegerField()
 
     def __str__(self):
-        return f"{self.quantity} x {self.product.name}"
+        # Only use the product when it was loaded with the item, never fetch it here.
+        product = (
+            self.product.name if OrderItem.product.is_cached(self) else f"product {self.product_id}"
+        )
+        return f"{self.quantity} x {product}"
 
     class Meta:
-        indexes = [models.Index(fields=["order", "product"], name="order_product_idx")]
+        constraints = [
+            models.UniqueConstraint(fields=["order", "product"], name="order_product_unique")
+        ]
+
+
+class OutboxMessage(models.Model):
+    """A Celery task written with the business change and published once it commits."""
+
+    task_name = models.CharField(max_length=255)
+    queue = models.CharField(max_length=255)
+    kwargs = models.JSONField(default=dict)
+    headers = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.task_name} -> {self.queue}"
@@ -32,7 +32,7 @@ class SimpleOrderSerializer(serializers.ModelSerializer):
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = "__all__"
+        exclude = ("search_vector",)
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -1,3 +1,5 @@
 from apps.core.services.order_service import OrderService
+from apps.core.services.outbox_service import OutboxRelay
+from apps.core.services.product_service import ProductService
 
-__all__ = ["OrderService"]
+__all__ = ["OrderService", "OutboxRelay", "ProductService"]
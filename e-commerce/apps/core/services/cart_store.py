@@ -0,0 +1,110 @@
+from typing import Dict, Optional
+
+from apps.utils import get_redis
+from django.conf import settings
+
+# Applies signed quantity deltas to the cart hash in one round trip, unless the cart
+# was taken for payment (KEYS[2]). ARGV holds (product_id, delta, stored quantity)
+# triples: a field never drops below minus the quantity already stored in Postgres,
+# and fields back at zero are removed so the hash only holds live changes.
+APPLY_DELTAS_SCRIPT = """
+if redis.call("EXISTS", KEYS[2]) == 1 then
+    return 0
+end
+for i = 1, #ARGV - 1, 3 do
+    local quantity = redis.call("HINCRBY", KEYS[1], ARGV[i], ARGV[i + 1])
+    local floor = -tonumber(ARGV[i + 2])
+    if quantity < floor then
+        quantity = floor
+        redis.call("HSET", KEYS[1], ARGV[i], quantity)
+    end
+    if quantity == 0 then
+        redis.call("HDEL", KEYS[1], ARGV[i])
+    end
+end
+redis.call("EXPIRE", KEYS[1], ARGV[#ARGV])
+return 1
+"""
+# Reads and deletes the cart, and marks it taken so later deltas are refused rather
+# than left behind for an order that is no longer CREATED.
+TAKE_SCRIPT = """
+local cart = redis.call("HGETALL", KEYS[1])
+redis.call("DEL", KEYS[1])
+redis.call("SET", KEYS[2], 1, "EX", ARGV[1])
+return cart
+"""
+
+
+class RedisCartStore:
+    """
+    Keeps items of CREATED orders in a Redis hash per order (product_id -> quantity).
+
+    Nothing is written to Postgres until the order is paid, when OrderService flushes
+    the cart into OrderItem rows. Quantities are changes to the items already stored
+    in Postgres, merged on read: removing a stored item records a negative quantity,
+    at most the stored one. Payment takes the cart, after which changes are refused
+    until it is given back.
+    """
+
+    key_prefix = "cart"
+
+    def __init__(self, ttl: int = settings.ORDER_CART_TTL):
+        self.ttl = ttl
+        self._apply_deltas = None
+        self._take = None
+
+    @property
+    def client(self):
+        return get_redis()
+
+    def key(self, order_id: int) -> str:
+        return f"{self.key_prefix}:{order_id}"
+
+    def taken_key(self, order_id: int) -> str:
+        return f"{self.key_prefix}:{order_id}:taken"
+
+    def apply(
+        self, order_id: int, deltas: Dict[int, int], stored: Optional[Dict[int, int]] = None
+    ) -> bool:
+        """
+        Applies deltas; stored holds the quantities of items already in Postgres.
+        Returns False, changing nothing, if the cart was taken.
+        """
+        if self._apply_deltas is None:
+            self._apply_deltas = self.client.register_script(APPLY_DELTAS_SCRIPT)
+        stored = stored or {}
+        args = [
+            value
+            for product_id, delta in deltas.items()
+            for value in (product_id, delta, stored.get(product_id, 0))
+        ]
+        keys = [self.key(order_id), self.taken_key(order_id)]
+        return bool(self._apply_deltas(keys=keys, args=[*args, self.ttl]))
+
+    def items(self, order_id: int) -> Dict[int, int]:
+        cart = self.client.hgetall(self.key(order_id))
+        return {int(product_id): int(quantity) for product_id, quantity in cart.items()}
+
+    def take(self, order_id: int) -> Dict[int, int]:
+        """Removes the cart and refuses further changes in one step; returns what it held."""
+        if self._take is None:
+            self._take = self.client.register_script(TAKE_SCRIPT)
+        cart = self._take(keys=[self.key(order_id), self.taken_key(order_id)], args=[self.ttl])
+        return {int(product_id): int(quantity) for product_id, quantity in zip(*[iter(cart)] * 2)}
+
+    def give_back(
+        self, order_id: int, cart: Dict[int, int], stored: Optional[Dict[int, int]] = None
+    ) -> None:
+        """Undoes take() after a failed payment."""
+        self.client.delete(self.taken_key(order_id))
+        if cart:
+            self.apply(order_id, cart, stored)
+
+    def clear(self, order_id: int) -> None:
+        self.client.delete(self.key(order_id), self.taken_key(order_id))
+
+
+def get_cart_store() -> Optional[RedisCartStore]:
+    if settings.ORDER_CART_STORE == "redis":
+        return RedisCartStore()
+    return None
@@ -1,27 +1,177 @@
-from typing import Callable, List, Optional, Union
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
-from apps.core.models import Order, OrderItem
+from apps.core.models import Order, OrderItem, Product
+from apps.core.services.cart_store import RedisCartStore, get_cart_store
 from apps.core.tasks import send_sms_to_user
-from constants import CANNOT_ADD_PRODUCT, CANNOT_REMOVE_PRODUCT, EMPTY_ORDER, WRONG_SEQUENCE
+from asgiref.sync import sync_to_async
+from config.tracing import traced
+from constants import (
+    CANNOT_ADD_PRODUCT,
+    CANNOT_CHANGE_PRODUCTS,
+    CANNOT_REMOVE_PRODUCT,
+    EMPTY_ORDER,
+    OUT_OF_STOCK,
+    WRONG_SEQUENCE,
+)
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db.models import Prefetch
+from django.db import connections, router, transaction
+from django.db.models import F, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from exceptions import ServiceException
 
+# Every transaction that changes an order's items locks the order row first, so
+# mutations of one order serialize there: two batches adding and removing each
+# other's products would otherwise lock item rows in crossed order and deadlock.
+# Single adds and remove-all take it with their total update and single removes
+# inside the subtraction, so each stays at two statements; batches lock it up front.
+LOCK_ORDER_SQL = "SELECT id FROM {order_table} WHERE id = %s FOR NO KEY UPDATE".format(
+    order_table=Order._meta.db_table
+)
+
+# Both statements lean on the (order, product) unique constraint: the upsert
+# resolves conflicts on it and the subtraction locks the matching rows, so
+# concurrent mutations of the same item never lose updates.
+UPSERT_ITEMS_SQL = """
+INSERT INTO {item_table} (order_id, product_id, quantity)
+SELECT %s, {product_table}.id, delta.quantity
+FROM (VALUES {{values}}) AS delta (product_id, quantity)
+JOIN {product_table} ON {product_table}.id = delta.product_id
+ORDER BY {product_table}.id
+ON CONFLICT (order_id, product_id)
+DO UPDATE SET quantity = {item_table}.quantity + EXCLUDED.quantity
+""".format(
+    item_table=OrderItem._meta.db_table, product_table=Product._meta.db_table
+)
+
+SUBTRACT_ITEMS_SQL = """
+WITH delta (product_id, quantity) AS (
+    VALUES {{values}}
+), item AS (
+    SELECT
+        current.id,
+        current.product_id,
+        LEAST(current.quantity, delta.quantity) AS removed,
+        current.quantity <= delta.quantity AS emptied
+    FROM {item_table} AS current
+    JOIN delta ON delta.product_id = current.product_id
+    WHERE current.order_id = (
+        SELECT id FROM {order_table} WHERE id = %s FOR NO KEY UPDATE
+    )
+    ORDER BY current.id
+    FOR UPDATE OF current
+), deleted AS (
+    DELETE FROM {item_table} WHERE id IN (SELECT id FROM item WHERE emptied)
+), updated AS (
+    UPDATE {item_table} SET quantity = {item_table}.quantity - item.removed
+    FROM item
+    WHERE {item_table}.id = item.id AND NOT item.emptied
+)
+SELECT product_id, removed FROM item
+""".format(
+    item_table=OrderItem._meta.db_table, order_table=Order._meta.db_table
+)
+
+
+# Stock moves in one statement per order. Product rows are locked in id order up
+# front (the scalar subquery runs before the update) so concurrent checkouts of
+# overlapping baskets queue instead of deadlocking, and the reservation is
+# all-or-nothing: if any product is short, nothing is decremented and the short
+# product ids are returned.
+#
+# Checkouts of a hot product still queue on its row, but each holds the lock only
+# for this statement and its COMMIT: reservations and releases run last in their
+# transactions. Sharding stock into buckets would shorten the queue further, at the
+# cost of Product.stock no longer being the one number the catalog lists and the
+# product API edits.
+RESERVE_STOCK_SQL = """
+WITH wanted AS (
+    SELECT product_id, quantity FROM {item_table} WHERE order_id = %s
+), locked AS (
+    SELECT product.id, product.stock >= wanted.quantity AS available
+    FROM {product_table} AS product
+    JOIN wanted ON wanted.product_id = product.id
+    ORDER BY product.id
+    FOR NO KEY UPDATE OF product
+), reserved AS (
+    UPDATE {product_table} SET stock = {product_table}.stock - wanted.quantity
+    FROM wanted
+    WHERE {product_table}.id = wanted.product_id
+        AND (SELECT bool_and(available) FROM locked)
+)
+SELECT id FROM locked WHERE NOT available
+""".format(
+    item_table=OrderItem._meta.db_table, product_table=Product._meta.db_table
+)
+
+RELEASE_STOCK_SQL = """
+WITH reserved AS (
+    SELECT product_id, quantity FROM {item_table} WHERE order_id = %s
+), locked AS (
+    SELECT product.id
+    FROM {product_table} AS product
+    JOIN reserved ON reserved.product_id = product.id
+    ORDER BY product.id
+    FOR NO KEY UPDATE OF product
+)
+UPDATE {product_table} SET stock = {product_table}.stock + reserved.quantity
+FROM reserved
+WHERE {product_table}.id = reserved.product_id
+    AND (SELECT count(*) FROM locked) > 0
+""".format(
+    item_table=OrderItem._meta.db_table, product_table=Product._meta.db_table
+)
+
+
+def _price_sum(prices: Dict[int, Decimal], quantities: Dict[int, int]) -> Decimal:
+    return sum(
+        (prices[product_id] * quantity for product_id, quantity in quantities.items()), Decimal(0)
+    )
+
+
+def _values_sql(template: str, deltas: Dict[int, int]) -> Tuple[str, list]:
+    values = ", ".join(["(%s, %s)"] * len(deltas))
+    params = [value for pair in sorted(deltas.items()) for value in pair]
+    return template.format(values=values), params
+
 
 class OrderService:
     order_objects: Order.objects = Order.objects
     order_item_objects: OrderItem.objects = OrderItem.objects
+    product_objects: Product.objects = Product.objects
+    cart_store: Optional[RedisCartStore] = get_cart_store()
     order: Optional[Order] = None
 
     def __init__(self, order_id: Optional[int] = None):
         if order_id:
-            self.order = get_object_or_404(
-                self.order_objects.select_related("user").prefetch_related(
-                    Prefetch("items", queryset=self.order_item_objects.select_related("product"))
+            self.order = get_object_or_404(self._order_queryset(), id=order_id)
+
+    @classmethod
+    async def aload(cls, order_id: int) -> "OrderService":
+        """OrderService(order_id) for async views, loaded through the async ORM."""
+        service = cls()
+        try:
+            service.order = await cls._order_queryset().aget(id=order_id)
+        except Order.DoesNotExist:
+            raise Http404("No Order matches the given query.")
+        return service
+
+    @classmethod
+    def _order_queryset(cls):
+        return cls.order_objects.select_related("user").prefetch_related(
+            Prefetch(
+                "items",
+                queryset=cls.order_item_objects.select_related("product").defer(
+                    "product__search_vector"
                 ),
-                id=order_id,
             )
+        )
 
     # --------- CREATED
     def create_order(self, user: User) -> Order:
@@ -30,56 +180,224 @@ class OrderService:
         return order
 
     def get_order(self) -> Order:
+        if self._uses_cart_store():
+            self._attach_cart()
+        return self.order
+
+    async def aget_order(self) -> Order:
+        if self._uses_cart_store():
+            await sync_to_async(self._attach_cart)()
         return self.order
 
     def get_all_orders(self, user: User):
         return self.order_objects.filter(user=user)
 
+    @traced("OrderService.add_products")
     def add_products(self, product_id: int, quantity: int = 1) -> None:
         if self.order.status != Order.Status.CREATED:
             raise ServiceException(CANNOT_ADD_PRODUCT)
 
-        if (
-            item := self.order_item_objects.filter(order_id=self.order.id, product_id=product_id)
-            .select_related("product")
-            .first()
-        ):
-            item.quantity += quantity
-            item.save()
-        else:
-            item = self.order_item_objects.create(
-                order_id=self.order.id, product_id=product_id, quantity=quantity
-            )
+        if self._uses_cart_store():
+            if not self.product_objects.filter(id=product_id).exists():
+                raise Http404("No Product matches the given query.")
+            if not self.cart_store.apply(
+                self.order.id, {product_id: quantity}, self._stored_items()
+            ):
+                raise ServiceException(CANNOT_ADD_PRODUCT)
+            return
 
-        added_price = item.product.price * quantity
-        self.order.total_price += added_price
-        self.order.save()
+        using = router.db_for_write(OrderItem)
+        with transaction.atomic(using=using):
+            # The total update comes first: it locks the order row.
+            self._shift_total(self._price_of(product_id) * quantity, CANNOT_ADD_PRODUCT)
+            with connections[using].cursor() as cursor:
+                if not self._upsert_items(cursor, {product_id: quantity}):
+                    raise Http404("No Product matches the given query.")
 
+    @traced("OrderService.remove_products")
     def remove_products(self, product_id: int, quantity: int = 1) -> None:
         if self.order.status != Order.Status.CREATED:
             raise ServiceException(CANNOT_REMOVE_PRODUCT)
 
-        if (
-            items := self.order_item_objects.filter(order_id=self.order.id, product_id=product_id)
-            .select_related("product")
-            .first()
-        ):
-            if items.quantity <= quantity:
-                quantity = items.quantity
-                items.delete()
-            else:
-                items.quantity -= quantity
-                items.save()
-
-            removed_price = items.product.price * quantity
-            self.order.total_price += removed_price
-            self.order.save()
+        if self._uses_cart_store():
+            if not self.cart_store.apply(
+                self.order.id, {product_id: -quantity}, self._stored_items()
+            ):
+                raise ServiceException(CANNOT_REMOVE_PRODUCT)
+            return
+
+        using = router.db_for_write(OrderItem)
+        with transaction.atomic(using=using):
+            with connections[using].cursor() as cursor:
+                removed = self._subtract_items(cursor, {product_id: quantity})
+
+            if removed:
+                amount = -self._price_of(product_id) * removed[product_id]
+                self._shift_total(amount, CANNOT_REMOVE_PRODUCT)
+
+    @traced("OrderService.update_products")
+    def update_products(self, items: List[Dict[str, int]]) -> None:
+        """
+        Applies a batch of {product_id, quantity} deltas: positive quantities are added,
+        negative ones removed, with a single price lookup and total_price update.
+        """
+        if self.order.status != Order.Status.CREATED:
+            raise ServiceException(CANNOT_CHANGE_PRODUCTS)
+
+        deltas = defaultdict(int)
+        for item in items:
+            deltas[item["product_id"]] += item["quantity"]
+
+        prices = dict(self.product_objects.filter(id__in=deltas).values_list("id", "price"))
+        if deltas.keys() - prices.keys():
+            raise Http404("No Product matches the given query.")
+
+        if self._uses_cart_store():
+            if not self.cart_store.apply(self.order.id, deltas, self._stored_items()):
+                raise ServiceException(CANNOT_CHANGE_PRODUCTS)
+            return
+
+        added = {product_id: quantity for product_id, quantity in deltas.items() if quantity > 0}
+        subtracted = {
+            product_id: -quantity for product_id, quantity in deltas.items() if quantity < 0
+        }
+        if not added and not subtracted:
+            return
+
+        using = router.db_for_write(OrderItem)
+        with transaction.atomic(using=using):
+            with connections[using].cursor() as cursor:
+                self._lock_order(cursor)
+                if added:
+                    self._upsert_items(cursor, added)
+                removed = self._subtract_items(cursor, subtracted) if subtracted else {}
+
+            amount = _price_sum(prices, added) - _price_sum(prices, removed)
+            self._shift_total(amount, CANNOT_CHANGE_PRODUCTS)
 
+    @traced("OrderService.remove_all_products")
     def remove_all_products(self) -> None:
-        items = self.order_item_objects.filter(order_id=self.order.id)
-        items.delete()
-        self.order.total_price = 0
-        self.order.save()
+        using = router.db_for_write(OrderItem)
+        with transaction.atomic(using=using):
+            # Items of a PAID order are what releasing its reservation gives back. The
+            # update locks the order row before the items are deleted.
+            updated = self.order_objects.filter(
+                id=self.order.id, status=Order.Status.CREATED
+            ).update(total_price=0, updated_at=timezone.now())
+            if not updated:
+                raise ServiceException(CANNOT_CHANGE_PRODUCTS)
+            self.order_item_objects.filter(order_id=self.order.id).delete()
+            self._drop_cart_on_commit(using)
+
+    def _uses_cart_store(self) -> bool:
+        return self.cart_store is not None and self.order.status == Order.Status.CREATED
+
+    def _stored_items(self) -> Dict[int, int]:
+        """Quantities stored in Postgres, from the prefetched items."""
+        return {item.product_id: item.quantity for item in self.order.items.all()}
+
+    def _attach_cart(self) -> None:
+        """Merges cart changes into the prefetched order items, as if they were stored rows."""
+        cart = self.cart_store.items(self.order.id)
+        if not cart:
+            return
+
+        products = self.product_objects.defer("search_vector").in_bulk(cart)
+        items = {item.product_id: item for item in self.order.items.all()}
+        for product_id, quantity in cart.items():
+            if (product := products.get(product_id)) is None:
+                continue
+            stored = items.get(product_id)
+            items[product_id] = OrderItem(
+                id=stored.id if stored else None,
+                order=self.order,
+                product=product,
+                quantity=(stored.quantity if stored else 0) + quantity,
+            )
+            self.order.total_price += product.price * quantity
+        self.order._prefetched_objects_cache["items"] = [
+            item for item in items.values() if item.quantity > 0
+        ]
+
+    def _flush_cart(self, cart: Dict[int, int]) -> None:
+        """
+        Writes a taken cart into OrderItem rows, one bulk upsert for additions and one
+        subtraction for removed stored items; runs inside a transaction.
+        """
+        if not cart:
+            return
+
+        prices = dict(self.product_objects.filter(id__in=cart).values_list("id", "price"))
+        added = {
+            product_id: quantity
+            for product_id, quantity in cart.items()
+            if quantity > 0 and product_id in prices
+        }
+        subtracted = {
+            product_id: -quantity
+            for product_id, quantity in cart.items()
+            if quantity < 0 and product_id in prices
+        }
+        using = router.db_for_write(OrderItem)
+        if added or subtracted:
+            with connections[using].cursor() as cursor:
+                self._lock_order(cursor)
+                if added:
+                    self._upsert_items(cursor, added)
+                removed = self._subtract_items(cursor, subtracted) if subtracted else {}
+            amount = _price_sum(prices, added) - _price_sum(prices, removed)
+            self._shift_total(amount, CANNOT_CHANGE_PRODUCTS)
+            self.order.total_price += amount
+
+    def _drop_cart_on_commit(self, using: str) -> None:
+        if self.cart_store is not None:
+            order_id = self.order.id
+            transaction.on_commit(lambda: self.cart_store.clear(order_id), using=using)
+
+    def _lock_order(self, cursor) -> None:
+        cursor.execute(LOCK_ORDER_SQL, [self.order.id])
+
+    def _upsert_items(self, cursor, deltas: Dict[int, int]) -> int:
+        sql, params = _values_sql(UPSERT_ITEMS_SQL, deltas)
+        cursor.execute(sql, [self.order.id, *params])
+        return cursor.rowcount
+
+    def _subtract_items(self, cursor, deltas: Dict[int, int]) -> Dict[int, int]:
+        sql, params = _values_sql(SUBTRACT_ITEMS_SQL, deltas)
+        cursor.execute(sql, [*params, self.order.id])
+        return dict(cursor.fetchall())
+
+    def _price_of(self, product_id: int) -> Coalesce:
+        # 0 for a missing product, so the caller's 404 rolls the total back rather
+        # than the NULL failing the total_price constraint.
+        return Coalesce(
+            Subquery(self.product_objects.filter(id=product_id).values("price")[:1]),
+            Decimal(0),
+        )
+
+    def _reserve_stock(self) -> None:
+        """Takes the order's quantities off Product.stock; runs inside a transaction."""
+        # Raw SQL sends no signals, and the catalog version is left alone on purpose:
+        # bumping it on every checkout would empty the catalog cache under checkout
+        # load. Listed stock lags by up to CATALOG_CACHE_REFRESH_AFTER; this statement
+        # checks the live value.
+        with connections[router.db_for_write(Product)].cursor() as cursor:
+            cursor.execute(RESERVE_STOCK_SQL, [self.order.id])
+            short = sorted(product_id for product_id, in cursor.fetchall())
+        if short:
+            raise ServiceException(OUT_OF_STOCK.format(product_ids=", ".join(map(str, short))))
+
+    def _release_stock(self) -> None:
+        with connections[router.db_for_write(Product)].cursor() as cursor:
+            cursor.execute(RELEASE_STOCK_SQL, [self.order.id])
+
+    def _shift_total(self, amount, error_message: str) -> None:
+        """Moves total_price by amount in place, only while the order is still CREATED."""
+        updated = self.order_objects.filter(id=self.order.id, status=Order.Status.CREATED).update(
+            total_price=F("total_price") + amount, updated_at=timezone.now()
+        )
+        if not updated:
+            raise ServiceException(error_message)
 
     def _change_status(
         self,
@@ -87,6 +405,7 @@ class OrderService:
         new_status: Order.Status,
         exec_after_validation: Callable = lambda _: None,
         exec_after_saving: Callable = lambda _: None,
+        **fields,
     ) -> None:
         if isinstance(old_status, list):
             if self.order.status not in old_status:
@@ -94,14 +413,22 @@ class OrderService:
         elif isinstance(old_status, Order.Status):
             if self.order.status != old_status:
                 raise ServiceException(WRONG_SEQUENCE)
+            old_status = [old_status]
         else:
             raise ValueError("Old status must be Order.Status or List[Order.Status]")
         exec_after_validation(self.order)
+        updated = self.order_objects.filter(id=self.order.id, status__in=old_status).update(
+            status=new_status, updated_at=timezone.now(), **fields
+        )
+        if not updated:
+            raise ServiceException(WRONG_SEQUENCE)
         self.order.status = new_status
-        self.order.save()
+        for field, value in fields.items():
+            setattr(self.order, field, value)
         exec_after_saving(self.order)
 
     # ------------- PAYED
+    @traced("OrderService.payment_release")
     def payment_release(self) -> None:
         def paying_validation(order: Order):
             if order.total_price == 0:
@@ -110,38 +437,78 @@ class OrderService:
         message = "Your order {order_id} is packed, please pay to get it.".format(
             order_id=self.order.id
         )
-        self._change_status(
-            Order.Status.CREATED,
-            Order.Status.PAID,
-            exec_after_validation=paying_validation,
+        reserved_until = timezone.now() + timedelta(seconds=settings.ORDER_RESERVATION_TTL)
+        # Taking the cart refuses later changes, so none can land between this read
+        # and the commit and be dropped with the cart. A failed payment gives it back.
+        cart = self.cart_store.take(self.order.id) if self._uses_cart_store() else None
+        try:
+            with transaction.atomic(using=router.db_for_write(Order)):
+                if cart is not None:
+                    self._flush_cart(cart)
+                self._change_status(
+                    Order.Status.CREATED,
+                    Order.Status.PAID,
+                    exec_after_validation=paying_validation,
+                    reserved_until=reserved_until,
+                )
+                send_sms_to_user(message=message, user=self.order.user)
+                # Last statement before COMMIT, so hot product rows stay locked briefly.
+                # Releases run last for the same reason.
+                self._reserve_stock()
+        except Exception:
+            if cart is not None:
+                self.cart_store.give_back(self.order.id, cart, self._stored_items())
+            raise
+
+    @traced("OrderService.expire_reservation")
+    def expire_reservation(self) -> None:
+        """Cancels a PAID order whose reservation ran out and returns its stock."""
+        message = "Your order {order_id} is canceled, it was not paid in time.".format(
+            order_id=self.order.id
         )
-        send_sms_to_user(message=message, user=self.order.user)
+        with transaction.atomic(using=router.db_for_write(Order)):
+            self._change_status(Order.Status.PAID, Order.Status.CANCELLED, reserved_until=None)
+            send_sms_to_user(message=message, user=self.order.user)
+            self._release_stock()
 
     # ------------- SHIPPED
+    @traced("OrderService.delivery_release")
     def delivery_release(self):
         message = "Your order {order_id} is payed, wait for delivering.".format(
             order_id=self.order.id
         )
-        self._change_status(
-            Order.Status.PAID,
-            Order.Status.SHIPPED,
-        )
-        send_sms_to_user(message=message, user=self.order.user)
+        with transaction.atomic(using=router.db_for_write(Order)):
+            self._change_status(
+                Order.Status.PAID,
+                Order.Status.SHIPPED,
+                reserved_until=None,
+            )
+            send_sms_to_user(message=message, user=self.order.user)
 
     # ------------- FINISHED
+    @traced("OrderService.finishing")
     def finishing(self):
         message = "Thank you for purchasing order {order_id}!".format(order_id=self.order.id)
-        self._change_status(
-            Order.Status.SHIPPED,
-            Order.Status.FINISHED,
-        )
-        send_sms_to_user(message=message, user=self.order.user)
+        with transaction.atomic(using=router.db_for_write(Order)):
+            self._change_status(
+                Order.Status.SHIPPED,
+                Order.Status.FINISHED,
+            )
+            send_sms_to_user(message=message, user=self.order.user)
 
     # ------------- CANCELLED
+    @traced("OrderService.cancel")
     def cancel(self):
         message = "Your order {order_id} is canceled!".format(order_id=self.order.id)
-        self._change_status(
-            [Order.Status.CREATED, Order.Status.PAID, Order.Status.SHIPPED],
-            Order.Status.CANCELLED,
-        )
-        send_sms_to_user(message=message, user=self.order.user)
+        if self.order.status not in [Order.Status.CREATED, Order.Status.PAID, Order.Status.SHIPPED]:
+            raise ServiceException(WRONG_SEQUENCE)
+
+        # Transition from the exact status we loaded, so we know whether stock is reserved.
+        old_status = Order.Status(self.order.status)
+        using = router.db_for_write(Order)
+        with transaction.atomic(using=using):
+            self._change_status(old_status, Order.Status.CANCELLED, reserved_until=None)
+            self._drop_cart_on_commit(using)
+            send_sms_to_user(message=message, user=self.order.user)
+            if old_status != Order.Status.CREATED:
+                self._release_stock()
@@ -0,0 +1,25 @@
+from apps.core.models import Product
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db.models import F, FloatField, Q, QuerySet
+from django.db.models.functions import Cast
+
+
+class ProductService:
+    product_objects: Product.objects = Product.objects
+
+    def search(self, text: str) -> QuerySet:
+        """
+        Products matching text by full-text search over name and description, or by
+        trigram similarity of the name to tolerate typos, annotated with a rank.
+
+        Both conditions are served by GIN indexes (search_vector, name trigrams). The
+        rank is cast to double precision so cursor positions round-trip exactly. The
+        vector itself is only filtered and ranked on, so it is not loaded.
+        """
+        query = SearchQuery(text, config="english", search_type="websearch")
+        rank = SearchRank(F("search_vector"), query) + TrigramSimilarity("name", text)
+        return (
+            self.product_objects.defer("search_vector")
+            .annotate(rank=Cast(rank, FloatField()))
+            .filter(Q(search_vector=query) | Q(name__trigram_similar=text))
+        )
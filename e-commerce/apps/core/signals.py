@@ -0,0 +1,14 @@
+from apps.core.api.cache import bump_catalog_version
+from apps.core.models import Category, Product
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, using, **kwargs):
+    # Bumping before commit would let a concurrent request cache the old rows again.
+    transaction.on_commit(bump_catalog_version, using=using)
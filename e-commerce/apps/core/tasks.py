@@ -1,15 +1,73 @@
+import uuid
+from typing import Iterable, Optional
+
 from apps.authentication.models import User
-from config.celery import app as celery_app
-
-
-def send_sms_to_user(user: User, message: str):
-    celery_app.signature(
-        "send_notification_task",
-        kwargs={
-            "data": {
-                "phone_numbers": [user.phone_number],
-                "message": message,
-            }
-        },
-        queue="notification-center",
-    ).delay()
+from apps.core.models import OutboxMessage
+from config.log import get_request_id
+from config.tracing import inject_context
+from django.conf import settings
+from django.db import router
+
+TRANSACTIONAL = "transactional"
+BULK = "bulk"
+
+
+def enqueue_task(task_name: str, kwargs: dict, queue: str, headers: Optional[dict] = None):
+    """
+    Writes the task to the outbox instead of the broker. Called inside the transaction
+    of the change it reports: the task is published only if that change commits, and
+    the request never waits on RabbitMQ. The relay polls for it: a NOTIFY would make
+    Postgres commit every checkout one at a time, under a global lock.
+
+    The ID and trace context of the current request go along in the headers, so
+    the worker's logs and spans can be matched to the request that caused them.
+    """
+    headers = dict(headers or {})
+    current = get_request_id()
+    if current and "request_id" not in headers:
+        headers["request_id"] = current
+    inject_context(headers)
+    OutboxMessage.objects.using(router.db_for_write(OutboxMessage)).create(
+        task_name=task_name, queue=queue, kwargs=kwargs, headers=headers
+    )
+
+
+def send_sms_to_user(user: User, message: str, message_class: str = TRANSACTIONAL):
+    """
+    Order updates go out as TRANSACTIONAL, merged with other updates to the same
+    number; campaigns as BULK, on their own queue and worker pool. To reach many
+    users at once, use send_bulk_sms().
+    """
+    if message_class == BULK:
+        send_bulk_sms([user], message)
+        return
+    kwargs = {
+        "data": {
+            "phone_numbers": [user.phone_number],
+            "message": message,
+            "sender": settings.NOTIFICATION_SMS_SENDER,
+        }
+    }
+    enqueue_task(
+        "send_notification_task", kwargs=kwargs, queue=settings.NOTIFICATION_QUEUES[TRANSACTIONAL]
+    )
+
+
+def send_bulk_sms(users: Iterable[User], message: str) -> str:
+    """
+    Sends a campaign as one bulk notification, in tasks of NOTIFICATION_BULK_BATCH_SIZE
+    recipients. Returns its batch_id, under which the notification center reports
+    the outcome for every recipient.
+    """
+    batch_id = uuid.uuid4().hex
+    records = [[user.phone_number, message] for user in users]
+    for start in range(0, len(records), settings.NOTIFICATION_BULK_BATCH_SIZE):
+        kwargs = {
+            "batch_id": batch_id,
+            "sender": settings.NOTIFICATION_SMS_SENDER,
+            "records": records[start : start + settings.NOTIFICATION_BULK_BATCH_SIZE],
+        }
+        enqueue_task(
+            "send_bulk_notification_task", kwargs=kwargs, queue=settings.NOTIFICATION_QUEUES[BULK]
+        )
+    return batch_id
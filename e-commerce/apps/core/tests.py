@@ -0,0 +1,1280 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+import jwt
+from apps.authentication.backends import get_principal
+from apps.authentication.models import User
+from apps.core.api.cache import bump_catalog_version, catalog_version, get_or_compute, popular_pages
+from apps.core.api.pagination import KeysetPagination, NewestFirstPagination, RankedPagination
+from apps.core.models import Category, Order, OrderItem, OutboxMessage, Product
+from apps.core.services import OrderService, OutboxRelay
+from apps.core.services.cart_store import RedisCartStore
+from apps.core.tasks import BULK, send_bulk_sms, send_sms_to_user
+from apps.testing import QueryBudgetMixin
+from apps.utils import cache_decorator, get_redis
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from config import tracing
+from config.db_utils import HEARTBEAT_KEY, HEARTBEAT_SQL, ReadYourWritesMiddleware, ReplicaPool
+from config.log import QueueStreamHandler, SamplingFilter
+from constants import CANNOT_ADD_PRODUCT, CANNOT_CHANGE_PRODUCTS
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Case, Value, When
+from django.http import HttpResponse
+from django.test import AsyncClient, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from exceptions import ServiceException
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+
+class OrderServiceConcurrencyTests(TransactionTestCase):
+    """
+    Cart mutations must not lose updates when many workers hit the same order.
+
+    psycopg2 is not cooperative without monkey patching, so native threads stand in
+    for gevent greenlets here: each one holds its own connection to the primary.
+    """
+
+    databases = {"default", "readonly"}
+    # Enough to interleave, while each worker's primary and mirror connections stay
+    # well under Postgres's default max_connections.
+    workers = 8
+
+    def setUp(self):
+        self.user = User.objects.create_user("buyer", "+77000000000", "password")
+        category = Category.objects.create(name="Category")
+        self.product = Product.objects.create(
+            name="Product", price=Decimal("10.00"), stock=100, category=category
+        )
+        self.order = OrderService().create_order(self.user)
+
+    def _run_concurrently(self, action):
+        services = [OrderService(self.order.id) for _ in range(self.workers)]
+        barrier = threading.Barrier(self.workers)
+
+        def worker(service):
+            try:
+                barrier.wait()
+                action(service)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for future in [executor.submit(worker, service) for service in services]:
+                future.result()
+
+    def test_concurrent_adds_do_not_lose_updates(self):
+        self._run_concurrently(lambda service: service.add_products(self.product.id))
+
+        item = OrderItem.objects.get(order=self.order, product=self.product)
+        self.assertEqual(item.quantity, self.workers)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, self.product.price * self.workers)
+
+    def test_concurrent_removes_do_not_lose_updates(self):
+        OrderService(self.order.id).add_products(self.product.id, self.workers)
+
+        self._run_concurrently(lambda service: service.remove_products(self.product.id))
+
+        self.assertFalse(OrderItem.objects.filter(order=self.order).exists())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, 0)
+
+    def test_add_products_runs_two_statements(self):
+        service = OrderService(self.order.id)
+
+        # Two statements wrapped in BEGIN / COMMIT, which are captured as well.
+        with self.assertNumQueries(4):
+            service.add_products(self.product.id, 2)
+        with self.assertNumQueries(4):
+            service.add_products(self.product.id, 3)
+
+        self.assertEqual(OrderItem.objects.get(order=self.order).quantity, 5)
+
+    def test_remove_products_runs_two_statements(self):
+        service = OrderService(self.order.id)
+        service.add_products(self.product.id, 3)
+
+        with self.assertNumQueries(4):
+            service.remove_products(self.product.id, 2)
+        with self.assertNumQueries(4):
+            service.remove_products(self.product.id, 5)
+
+        self.assertFalse(OrderItem.objects.filter(order=self.order).exists())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, 0)
+
+    def test_crossed_batches_on_one_order_do_not_deadlock(self):
+        # Half the workers move a unit from second to first, half the other way:
+        # without the order lock their item locks cross and Postgres aborts one.
+        first, second = self.product, Product.objects.create(
+            name="Other", price=Decimal("10.00"), stock=100, category=self.product.category
+        )
+        OrderService(self.order.id).update_products(
+            [{"product_id": first.id, "quantity": 100}, {"product_id": second.id, "quantity": 100}]
+        )
+        moves = iter(range(self.workers))
+
+        def move(service):
+            source, target = (first, second) if next(moves) % 2 else (second, first)
+            service.update_products(
+                [
+                    {"product_id": target.id, "quantity": 1},
+                    {"product_id": source.id, "quantity": -1},
+                ]
+            )
+
+        self._run_concurrently(move)
+
+        quantities = OrderItem.objects.filter(order=self.order).values_list("quantity", flat=True)
+        self.assertEqual(list(quantities), [100, 100])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, Decimal("2000.00"))
+
+    def test_mutations_are_rejected_once_order_left_created(self):
+        service = OrderService(self.order.id)
+        service.add_products(self.product.id)
+        Order.objects.filter(id=self.order.id).update(status=Order.Status.PAID)
+
+        with self.assertRaises(ServiceException):
+            service.add_products(self.product.id)
+
+        self.assertEqual(OrderItem.objects.get(order=self.order).quantity, 1)
+
+
+class OrderServiceBatchTests(TransactionTestCase):
+    databases = {"default", "readonly"}
+
+    def setUp(self):
+        user = User.objects.create_user("buyer", "+77000000000", "password")
+        category = Category.objects.create(name="Category")
+        self.products = Product.objects.bulk_create(
+            Product(name=f"Product {i}", price=Decimal("2.50"), stock=100, category=category)
+            for i in range(40)
+        )
+        self.order = OrderService().create_order(user)
+
+    def test_restoring_a_cart_takes_a_handful_of_statements(self):
+        service = OrderService(self.order.id)
+        items = [{"product_id": product.id, "quantity": 2} for product in self.products]
+
+        # Price lookup on the replica, then BEGIN, order lock, upsert, total update, COMMIT.
+        with self.assertNumQueries(5), self.assertNumQueries(1, using="readonly"):
+            service.update_products(items)
+
+        self.assertEqual(OrderItem.objects.filter(order=self.order).count(), 40)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, Decimal("200.00"))
+
+    def test_batch_mixes_additions_and_removals(self):
+        first, second, third = self.products[:3]
+        service = OrderService(self.order.id)
+        service.update_products(
+            [{"product_id": first.id, "quantity": 3}, {"product_id": second.id, "quantity": 1}]
+        )
+
+        service.update_products(
+            [
+                {"product_id": first.id, "quantity": -1},
+                {"product_id": second.id, "quantity": -5},
+                {"product_id": third.id, "quantity": 2},
+                {"product_id": third.id, "quantity": 1},
+            ]
+        )
+
+        quantities = dict(
+            OrderItem.objects.filter(order=self.order).values_list("product_id", "quantity")
+        )
+        self.assertEqual(quantities, {first.id: 2, third.id: 3})
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, Decimal("12.50"))
+
+
+class RedisCartStoreTests(TransactionTestCase):
+    databases = {"default", "readonly"}
+
+    def setUp(self):
+        user = User.objects.create_user("buyer", "+77000000000", "password")
+        category = Category.objects.create(name="Category")
+        self.first, self.second = Product.objects.bulk_create(
+            Product(name=f"Product {i}", price=Decimal("4.00"), stock=100, category=category)
+            for i in range(2)
+        )
+        self.order = OrderService().create_order(user)
+        self.store = RedisCartStore()
+        self.addCleanup(self.store.clear, self.order.id)
+        patcher = mock.patch.object(OrderService, "cart_store", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cart_edits_do_not_touch_the_primary(self):
+        service = OrderService(self.order.id)
+
+        with self.assertNumQueries(0):
+            service.add_products(self.first.id, 2)
+            service.remove_products(self.first.id, 1)
+            service.update_products([{"product_id": self.second.id, "quantity": 3}])
+
+        self.assertEqual(self.store.items(self.order.id), {self.first.id: 1, self.second.id: 3})
+        order = OrderService(self.order.id).get_order()
+        self.assertEqual(order.total_price, Decimal("16.00"))
+        self.assertEqual(
+            {item.product_id: item.quantity for item in order.items.all()},
+            {self.first.id: 1, self.second.id: 3},
+        )
+
+    def test_payment_flushes_the_cart_into_order_items(self):
+        service = OrderService(self.order.id)
+        service.add_products(self.first.id, 2)
+
+        with mock.patch("apps.core.services.order_service.send_sms_to_user"):
+            service.payment_release()
+
+        self.assertEqual(self.store.items(self.order.id), {})
+        self.assertEqual(OrderItem.objects.get(order=self.order).quantity, 2)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.Status.PAID)
+        self.assertEqual(self.order.total_price, Decimal("8.00"))
+
+    def test_paying_an_empty_cart_is_rejected(self):
+        with self.assertRaises(ServiceException):
+            OrderService(self.order.id).payment_release()
+
+    def test_changes_racing_the_payment_are_refused_not_lost(self):
+        service = OrderService(self.order.id)
+        service.add_products(self.first.id, 2)
+        # Loaded before the payment, as a concurrent request would be.
+        racing = OrderService(self.order.id)
+
+        def send_sms(**kwargs):
+            with self.assertRaisesMessage(ServiceException, CANNOT_ADD_PRODUCT):
+                racing.add_products(self.second.id, 1)
+
+        with mock.patch("apps.core.services.order_service.send_sms_to_user", send_sms):
+            service.payment_release()
+
+        self.assertEqual(
+            dict(OrderItem.objects.filter(order=self.order).values_list("product_id", "quantity")),
+            {self.first.id: 2},
+        )
+        self.assertEqual(self.store.items(self.order.id), {})
+
+    def test_a_failed_payment_gives_the_cart_back(self):
+        OrderService(self.order.id).add_products(self.first.id, 2)
+
+        with mock.patch(
+            "apps.core.services.order_service.send_sms_to_user", side_effect=DatabaseError
+        ), self.assertRaises(DatabaseError):
+            OrderService(self.order.id).payment_release()
+
+        OrderService(self.order.id).add_products(self.first.id, 1)
+        self.assertEqual(self.store.items(self.order.id), {self.first.id: 3})
+        self.assertFalse(OrderItem.objects.filter(order=self.order).exists())
+
+    def test_removing_a_stored_item_hides_it_and_deletes_it_on_payment(self):
+        with mock.patch.object(OrderService, "cart_store", None):
+            OrderService(self.order.id).add_products(self.first.id, 2)
+        service = OrderService(self.order.id)
+        service.remove_products(self.first.id, 5)
+        service.add_products(self.second.id, 1)
+
+        self.assertEqual(self.store.items(self.order.id), {self.first.id: -2, self.second.id: 1})
+        order = OrderService(self.order.id).get_order()
+        self.assertEqual(order.total_price, Decimal("4.00"))
+        self.assertEqual(
+            {item.product_id: item.quantity for item in order.items.all()}, {self.second.id: 1}
+        )
+
+        with mock.patch("apps.core.services.order_service.send_sms_to_user"):
+            OrderService(self.order.id).payment_release()
+
+        self.assertEqual(
+            dict(OrderItem.objects.filter(order=self.order).values_list("product_id", "quantity")),
+            {self.second.id: 1},
+        )
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, Decimal("4.00"))
+
+
+class ReadYourWritesRoutingTests(TransactionTestCase):
+    databases = {"default", "readonly"}
+
+    def setUp(self):
+        user = User.objects.create_user("buyer", "+77000000000", "password")
+        category = Category.objects.create(name="Category")
+        self.product = Product.objects.create(
+            name="Product", price=Decimal("1.00"), stock=100, category=category
+        )
+        self.order = OrderService().create_order(user)
+        self.url = f"/api/core/orders/{self.order.id}"
+        self.auth = {
+            "HTTP_AUTHORIZATION": f"Bearer {user.token}",
+            "HTTP_ACCEPT": "application/json",
+        }
+        self.addCleanup(cache.delete, f"db:pinned:{user.id}")
+        # Principal cache fills read from the primary; keep them out of the picture.
+        get_principal(user.id)
+        self.addCleanup(get_principal.invalidate, user.id)
+
+    def test_reads_stay_on_the_primary_after_the_user_writes(self):
+        with CaptureQueriesContext(connections["default"]) as primary:
+            self.client.get(self.url, **self.auth)
+        self.assertEqual(len(primary), 0)
+
+        self.client.post(
+            f"{self.url}/add",
+            {"product_id": self.product.id},
+            content_type="application/json",
+            **self.auth,
+        )
+
+        with CaptureQueriesContext(connections["readonly"]) as replica:
+            response = self.client.get(self.url, **self.auth)
+        self.assertEqual(len(replica), 0)
+        self.assertEqual(len(response.json()["items"]), 1)
+
+    async def test_async_requests_pin_without_leaving_the_event_loop(self):
+        async def write(request):
+            await sync_to_async(Product.objects.filter(id=self.product.id).update)(stock=99)
+            return HttpResponse()
+
+        middleware = ReadYourWritesMiddleware(write)
+        request = APIRequestFactory().post(
+            self.url, HTTP_AUTHORIZATION=self.auth["HTTP_AUTHORIZATION"]
+        )
+
+        self.assertTrue(iscoroutinefunction(middleware))
+        await middleware(request)
+        self.assertIsNotNone(await cache.aget(middleware._pin_key(request)))
+
+    def test_tokens_without_a_user_id_are_rejected_not_an_error(self):
+        token = jwt.encode({"exp": int(time.time()) + 60}, settings.SECRET_KEY, algorithm="HS256")
+
+        response = self.client.get(
+            self.url, HTTP_AUTHORIZATION=f"Bearer {token}", HTTP_ACCEPT="application/json"
+        )
+
+        self.assertEqual(response.status_code, 403)
+
+
+class ReplicaPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.pool = ReplicaPool({"first": 3, "second": 1}, max_lag=5, probe_interval=0)
+        self.connections = {
+            "default": self._replica(),
+            "first": self._replica(lag=0),
+            "second": self._replica(lag=0),
+        }
+        patcher = mock.patch("config.db_utils.connections", self.connections)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(cache.delete, HEARTBEAT_KEY)
+
+    def _replica(self, lag=0, error=None):
+        connection = mock.MagicMock()
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = (lag,)
+        cursor.execute.side_effect = error
+        return connection
+
+    def test_replicas_are_chosen_by_weight(self):
+        with mock.patch("config.db_utils.random.choices", return_value=["second"]) as choices:
+            self.assertEqual(self.pool.choose(), "second")
+        choices.assert_called_once_with(["first", "second"], weights=[3, 1])
+
+    def test_replicas_of_weight_zero_take_no_reads(self):
+        pool = ReplicaPool({"first": 0, "second": 1}, max_lag=5, probe_interval=0)
+        self.assertEqual(pool.choose(), "second")
+
+        self.connections["second"] = self._replica(lag=30)
+        pool.probe()
+
+        self.assertEqual(pool.healthy, [])
+        self.assertEqual(pool.choose(), "default")
+        self.connections["first"].cursor.assert_not_called()
+
+    def test_lagging_and_failing_replicas_are_ejected(self):
+        self.connections["first"] = self._replica(lag=30)
+        self.pool.probe()
+        self.assertEqual(self.pool.healthy, ["second"])
+        self.assertEqual(self.pool.choose(), "second")
+
+        self.connections["first"] = self._replica(lag=1)
+        self.pool.probe()
+        self.assertEqual(self.pool.healthy, ["first", "second"])
+
+    def test_replicas_whose_wal_receiver_is_not_streaming_are_ejected(self):
+        self.connections["first"] = self._replica(lag=None)
+
+        self.pool.probe()
+
+        self.assertEqual(self.pool.healthy, ["second"])
+
+    def test_one_heartbeat_is_written_to_the_primary_per_interval(self):
+        pool = ReplicaPool({"first": 1}, max_lag=5, probe_interval=10)
+        other_worker = ReplicaPool({"first": 1}, max_lag=5, probe_interval=10)
+
+        pool.probe()
+        other_worker.probe()
+
+        cursor = self.connections["default"].cursor.return_value.__enter__.return_value
+        cursor.execute.assert_called_once_with(HEARTBEAT_SQL)
+
+    def test_the_prober_runs_on_a_native_thread(self):
+        pool = ReplicaPool({"first": 1}, max_lag=5, probe_interval=10)
+        native = mock.Mock()
+
+        with mock.patch("config.db_utils.monkey.get_original", return_value=native) as original:
+            pool.start_prober()
+            pool.start_prober()
+
+        original.assert_called_once_with("threading", "Thread")
+        native.assert_called_once_with(target=pool._run_prober, name="replica-prober", daemon=True)
+        native.return_value.start.assert_called_once_with()
+
+    def test_reads_fall_back_to_the_primary_when_no_replica_is_healthy(self):
+        self.connections["first"] = self._replica(error=DatabaseError("connection refused"))
+        # Not a DatabaseError: must not end the prober either.
+        self.connections["second"] = self._replica(error=KeyError("readonly_2"))
+
+        with self.assertLogs("config.db_utils", "ERROR"):
+            self.pool.probe()
+
+        self.assertEqual(self.pool.healthy, [])
+        self.assertEqual(self.pool.choose(), "default")
+        self.connections["second"].close.assert_called_once()
+
+
+class PaginationTests(TransactionTestCase):
+    databases = {"default", "readonly"}
+
+    def setUp(self):
+        category = Category.objects.create(name="Category")
+        self.products = Product.objects.bulk_create(
+            Product(name=f"Product {i}", price=Decimal("1.00"), stock=10, category=category)
+            for i in range(7)
+        )
+        self.ids = [product.id for product in self.products]
+
+    def _pages(self, pagination_class, queryset, query="page_size=3"):
+        """Follows next links from the first page, returning each page's ids and response."""
+        pages = []
+        url = f"/products/?{query}"
+        while url:
+            paginator = pagination_class()
+            request = Request(APIRequestFactory().get(url))
+            page = paginator.paginate_queryset(queryset, request)
+            response = paginator.get_paginated_response([product.id for product in page])
+            pages.append(response.data)
+            url = response.data["next"]
+        return pages
+
+    def test_cursor_round_trip_visits_every_row_once(self):
+        pages = self._pages(KeysetPagination, Product.objects.all(), "page_size=3&count=true")
+
+        self.assertEqual([len(page["results"]) for page in pages], [3, 3, 1])
+        self.assertEqual([pk for page in pages for pk in page["results"]], self.ids)
+        self.assertEqual({page["count"] for page in pages}, {7})
+
+        # Going back from the last page returns the page before it.
+        paginator = KeysetPagination()
+        previous = pages[-1]["previous"]
+        page = paginator.paginate_queryset(
+            Product.objects.all(), Request(APIRequestFactory().get(previous))
+        )
+        self.assertEqual([product.id for product in page], pages[1]["results"])
+
+    def test_newest_first(self):
+        pages = self._pages(NewestFirstPagination, Product.objects.all())
+
+        self.assertEqual([pk for page in pages for pk in page["results"]], self.ids[::-1])
+
+    def test_ties_keep_a_stable_order_across_pages(self):
+        # Two ranks only: the cursor moves within a run of equal ranks by offset.
+        queryset = Product.objects.annotate(
+            rank=Case(When(id__in=self.ids[::2], then=Value(2)), default=Value(1))
+        )
+
+        pages = self._pages(RankedPagination, queryset, "page_size=2")
+
+        expected = self.ids[::2] + self.ids[1::2]
+        self.assertEqual([pk for page in pages for pk in page["results"]], expected)
+
+    def test_count_is_computed_only_on_request(self):
+        queryset = Product.objects.all()
+
+        # Catalog reads go to the replica.
+        with self.assertNumQueries(1, using="readonly"):
+            pages = self._pages(KeysetPagination, queryset, "page_size=10")
+
+        self.assertNotIn("count", pages[0])
+        self.assertEqual(pages[0]["results"], self.ids)
+        with self.assertNumQueries(2, using="readonly"):
+            self._pages(KeysetPagination, queryset, "page_size=10&count=true")
+
+    def test_order_list_is_paginated_newest_first(self):
+        user = User.objects.create_user("buyer", "+77000000000", "password")
+        self.addCleanup(cache.delete, f"db:pinned:{user.id}")
+        self.addCleanup(get_principal.invalidate, user.id)
+        orders = [OrderService().create_order(user).id for _ in range(3)]
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {user.token}"}
+
+        first = self.client.get("/api/core/orders/?page_size=2&count=true", **headers).json()
+        second = self.client.get(first["next"], **headers).json()
+
+        self.assertEqual(first["count"], 3)
+        self.assertEqual([order["id"] for order in first["results"]], orders[:0:-1])
+        self.assertEqual([order["id"] for order in second["results"]], orders[:1])
+        self.assertIsNone(second["next"])
+        self.assertIsNotNone(second["previous"])
+
+
+class ProductSearchTests(TransactionTestCase):
+    databases = {"default", "readonly"}
+
+    def setUp(self):
+        category = Category.objects.create(name="Phones")
+        Product.objects.bulk_create(
+            [
+                Product(
+                    name="Apple iPhone 15",
+                    description="Smartphone with a great camera",
+                    price=Decimal("999.00"),
+                    stock=10,
+                    category=category,
+                ),
+                Product(
+                    name="Samsung Galaxy",
+                    description="Android phone that charges iPhone accessories",
+                    price=Decimal("899.00"),
+                    stock=10,
+                    category=category,
+                ),
+                Product(name="Phone case", price=Decimal("9.00"), stock=10, category=category),
+            ]
+        )
+
+    def _search(self, **params):
+        return self.client.get(
+            "/api/core/products/search", params, HTTP_ACCEPT="application/json"
+        ).json()
+
+    def test_name_matches_rank_above_description_matches(self):
+        page = self._search(q="iphone", page_size=1, count="true")
+
+        self.assertEqual(page["count"], 2)
+        self.assertEqual([product["name"] for product in page["results"]], ["Apple iPhone 15"])
+        next_page = self.client.get(page["next"], HTTP_ACCEPT="application/json").json()
+        self.assertEqual([product["name"] for product in next_page["results"]], ["Samsung Galaxy"])
+        self.assertIsNone(next_page["next"])
+
+    def test_stemmed_words_match(self):
+        page = self._search(q="smartphones")
+
+        self.assertEqual([product["name"] for product in page["results"]], ["Apple iPhone 15"])
+
+    def test_reads_leave_the_search_vector_out(self):
+        user = User.objects.create_user("buyer", "+77000000000", "password")
+        service = OrderService()
+        service.create_order(user)
+        service.add_products(Product.objects.first().id)
+        bump_catalog_version()
+
+        with CaptureQueriesContext(connections["readonly"]) as reads:
+            self._search(q="iphone")
+            self.client.get("/api/core/products/", HTTP_ACCEPT="application/json")
+            OrderService(service.order.id).get_order()
+
+        # The search ranks on the vector in SQL; only selecting the column is wasted.
+        columns = [query["sql"].split(" FROM ")[0] for query in reads.captured_queries]
+        self.assertTrue(any('"core_product"."price"' in selected for selected in columns))
+        self.assertFalse(
+            any(', "core_product"."search_vector"' in selected for selected in columns)
+        )
+
+
+class CatalogCacheTests(TransactionTestCase):
+    databases = {"default", "readonly"}
+
+    def setUp(self):
+        category = Category.objects.create(name="Category")
+        self.product = Product.objects.create(
+            name="Product", price=Decimal("5.00"), stock=10, category=category
+        )
+
+    def _prices(self):
+        response = self.client.get("/api/core/products/", HTTP_ACCEPT="application/json")
+        return [product["price"] for product in response.json()["results"]]
+
+    def test_cached_page_is_served_without_queries(self):
+        self._prices()
+
+        with self.assertNumQueries(0), self.assertNumQueries(0, using="readonly"):
+            self.assertEqual(self._prices(), [5.0])
+
+    def test_saving_a_product_invalidates_cached_pages(self):
+        self.assertEqual(self._prices(), [5.0])
+
+        self.product.price = Decimal("7.00")
+        self.product.save()
+
+        self.assertEqual(self._prices(), [7.0])
+
+    @override_settings(CATALOG_CACHE_WARM_URL="https://shop.example/")
+    def test_pages_are_shared_across_hosts(self):
+        for _ in range(2):
+            Product.objects.create(
+                name="Product", price=Decimal("5.00"), stock=10, category=self.product.category
+            )
+        url = "/api/core/products/?page_size=1&utm=1"
+        first = self.client.get(url, HTTP_HOST="a.example", HTTP_ACCEPT="application/json")
+
+        with self.assertNumQueries(0), self.assertNumQueries(0, using="readonly"):
+            second = self.client.get(url, HTTP_HOST="b.example", HTTP_ACCEPT="application/json")
+
+        self.assertEqual(second.json(), first.json())
+        self.assertRegex(
+            first.json()["next"],
+            r"^https://shop\.example/api/core/products/\?cursor=[^&]+&page_size=1$",
+        )
+
+    def test_pages_are_filled_from_a_replica(self):
+        with self.assertNumQueries(0), CaptureQueriesContext(connections["readonly"]) as replica:
+            self._prices()
+
+        self.assertTrue(replica.captured_queries)
+
+    def test_fills_right_after_a_bump_are_refreshed_once_replicas_caught_up(self):
+        key = "catalog:test:settle"
+        self.addCleanup(cache.delete, key)
+        bump_catalog_version()
+
+        get_or_compute(key, lambda: [])
+
+        refresh_at, _ = cache.get(key)
+        self.assertLess(refresh_at, time.time() + settings.DATABASE_REPLICA_MAX_LAG + 1)
+
+    def test_pollers_take_the_lock_over_from_a_failed_holder(self):
+        key = "catalog:test:poll"
+        self.addCleanup(cache.delete, key)
+        cache.add(f"{key}:lock", 1)
+        compute = mock.Mock(return_value=[5.0])
+
+        # The holder gives up while the other worker polls.
+        with mock.patch("time.sleep", lambda _: cache.delete(f"{key}:lock")):
+            self.assertEqual(get_or_compute(key, compute), [5.0])
+
+        compute.assert_called_once()
+        self.assertEqual(cache.get(key)[1], [5.0])
+        self.assertIsNone(cache.get(f"{key}:lock"))
+
+
+class PopularPagesTests(TransactionTestCase):
+    databases = {"default", "readonly"}
+
+    def setUp(self):
+        Category.objects.create(name="Category")
+        redis = get_redis()
+        self._clear = lambda: [redis.delete(key) for key in redis.scan_iter("catalog:popular:*")]
+        self._clear()
+        self.addCleanup(self._clear)
+
+    def _get(self, path):
+        response = self.client.get(path, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(CATALOG_POPULAR_SAMPLE_RATE=1)
+    def test_pages_are_counted_by_path_and_page_parameters(self):
+        self._get("/api/core/categories/?utm_source=mail&page_size=5")
+
+        with self.assertNumQueries(0, using="readonly"):
+            self._get("/api/core/categories/?page_size=5&ref=1")
+
+        self.assertEqual(popular_pages(10), ["/api/core/categories/?page_size=5"])
+
+    @override_settings(CATALOG_POPULAR_SAMPLE_RATE=1, CATALOG_POPULAR_MAX_PAGES=2)
+    def test_popular_pages_are_capped(self):
+        for size in (1, 2, 2, 3, 3, 3):
+            self._get(f"/api/core/categories/?page_size={size}")
+
+        self.assertEqual(
+            popular_pages(10),
+            ["/api/core/categories/?page_size=3", "/api/core/categories/?page_size=2"],
+        )
+
+    @override_settings(CATALOG_POPULAR_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_counted(self):
+        self._get("/api/core/categories/")
+
+        self.assertEqual(popular_pages(10), [])
+
+
+@mock.patch("apps.core.services.order_service.send_sms_to_user", mock.Mock())
+class StockReservationTests(TransactionTestCase):
+    databases = {"default", "readonly"}
+
+    def setUp(self):
+        self.user = User.objects.create_user("buyer", "+77000000000", "password")
+        category = Category.objects.create(name="Category")
+        self.hot, self.cold = Product.objects.bulk_create(
+            Product(name=f"Product {i}", price=Decimal("3.00"), stock=5, category=category)
+            for i in range(2)
+        )
+
+    def _order(self, quantities):
+        service = OrderService()
+        service.create_order(self.user)
+        service.update_products(
+            [{"product_id": product.id, "quantity": q} for product, q in quantities.items()]
+        )
+        return OrderService(service.order.id)
+
+    def test_hot_product_is_never_oversold(self):
+        services = [self._order({self.hot: 1}) for _ in range(20)]
+        barrier = threading.Barrier(len(services))
+
+        def checkout(service):
+            try:
+                barrier.wait()
+                service.payment_release()
+                return True
+            except ServiceException:
+                return False
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=len(services)) as executor:
+            paid = sum(executor.map(checkout, services))
+
+        self.assertEqual(paid, 5)
+        self.hot.refresh_from_db()
+        self.assertEqual(self.hot.stock, 0)
+        self.assertEqual(Order.objects.filter(status=Order.Status.PAID).count(), 5)
+
+    def test_reservation_is_all_or_nothing(self):
+        service = self._order({self.hot: 2, self.cold: 6})
+
+        with self.assertRaisesMessage(ServiceException, str(self.cold.id)):
+            service.payment_release()
+
+        self.hot.refresh_from_db()
+        self.assertEqual(self.hot.stock, 5)
+        self.assertEqual(Order.objects.get(id=service.order.id).status, Order.Status.CREATED)
+
+    def test_cancel_returns_reserved_stock(self):
+        service = self._order({self.hot: 2, self.cold: 1})
+        service.payment_release()
+
+        OrderService(service.order.id).cancel()
+
+        self.assertEqual(
+            dict(Product.objects.values_list("id", "stock")), {self.hot.id: 5, self.cold.id: 5}
+        )
+
+    def test_paid_order_cannot_be_emptied_before_its_stock_is_released(self):
+        service = self._order({self.hot: 2, self.cold: 1})
+        service.payment_release()
+
+        with self.assertRaisesMessage(ServiceException, CANNOT_CHANGE_PRODUCTS):
+            OrderService(service.order.id).remove_all_products()
+        OrderService(service.order.id).cancel()
+
+        self.assertEqual(OrderItem.objects.filter(order_id=service.order.id).count(), 2)
+        self.assertEqual(
+            dict(Product.objects.values_list("id", "stock")), {self.hot.id: 5, self.cold.id: 5}
+        )
+
+    def test_stock_moves_last_before_commit(self):
+        service = self._order({self.hot: 2})
+
+        with CaptureQueriesContext(connections["default"]) as paid:
+            service.payment_release()
+        with CaptureQueriesContext(connections["default"]) as cancelled:
+            OrderService(service.order.id).cancel()
+
+        for captured, statement in ((paid, "stock - wanted"), (cancelled, "stock + reserved")):
+            *_, moved, commit = [query["sql"] for query in captured.captured_queries]
+            self.assertIn(statement, moved)
+            self.assertEqual(commit, "COMMIT")
+
+    def test_checkouts_leave_the_catalog_cache_in_place(self):
+        def stock():
+            response = self.client.get("/api/core/products/", HTTP_ACCEPT="application/json")
+            return {product["id"]: product["stock"] for product in response.json()["results"]}
+
+        service = self._order({self.hot: 2})
+        self.assertEqual(stock()[self.hot.id], 5)
+        version = catalog_version()
+
+        service.payment_release()
+
+        self.assertEqual(catalog_version(), version)
+        self.assertEqual(stock()[self.hot.id], 5)
+        later = time.time() + settings.CATALOG_CACHE_REFRESH_AFTER + 1
+        with mock.patch("apps.core.api.cache.time", time=lambda: later, monotonic=time.monotonic):
+            self.assertEqual(stock()[self.hot.id], 3)
+
+    def test_expired_reservations_are_released(self):
+        expired, shipped = self._order({self.hot: 2}), self._order({self.hot: 1})
+        expired.payment_release()
+        shipped.payment_release()
+        OrderService(shipped.order.id).delivery_release()
+        Order.objects.update(reserved_until=timezone.now())
+
+        call_command("release_expired_reservations", stdout=StringIO())
+
+        self.assertEqual(Order.objects.get(id=expired.order.id).status, Order.Status.CANCELLED)
+        self.assertEqual(Order.objects.get(id=shipped.order.id).status, Order.Status.SHIPPED)
+        self.hot.refresh_from_db()
+        self.assertEqual(self.hot.stock, 4)
+
+
+class OutboxTests(TransactionTestCase):
+    databases = {"default", "readonly"}
+
+    def setUp(self):
+        user = User.objects.create_user("buyer", "+77000000000", "password")
+        category = Category.objects.create(name="Category")
+        self.product = Product.objects.create(
+            name="Product", price=Decimal("1.00"), stock=1, category=category
+        )
+        order = OrderService().create_order(user)
+        OrderService(order.id).add_products(self.product.id)
+        self.service = OrderService(order.id)
+
+    def test_sms_is_written_with_the_status_change(self):
+        self.service.payment_release()
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.queue, "notification-center")
+        self.assertEqual(message.kwargs["data"]["phone_numbers"], ["+77000000000"])
+
+    def test_sms_is_queued_by_message_class(self):
+        user = self.service.order.user
+        with transaction.atomic():
+            send_sms_to_user(user, "Sale!", message_class=BULK)
+            send_sms_to_user(user, "Your order is paid")
+
+        self.assertEqual(
+            list(OutboxMessage.objects.order_by("id").values_list("task_name", "queue")),
+            [
+                ("send_bulk_notification_task", "notification-center.bulk"),
+                ("send_notification_task", "notification-center"),
+            ],
+        )
+
+    @override_settings(NOTIFICATION_BULK_BATCH_SIZE=2)
+    def test_bulk_sms_is_chunked_under_one_batch_id(self):
+        users = [
+            User.objects.create_user(f"user{i}", f"+7700000000{i}", "password") for i in range(1, 4)
+        ]
+        with transaction.atomic():
+            batch_id = send_bulk_sms(users, "Sale!")
+
+        chunks = list(OutboxMessage.objects.order_by("id").values_list("kwargs", flat=True))
+        self.assertEqual([chunk["batch_id"] for chunk in chunks], [batch_id, batch_id])
+        self.assertEqual(
+            [chunk["records"] for chunk in chunks],
+            [[["+77000000001", "Sale!"], ["+77000000002", "Sale!"]], [["+77000000003", "Sale!"]]],
+        )
+
+    def test_request_id_is_passed_to_the_task(self):
+        order = self.service.order
+        response = self.client.post(
+            f"/api/core/orders/{order.id}/payment",
+            HTTP_AUTHORIZATION=f"Bearer {order.user.token}",
+            HTTP_X_REQUEST_ID="checkout-1",
+        )
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response["X-Request-ID"], "checkout-1")
+        self.assertEqual(OutboxMessage.objects.get().headers, {"request_id": "checkout-1"})
+
+    def test_rolled_back_status_change_sends_nothing(self):
+        Product.objects.update(stock=0)
+
+        with self.assertRaises(ServiceException):
+            self.service.payment_release()
+
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    @mock.patch("apps.core.services.outbox_service.celery_app")
+    def test_relay_deletes_only_published_messages(self, celery_app):
+        self.service.payment_release()
+        OrderService(self.service.order.id).cancel()
+
+        celery_app.send_task.side_effect = [None, ConnectionError("broker is down")]
+        with self.assertRaises(ConnectionError):
+            OutboxRelay(batch_size=10).drain()
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+
+        celery_app.send_task.side_effect = None
+        self.assertEqual(OutboxRelay(batch_size=1).drain(), 2)
+        self.assertFalse(OutboxMessage.objects.exists())
+        self.assertEqual(celery_app.send_task.call_count, 4)
+
+
+class CacheDecoratorTests(SimpleTestCase):
+    def setUp(self):
+        self.calls = []
+
+        @cache_decorator(f"tests.{self.id()}", timeout=60)
+        def lookup(product_id, scale=1):
+            self.calls.append(product_id)
+            return product_id * scale if product_id else None
+
+        self.lookup = lookup
+        for args in [(0,), (1,), (2,)]:
+            self.addCleanup(lookup.invalidate, *args)
+
+    def test_each_argument_set_gets_its_own_entry(self):
+        self.assertEqual(self.lookup(1), 1)
+        self.assertEqual(self.lookup(2), 2)
+        self.assertEqual(self.lookup(product_id=1, scale=1), 1)
+
+        self.assertEqual(self.calls, [1, 2])
+        self.assertEqual(self.lookup.stats["misses"], 2)
+        self.assertEqual(self.lookup.stats["l1_hits"], 1)
+
+    def test_invalidate_drops_the_entry_everywhere(self):
+        self.lookup(1)
+        self.lookup.invalidate(1)
+
+        self.assertEqual(cache.get(self.lookup.cache_key(1), "missing"), "missing")
+        self.lookup(1)
+        self.assertEqual(self.calls, [1, 1])
+
+    def test_none_results_are_cached(self):
+        self.assertIsNone(self.lookup(0))
+        self.assertIsNone(self.lookup(0))
+
+        self.assertEqual(self.calls, [0])
+
+    def test_unstable_arguments_are_rejected(self):
+        with self.assertRaises(TypeError):
+            self.lookup(object())
+
+
+class AsyncOrderViewsTests(TransactionTestCase):
+    databases = {"default", "readonly"}
+
+    def setUp(self):
+        user = User.objects.create_user("buyer", "+77000000000", "password")
+        category = Category.objects.create(name="Category")
+        self.product = Product.objects.create(
+            name="Product", price=Decimal("2.00"), stock=10, category=category
+        )
+        self.auth = {"AUTHORIZATION": f"Bearer {user.token}"}
+        self.async_client = AsyncClient(enforce_csrf_checks=True)
+        self.addCleanup(cache.delete, f"db:pinned:{user.id}")
+        self.addCleanup(get_principal.invalidate, user.id)
+
+    async def test_order_lifecycle_through_async_views(self):
+        response = await self.async_client.post("/api/async/core/orders/", headers=self.auth)
+        order_id = response.json()["order_id"]
+
+        response = await self.async_client.post(
+            f"/api/async/core/orders/{order_id}/add",
+            {"product_id": self.product.id, "quantity": 3},
+            content_type="application/json",
+            headers=self.auth,
+        )
+        self.assertEqual(response.status_code, 204)
+
+        response = await self.async_client.get(
+            f"/api/async/core/orders/{order_id}", headers=self.auth
+        )
+        self.assertEqual(response.json()["total_price"], 6.0)
+        self.assertEqual(response.json()["items"][0]["quantity"], 3)
+
+        response = await self.async_client.get("/api/async/core/orders/", headers=self.auth)
+        self.assertEqual([order["id"] for order in response.json()["results"]], [order_id])
+
+    async def test_errors_are_formatted_like_the_sync_api(self):
+        response = await self.async_client.get("/api/async/core/orders/")
+        self.assertEqual(response.status_code, 403)
+
+        response = await self.async_client.post(
+            "/api/async/core/orders/0/add",
+            {"quantity": 0},
+            content_type="application/json",
+            headers=self.auth,
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("product_id", response.json()["errors"])
+
+        response = await self.async_client.get("/api/async/core/orders/0", headers=self.auth)
+        self.assertEqual(response.status_code, 404)
+
+
+class QueryBudgetTests(QueryBudgetMixin, TransactionTestCase):
+    """
+    Every endpoint runs at most a fixed number of queries, however many orders,
+    items or products it handles: each budget is checked at every size in SIZES.
+    Principals are not cached here, so budgets include authentication.
+    """
+
+    databases = {"default", "readonly"}
+    SIZES = (1, 10)
+
+    def setUp(self):
+        self.category = Category.objects.create(name="Category")
+        self.products = []
+        self.users = 0
+
+    def _ensure_products(self, count):
+        self.products += Product.objects.bulk_create(
+            Product(
+                name=f"Phone {number}", price=Decimal("1.00"), stock=100, category=self.category
+            )
+            for number in range(len(self.products), count)
+        )
+        return self.products[:count]
+
+    def _user(self):
+        self.users += 1
+        user = User.objects.create_user(
+            f"buyer{self.users}", f"+7700000{self.users:04d}", "password"
+        )
+        self.addCleanup(cache.delete, f"db:pinned:{user.id}")
+        self.addCleanup(get_principal.invalidate, user.id)
+        return user
+
+    def _order(self, user, items, status=Order.Status.CREATED):
+        order_service = OrderService().create_order(user)
+        OrderService(order_service.id).update_products(
+            [{"product_id": product.id, "quantity": 1} for product in self._ensure_products(items)]
+        )
+        if status != Order.Status.CREATED:
+            OrderService(order_service.id).payment_release()
+        if status == Order.Status.SHIPPED:
+            OrderService(order_service.id).delivery_release()
+        return order_service
+
+    def _request(self, budget, size, method, path, user=None, data=None):
+        headers = {"HTTP_ACCEPT": "application/json"}
+        if user is not None:
+            headers["HTTP_AUTHORIZATION"] = f"Bearer {user.token}"
+            get_principal.invalidate(user.id)
+        endpoint = f"{method.upper()} {path} at size {size}"
+        with self.subTest(endpoint), self.assertQueryBudget(budget, endpoint):
+            response = getattr(self.client, method)(
+                path, data, content_type="application/json", **headers
+            )
+        self.assertLess(response.status_code, 400, response.content)
+        return response
+
+    def test_order_list(self):
+        for size in self.SIZES:
+            user = self._user()
+            for _ in range(size):
+                self._order(user, items=size)
+            response = self._request(3, size, "get", "/api/core/orders/", user)
+            self.assertEqual(len(response.json()["results"]), size)
+
+    def test_order_detail(self):
+        for size in self.SIZES:
+            user = self._user()
+            order = self._order(user, items=size)
+            response = self._request(3, size, "get", f"/api/core/orders/{order.id}", user)
+            self.assertEqual(len(response.json()["items"]), size)
+
+    def test_create_order(self):
+        for size in self.SIZES:
+            user = self._user()
+            for _ in range(size):
+                self._order(user, items=1)
+            self._request(2, size, "post", "/api/core/orders/", user)
+
+    def test_cart_changes(self):
+        for size in self.SIZES:
+            user = self._user()
+            order = self._order(user, items=size)
+            path = f"/api/core/orders/{order.id}"
+            products = self._ensure_products(size + 1)
+            self._request(7, size, "post", f"{path}/add", user, {"product_id": products[-1].id})
+            self._request(7, size, "post", f"{path}/remove", user, {"product_id": products[0].id})
+            # Batches lock the order row up front, which serializes changes to one order.
+            deltas = [{"product_id": product.id, "quantity": 1} for product in products]
+            self._request(9, size, "post", f"{path}/items", user, deltas)
+            self._request(7, size, "post", f"{path}/remove-all", user)
+
+    def test_status_changes(self):
+        for size in self.SIZES:
+            user = self._user()
+            path = f"/api/core/orders/{self._order(user, items=size).id}"
+            self._request(8, size, "post", f"{path}/payment", user)
+            self._request(7, size, "post", f"{path}/delivery", user)
+            self._request(7, size, "post", f"{path}/finish", user)
+
+            path = f"/api/core/orders/{self._order(user, items=size, status=Order.Status.PAID).id}"
+            self._request(8, size, "put", f"{path}/cancel", user)
+
+    def test_catalog(self):
+        for size in self.SIZES:
+            self._ensure_products(size)
+            Category.objects.bulk_create(
+                Category(name=f"Category {size}-{number}") for number in range(size)
+            )
+            # A cached page costs nothing; the budget is for filling it.
+            bump_catalog_version()
+            response = self._request(2, size, "get", "/api/core/products/")
+            self.assertEqual(len(response.json()["results"]), size)
+            self._request(2, size, "get", "/api/core/categories/")
+            self._request(2, size, "get", "/api/core/products/search", data={"q": "phone"})
+
+    def test_products_count_uses_prefetched_items(self):
+        for size in self.SIZES:
+            user = self._user()
+            for _ in range(size):
+                self._order(user, items=size)
+            with self.assertQueryBudget(2, f"products_count at size {size}"):
+                orders = Order.objects.filter(user=user).prefetch_related("items")
+                self.assertEqual([order.products_count for order in orders], [size] * size)
+
+
+class MetricsTests(TransactionTestCase):
+    databases = {"default", "readonly"}
+
+    def test_requests_and_queries_are_exported(self):
+        Category.objects.create(name="Category")
+        bump_catalog_version()
+        self.client.get("/api/core/categories/", HTTP_ACCEPT="application/json")
+
+        metrics = self.client.get("/metrics").content.decode()
+
+        self.assertIn(
+            'http_request_duration_seconds_count{method="GET",route="api/core/categories/",'
+            'status="200"}',
+            metrics,
+        )
+        self.assertIn('db_query_duration_seconds_count{alias="default"}', metrics)
+        self.assertIn('cache_requests_total{cache="catalog",result="miss"}', metrics)
+
+
+class LoggingTests(SimpleTestCase):
+    def record(self, level=logging.INFO, message="Order paid"):
+        return logging.LogRecord("tests", level, __file__, 0, message, None, None)
+
+    def test_sampling_keeps_the_configured_fraction_per_level(self):
+        sampling = SamplingFilter({"debug": 0, "info": 0.5})
+
+        self.assertFalse(sampling.filter(self.record(logging.DEBUG)))
+        with mock.patch("config.log.random.random", side_effect=[0.4, 0.6]):
+            self.assertTrue(sampling.filter(self.record()))
+            self.assertFalse(sampling.filter(self.record()))
+        self.assertTrue(sampling.filter(self.record(logging.WARNING)))
+
+    def test_records_are_dropped_when_the_queue_is_full_and_counted_later(self):
+        handler = QueueStreamHandler(maxsize=2)
+        handler.listener.stop()  # nothing drains the queue
+        self.addCleanup(handler._start)
+
+        for message in ("kept", "kept", "dropped", "dropped"):
+            handler.handle(self.record(message=message))
+        self.assertEqual((handler.dropped, handler.reported), (2, 0))
+
+        for _ in range(2):
+            handler.queue.get_nowait()
+        handler.handle(self.record(message="after"))
+
+        self.assertEqual(
+            [handler.queue.get_nowait().getMessage() for _ in range(2)],
+            ["after", "Dropped 2 log records: the log queue was full"],
+        )
+        self.assertEqual(handler.reported, 2)
+
+    def test_gunicorn_accepts_the_log_config(self):
+        # Configured the way gunicorn does, in a process of its own so this one's
+        # logging is left alone.
+        script = (
+            "import logging.config\n"
+            "from gunicorn import glogging\n"
+            "from config.gunicorn import logconfig_dict\n"
+            "config = glogging.CONFIG_DEFAULTS.copy()\n"
+            "config.update(logconfig_dict)\n"
+            "logging.config.dictConfig(config)\n"
+            "logging.getLogger('gunicorn.error').info('Booting worker')\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        entry = json.loads(result.stdout)
+        self.assertEqual((entry["logger"], entry["message"]), ("gunicorn.error", "Booting worker"))
+
+
+class TracingTests(TransactionTestCase):
+    databases = {"default", "readonly"}
+
+    def setUp(self):
+        user = User.objects.create_user("buyer", "+77000000000", "password")
+        category = Category.objects.create(name="Category")
+        product = Product.objects.create(
+            name="Product", price=Decimal("1.00"), stock=1, category=category
+        )
+        self.order = OrderService().create_order(user)
+        OrderService(self.order.id).add_products(product.id)
+
+        # The file exporter stands in for the collector.
+        self.path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), "traces.jsonl")
+        provider = TracerProvider(sampler=ALWAYS_ON)
+        provider.add_span_processor(SimpleSpanProcessor(tracing.file_exporter(self.path)))
+        patcher = mock.patch.object(tracing, "tracer", provider.get_tracer("tests"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def spans(self):
+        with open(self.path) as file:
+            return [json.loads(line) for line in file]
+
+    @mock.patch("apps.core.services.outbox_service.celery_app")
+    def test_trace_follows_the_order_to_the_broker(self, celery_app):
+        self.client.post(
+            f"/api/core/orders/{self.order.id}/payment",
+            HTTP_AUTHORIZATION=f"Bearer {self.order.user.token}",
+        )
+        OutboxRelay(batch_size=10).drain()
+
+        spans = {span["name"]: span for span in self.spans()}
+        view = spans["POST api/core/orders/<int:pk>/payment"]
+        service = spans["OrderService.payment_release"]
+        publish = spans["publish send_notification_task"]
+        trace_id = view["context"]["trace_id"]
+        self.assertEqual(service["parent_id"], view["context"]["span_id"])
+        self.assertEqual(publish["context"]["trace_id"], trace_id)
+        self.assertIn(
+            {"db.alias": "default", "parent_id": service["context"]["span_id"]},
+            [
+                {"db.alias": span["attributes"].get("db.alias"), "parent_id": span["parent_id"]}
+                for span in spans.values()
+            ],
+        )
+
+        # The notification worker continues from the publish span.
+        headers = celery_app.send_task.call_args.kwargs["headers"]
+        self.assertEqual(
+            headers["traceparent"].split("-")[1:3],
+            [trace_id[2:], publish["context"]["span_id"][2:]],
+        )
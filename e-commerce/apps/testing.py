@@ -0,0 +1,34 @@
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """
+    assertQueryBudget fails when a block runs more queries than budget, counted
+    over every database the test case may use, and lists the SQL it ran.
+
+    Budgets are meant to be checked at several data sizes with the same number,
+    so a query per row shows up as a failure instead of a slightly higher count.
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, budget: int, label: str = "Block"):
+        aliases = connections if self.databases == "__all__" else sorted(self.databases)
+        with ExitStack() as stack:
+            captured = {
+                alias: stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in aliases
+            }
+            yield
+        queries = [
+            f"[{alias}] {query['sql']}"
+            for alias, context in captured.items()
+            for query in context.captured_queries
+        ]
+        if len(queries) > budget:
+            listing = "\n".join(f"{number}. {sql}" for number, sql in enumerate(queries, 1))
+            self.fail(
+                f"{label} ran {len(queries)} queries, over its budget of {budget}:\n{listing}"
+            )
@@ -1,26 +1,221 @@
 import hashlib
-from functools import wraps
-from typing import Optional
+import inspect
+import json
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import date
+from datetime import time as dt_time
+from decimal import Decimal
+from functools import lru_cache, wraps
+from typing import Any, Dict, Hashable, Optional
+from uuid import UUID
 
+import redis
+from asgiref.sync import sync_to_async
+from config.metrics import CACHE_REQUESTS
+from django.conf import settings
 from django.core.cache import cache
+from django.db import models
 
 
-def cache_decorator(cache_name: Optional[str] = None, timeout: int = 60):
+@lru_cache(maxsize=None)
+def get_redis() -> redis.Redis:
+    """Process-wide client for data structures the cache API does not expose."""
+    return redis.Redis.from_url(settings.REDIS_URL)
+
+
+MISSING = object()
+INVALIDATION_CHANNEL = "memo:invalidate"
+
+
+class LocalCache:
+    """Size-bounded in-process LRU whose entries expire after a TTL."""
+
+    def __init__(self, maxsize: int, timeout: float):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, timeout: Optional[float] = None) -> None:
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class InvalidationListener:
+    """
+    Evicts L1 entries in every process when any of them invalidates a key.
+
+    Invalidations are published on a Redis channel and a daemon thread per process
+    applies them. A missed message leaves an entry stale for at most its L1 TTL.
+    """
+
+    def __init__(self):
+        self.caches: Dict[str, LocalCache] = {}
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def register(self, namespace: str, local_cache: LocalCache) -> None:
+        self.caches[namespace] = local_cache
+
+    def publish(self, key: str) -> None:
+        get_redis().publish(INVALIDATION_CHANNEL, key)
+
+    def ensure_running(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._listen, daemon=True).start()
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                for message in pubsub.listen():
+                    self._evict(message["data"].decode())
+            except redis.RedisError:
+                # Entries cached while disconnected may have missed evictions.
+                for local_cache in self.caches.values():
+                    local_cache.clear()
+                time.sleep(1)
+
+    def _evict(self, key: str) -> None:
+        namespace = key.rsplit(":", 1)[0]
+        if (local_cache := self.caches.get(namespace)) is not None:
+            local_cache.delete(key)
+
+
+invalidation_listener = InvalidationListener()
+
+
+def _key_part(value: Any) -> Any:
+    if isinstance(value, models.Model):
+        return f"{value._meta.label}:{value.pk}"
+    if isinstance(value, (Decimal, UUID, date, dt_time)):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Cannot derive a stable cache key from {type(value).__name__}")
+
+
+def cache_decorator(
+    cache_name: Optional[str] = None,
+    timeout: int = 60,
+    *,
+    negative_timeout: int = 10,
+    local_maxsize: int = 1024,
+    local_timeout: float = 5,
+):
+    """
+    Memoizes a function in Redis behind an in-process LRU.
+
+    Keys are derived from the bound arguments (defaults applied, keyword order
+    ignored), so f(1) and f(x=1) share an entry; model instances are keyed by pk.
+    Arguments without a stable representation raise TypeError instead of silently
+    colliding. None results are cached for negative_timeout (0 disables it).
+
+    The wrapper exposes invalidate(*args, **kwargs), which drops the entry from
+    Redis and from the L1 cache of every process, acall(*args, **kwargs) for async
+    callers, and a stats counter of l1_hits, hits and misses, also exported as
+    cache_requests_total. Set local_maxsize to 0 to skip the L1 cache.
+    """
+
     def wrapper(func):
+        namespace = f"memo:{cache_name or f'{func.__module__}.{func.__qualname__}'}"
+        signature = inspect.signature(func)
+        local_cache = LocalCache(local_maxsize, local_timeout) if local_maxsize else None
+        stats = Counter(l1_hits=0, hits=0, misses=0)
+        exported = {
+            stat: CACHE_REQUESTS.labels(namespace, result)
+            for stat, result in (("l1_hits", "l1_hit"), ("hits", "hit"), ("misses", "miss"))
+        }
+
+        def count(stat: str) -> None:
+            stats[stat] += 1
+            exported[stat].inc()
+
+        if local_cache is not None:
+            invalidation_listener.register(namespace, local_cache)
+
+        def cache_key(*args, **kwargs) -> str:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            imprint = json.dumps(
+                bound.arguments, sort_keys=True, separators=(",", ":"), default=_key_part
+            )
+            return f"{namespace}:{hashlib.sha1(imprint.encode()).hexdigest()}"
+
         @wraps(func)
         def inner(*args, **kwargs):
-            nonlocal cache_name
-            if not cache_name:
-                imprint = hashlib.md5(f"{func.__name__}:{args}:{kwargs}".encode())
-                cache_name = f"{func.__name__}:{imprint.hexdigest()}"
+            key = cache_key(*args, **kwargs)
+            if local_cache is not None:
+                invalidation_listener.ensure_running()
+                if (result := local_cache.get(key)) is not MISSING:
+                    count("l1_hits")
+                    return result
 
-            if (cached := cache.get(cache_name)) is not None:
-                return cached
+            if (result := cache.get(key, MISSING)) is not MISSING:
+                count("hits")
+            else:
+                count("misses")
+                result = func(*args, **kwargs)
+                ttl = timeout if result is not None else negative_timeout
+                if not ttl:
+                    return result
+                cache.set(key, result, ttl)
 
-            result = func(*args, **kwargs)
-            cache.set(cache_name, result, timeout)
+            if local_cache is not None:
+                local_cache.set(key, result, timeout if result is not None else negative_timeout)
             return result
 
+        async def acall(*args, **kwargs):
+            # L1 hits stay on the event loop; anything else needs blocking I/O.
+            if local_cache is not None:
+                if (result := local_cache.get(cache_key(*args, **kwargs))) is not MISSING:
+                    count("l1_hits")
+                    return result
+            return await sync_to_async(inner)(*args, **kwargs)
+
+        def invalidate(*args, **kwargs) -> None:
+            key = cache_key(*args, **kwargs)
+            cache.delete(key)
+            if local_cache is not None:
+                local_cache.delete(key)
+                invalidation_listener.publish(key)
+
+        inner.acall = acall
+        inner.cache_key = cache_key
+        inner.invalidate = invalidate
+        inner.stats = stats
         return inner
 
     return wrapper
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
 application = get_asgi_application()
+
+# After setup: the pool reads settings. Started here so only servers probe replicas.
+from config.db_utils import replicas  # noqa: E402
+
+replicas.start_prober()
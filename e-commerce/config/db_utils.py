@@ -1,12 +1,230 @@
+import logging
+import os
+import random
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from apps.authentication.backends import decode_token
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from gevent import monkey
+from rest_framework.authentication import get_authorization_header
+
+logger = logging.getLogger(__name__)
+
+# Seconds the replica is behind the primary, or NULL while its WAL receiver is not
+# streaming: a disconnected standby replays nothing new, so no replay position can
+# say it is caught up. The primary's heartbeat keeps the replay timestamp moving
+# while it is otherwise idle. Reading pg_stat_wal_receiver takes pg_read_all_stats.
+REPLICA_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+# Commits a transaction that changes nothing: assigning it an id is enough to write
+# a commit record, whose timestamp the replicas replay.
+HEARTBEAT_SQL = "SELECT pg_current_xact_id()"
+HEARTBEAT_KEY = "db:replica-heartbeat"
+
+
+@dataclass
+class ReadState:
+    """Per-request routing state shared by ReadYourWritesMiddleware and the router."""
+
+    pin_key: Optional[str] = None
+    pinned: bool = False
+    wrote: bool = False
+    replica: Optional[str] = None
+
+
+_read_state: ContextVar[Optional[ReadState]] = ContextVar("read_state", default=None)
+
+
+class ReplicaPool:
+    """
+    Weighted pool of read replicas with health and lag ejection.
+
+    A native daemon thread per worker process probes every replica each probe_interval
+    seconds and keeps only reachable, streaming ones within max_lag in rotation. The
+    probers also write a heartbeat to the primary, which lag is measured against.
+    When none is healthy, reads fall back to the primary. The WSGI and ASGI entry
+    points start it; tests and management commands keep every replica in rotation.
+    """
+
+    def __init__(self, weights: Dict[str, int], max_lag: float, probe_interval: float):
+        # A replica of weight 0 takes no reads, so it is not probed either; random.choices
+        # would fail on every read if only such replicas were healthy.
+        self.weights = {alias: weight for alias, weight in weights.items() if weight > 0}
+        self.max_lag = max_lag
+        self.probe_interval = probe_interval
+        self.healthy: List[str] = list(self.weights)
+        self._lock = threading.Lock()
+        self._prober_pid: Optional[int] = None
+
+    def choose(self) -> str:
+        healthy = self.healthy
+        if not healthy:
+            return "default"
+        return random.choices(healthy, weights=[self.weights[alias] for alias in healthy])[0]
+
+    def probe(self) -> None:
+        self._heartbeat()
+        healthy = [alias for alias in self.weights if self._is_healthy(alias)]
+        if healthy != self.healthy:
+            logger.warning("Read replicas in rotation changed: %s -> %s", self.healthy, healthy)
+        self.healthy = healthy
+
+    def _heartbeat(self) -> None:
+        # One write per half interval across all workers is enough.
+        if not self.weights or not cache.add(HEARTBEAT_KEY, 1, self.probe_interval / 2):
+            return
+        try:
+            with connections["default"].cursor() as cursor:
+                cursor.execute(HEARTBEAT_SQL)
+        except Exception:
+            logger.exception("Could not write the replication heartbeat")
+        finally:
+            connections["default"].close()
+
+    def _is_healthy(self, alias: str) -> bool:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(REPLICA_LAG_SQL)
+                (lag,) = cursor.fetchone()
+        except Exception:
+            # Anything, not only DatabaseError: an exception here would end the prober
+            # thread and freeze the rotation.
+            logger.exception("Read replica %s failed the health probe", alias)
+            return False
+        finally:
+            connections[alias].close()
+        # The latest heartbeat may be up to one interval old before the replica sees it.
+        return lag is not None and lag <= self.max_lag + self.probe_interval
+
+    def start_prober(self) -> None:
+        # Checked against the pid so that forked workers start their own prober.
+        if self._prober_pid == os.getpid() or self.probe_interval <= 0:
+            return
+        with self._lock:
+            if self._prober_pid != os.getpid():
+                self._prober_pid = os.getpid()
+                # Under the gevent worker a patched Thread is a greenlet, and the
+                # blocking connects and queries of a probe would stall every request
+                # of the worker; the probe gets a native thread instead.
+                thread = monkey.get_original("threading", "Thread")
+                thread(target=self._run_prober, name="replica-prober", daemon=True).start()
+
+    def _run_prober(self) -> None:
+        sleep = monkey.get_original("time", "sleep")
+        while True:
+            self.probe()
+            sleep(self.probe_interval)
+
+
+replicas = ReplicaPool(
+    settings.DATABASE_REPLICAS,
+    max_lag=settings.DATABASE_REPLICA_MAX_LAG,
+    probe_interval=settings.DATABASE_REPLICA_PROBE_INTERVAL,
+)
+
+
 class CustomDatabaseRouter:
     def db_for_read(self, model, **hints):
-        return 'readonly'
+        state = _read_state.get()
+        if state is None:
+            return replicas.choose()
+        if state.pinned or state.wrote:
+            return "default"
+        # Stick to one replica per request so its reads share a replication point.
+        if state.replica is None:
+            state.replica = replicas.choose()
+        return state.replica
 
     def db_for_write(self, model, **hints):
-        return 'default'
+        state = _read_state.get()
+        if state is not None:
+            state.wrote = True
+        return "default"
 
     def allow_relation(self, obj1, obj2, **hints):
         return True
 
     def allow_migrate(self, db, app_label, model_name=None, **hints):
-        return db == 'default'
\ No newline at end of file
+        return db == "default"
+
+
+class ReadYourWritesMiddleware:
+    """
+    Pins a user's reads to the primary for DATABASE_PIN_SECONDS after they write.
+
+    A write marks the request, and the response leaves a short-lived marker in the
+    cache keyed by the user id from the bearer token. While the marker lives, reads
+    of that user, on any Django replica, skip the streaming standby and cannot see
+    a cart older than their own last change. Everyone else keeps reading the replica.
+    Works under WSGI and ASGI without being adapted to the other mode.
+    """
+
+    key_prefix = "db:pinned"
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if settings.DATABASE_READ_ROUTING != "read-your-writes":
+            return self.get_response(request)
+
+        state = ReadState(pin_key=self._pin_key(request))
+        if state.pin_key is not None:
+            state.pinned = cache.get(state.pin_key) is not None
+
+        token = _read_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_state.reset(token)
+
+        if state.wrote and state.pin_key is not None:
+            cache.set(state.pin_key, 1, settings.DATABASE_PIN_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        if settings.DATABASE_READ_ROUTING != "read-your-writes":
+            return await self.get_response(request)
+
+        # ORM calls run in a copy of this context, so they share the state object.
+        state = ReadState(pin_key=self._pin_key(request))
+        if state.pin_key is not None:
+            state.pinned = await cache.aget(state.pin_key) is not None
+
+        token = _read_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_state.reset(token)
+
+        if state.wrote and state.pin_key is not None:
+            await cache.aset(state.pin_key, 1, settings.DATABASE_PIN_SECONDS)
+        return response
+
+    def _pin_key(self, request) -> Optional[str]:
+        auth_header = get_authorization_header(request).split()
+        if len(auth_header) != 2:
+            return None
+
+        try:
+            user_id = decode_token(auth_header[1].decode("utf-8"))["id"]
+        except Exception:
+            return None
+        return f"{self.key_prefix}:{user_id}"
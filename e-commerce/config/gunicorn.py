@@ -0,0 +1,21 @@
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    # Drops the live gauges of a dead worker from the multiprocess metrics.
+    multiprocess.mark_process_dead(worker.pid)
+
+
+# Gunicorn's own lines as JSON through the same queue as the application's. Gunicorn
+# merges this over its defaults one key deep, so every default that names one of its
+# handlers is replaced.
+logconfig_dict = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"json": {"()": "config.log.QueueStreamHandler"}},
+    "root": {"level": "INFO", "handlers": ["json"]},
+    "loggers": {
+        "gunicorn.error": {"handlers": ["json"], "propagate": False},
+        "gunicorn.access": {"handlers": ["json"], "propagate": False},
+    },
+}
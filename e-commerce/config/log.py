@@ -0,0 +1,182 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from opentelemetry import trace
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+
+def get_request_id() -> Optional[str]:
+    return request_id.get()
+
+
+class RequestIdMiddleware:
+    """
+    Tags the request with the X-Request-ID it came with (nginx or the client), or a
+    new one, for every log line it writes and every task it enqueues, and returns
+    it in the response.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = self._bind(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_id.reset(token)
+        response[REQUEST_ID_HEADER] = request.request_id
+        return response
+
+    async def __acall__(self, request):
+        token = self._bind(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_id.reset(token)
+        response[REQUEST_ID_HEADER] = request.request_id
+        return response
+
+    def _bind(self, request):
+        request.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        return request_id.set(request.request_id)
+
+
+def current_trace_id() -> Optional[str]:
+    """The id of the sampled trace the caller is in, to find its spans from a log line."""
+    span_context = trace.get_current_span().get_span_context()
+    return format(span_context.trace_id, "032x") if span_context.trace_flags.sampled else None
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        # django.request logs errors after the middleware returned, with the request.
+        record.request_id = request_id.get() or getattr(
+            getattr(record, "request", None), "request_id", None
+        )
+        record.trace_id = current_trace_id()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps the given fraction of records per level name, e.g. {"DEBUG": 0.01} or
+    {"debug": 0.01}. Levels not listed are always kept, so warnings and errors are
+    never dropped unless configured to be.
+    """
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.rates = {
+            logging.getLevelName(level.upper()): rate for level, rate in (rates or {}).items()
+        }
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        if trace_id := getattr(record, "trace_id", None):
+            entry["trace_id"] = trace_id
+        if record.exc_info:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class QueueStreamHandler(QueueHandler):
+    """
+    Hands records to a background thread that formats them as JSON and writes them
+    to stdout, so the logging call only pays for a queue put. When the queue is
+    full, records are dropped rather than blocking the request; how many is
+    logged once there is room again, and at exit.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        self.reported = 0
+        self.target = logging.StreamHandler(sys.stdout)
+        self.target.setFormatter(JsonFormatter())
+        self._start()
+        atexit.register(self._stop)
+        # A forked worker, gunicorn or Celery prefork, inherits the handler but not the thread.
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self) -> None:
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def _stop(self) -> None:
+        self.listener.stop()
+        if self.dropped > self.reported:
+            self.target.handle(self._dropped_record())
+            self.reported = self.dropped
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args and render the traceback now: the listener formats later, and
+        # arguments may have changed by then.
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped > self.reported:
+            # Room again: say how many lines are missing before the ones that follow.
+            try:
+                self.queue.put_nowait(self._dropped_record())
+            except queue.Full:
+                return
+            self.reported = self.dropped
+
+    def _dropped_record(self) -> logging.LogRecord:
+        return logging.LogRecord(
+            __name__,
+            logging.WARNING,
+            __file__,
+            0,
+            f"Dropped {self.dropped - self.reported} log records: the log queue was full",
+            None,
+            None,
+        )
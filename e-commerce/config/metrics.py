@@ -0,0 +1,137 @@
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# With PROMETHEUS_MULTIPROC_DIR set (see the entrypoint), every gunicorn worker
+# writes its samples to files there and /metrics on any worker reports the sum.
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time to serve a request, by route pattern.",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests being served.", multiprocess_mode="livesum"
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds",
+    "Time per database query, by connection alias (primary or replica).",
+    ["alias"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result: l1_hit, hit or miss.",
+    ["cache", "result"],
+)
+CELERY_PUBLISH_LATENCY = Histogram(
+    "celery_publish_duration_seconds",
+    "Time to publish a task and get the broker's confirm.",
+    ["task"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5),
+)
+OUTBOX_DELAY = Histogram(
+    "outbox_delay_seconds",
+    "Time from writing a task to the outbox until it is published.",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+PASSWORD_HASHES_IN_FLIGHT = Gauge(
+    "password_hashes_in_flight",
+    "Password hashes running or queued on the hashing pool.",
+    multiprocess_mode="livesum",
+)
+PASSWORD_HASH_LATENCY = Histogram(
+    "password_hash_duration_seconds",
+    "Time to hash a password, queueing for the pool included.",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+
+def _time_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        DB_QUERY_LATENCY.labels(context["connection"].alias).observe(time.perf_counter() - started)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    # Installed once per connection instead of wrapped around every request.
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+connection_created.connect(instrument_connection, dispatch_uid="metrics.instrument_connection")
+
+
+class MetricsMiddleware:
+    """
+    Records latency per route pattern (api/core/orders/<int:pk>, not every order
+    id) and the number of requests in flight. Works under WSGI and ASGI without
+    being adapted to the other mode.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = self._start()
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            self._finish(request, response, started)
+
+    async def __acall__(self, request):
+        started = self._start()
+        response = None
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            self._finish(request, response, started)
+
+    def _start(self) -> float:
+        REQUESTS_IN_FLIGHT.inc()
+        return time.perf_counter()
+
+    def _finish(self, request, response, started: float) -> None:
+        REQUESTS_IN_FLIGHT.dec()
+        match = request.resolver_match
+        REQUEST_LATENCY.labels(
+            request.method,
+            match.route if match else "unmatched",
+            response.status_code if response is not None else 500,
+        ).observe(time.perf_counter() - started)
+
+
+def metrics_view(request):
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
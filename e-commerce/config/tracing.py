@@ -0,0 +1,168 @@
+import functools
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from config.log import get_request_id
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, StatusCode
+
+# A no-op tracer until configure_tracing() installs a provider.
+tracer = trace.get_tracer("e-commerce")
+
+SQL_MAX_LENGTH = 2000
+
+
+def configure_tracing() -> None:
+    exporter = settings.TRACING_EXPORTER
+    if exporter == "none":
+        return
+    if exporter == "otlp":
+        # Endpoint from OTEL_EXPORTER_OTLP_ENDPOINT, as for any OpenTelemetry SDK.
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        span_exporter = OTLPSpanExporter()
+    elif exporter == "file":
+        span_exporter = file_exporter(settings.TRACING_FILE)
+    else:
+        raise ValueError(f"Unknown TRACING_EXPORTER: {exporter}")
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": settings.TRACING_SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(settings.TRACING_SAMPLE_RATIO)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    trace.set_tracer_provider(provider)
+
+
+def file_exporter(path: str) -> ConsoleSpanExporter:
+    """Writes finished spans to path as JSON lines, standing in for a collector locally."""
+    return ConsoleSpanExporter(
+        out=open(path, "a", buffering=1), formatter=lambda span: span.to_json(indent=None) + "\n"
+    )
+
+
+def traced(name: str):
+    """Runs the function in a child span of the current one, if that is sampled."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not trace.get_current_span().is_recording():
+                return func(*args, **kwargs)
+            with tracer.start_as_current_span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _trace_query(execute, sql, params, many, context):
+    if not trace.get_current_span().is_recording():
+        return execute(sql, params, many, context)
+    connection = context["connection"]
+    operation = sql.split(None, 1)[0].upper() if sql else "QUERY"
+    with tracer.start_as_current_span(
+        f"{operation} {connection.alias}",
+        kind=SpanKind.CLIENT,
+        attributes={
+            "db.system": connection.vendor,
+            "db.alias": connection.alias,
+            "db.statement": sql[:SQL_MAX_LENGTH],
+        },
+    ):
+        return execute(sql, params, many, context)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    if _trace_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_trace_query)
+
+
+connection_created.connect(instrument_connection, dispatch_uid="tracing.instrument_connection")
+
+
+def inject_context(headers: dict) -> None:
+    """Adds the current trace context (traceparent) to task headers."""
+    propagate.inject(headers)
+
+
+@contextmanager
+def publish_span(task_name: str, queue: str, headers: dict) -> Iterator[dict]:
+    """
+    A producer span for publishing a task, in the trace its headers were written
+    in. Yields the headers to publish with, pointing the consumer at this span.
+    """
+    parent = propagate.extract(headers)
+    span_context = trace.get_current_span(parent).get_span_context()
+    if not span_context.trace_flags.sampled:
+        # Not sampled, or written outside a trace: the consumer starts its own.
+        yield headers
+        return
+    with tracer.start_as_current_span(
+        f"publish {task_name}",
+        context=parent,
+        kind=SpanKind.PRODUCER,
+        attributes={"messaging.system": "rabbitmq", "messaging.destination.name": queue},
+    ):
+        headers = dict(headers)
+        propagate.inject(headers)
+        yield headers
+
+
+class TracingMiddleware:
+    """
+    A server span per request, continuing the caller's trace if it sent a
+    traceparent header. Named after the route pattern once the URL is resolved.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with self._span(request) as span:
+            response = self.get_response(request)
+            self._finish(span, request, response)
+        return response
+
+    async def __acall__(self, request):
+        with self._span(request) as span:
+            response = await self.get_response(request)
+            self._finish(span, request, response)
+        return response
+
+    def _span(self, request):
+        return tracer.start_as_current_span(
+            request.method,
+            context=propagate.extract(request.headers),
+            kind=SpanKind.SERVER,
+            attributes={"http.request.method": request.method, "url.path": request.path},
+        )
+
+    def _finish(self, span, request, response) -> None:
+        if not span.is_recording():
+            return
+        match = request.resolver_match
+        route: Optional[str] = match.route if match else None
+        if route:
+            span.update_name(f"{request.method} {route}")
+            span.set_attribute("http.route", route)
+        span.set_attribute("http.response.status_code", response.status_code)
+        if request_id := get_request_id():
+            span.set_attribute("request_id", request_id)
+        if response.status_code >= 500:
+            span.set_status(StatusCode.ERROR)
@@ -14,6 +14,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from config.metrics import metrics_view
 from debug_toolbar.toolbar import debug_toolbar_urls
 from django.conf import settings
 from django.contrib import admin
@@ -25,7 +26,9 @@ urlpatterns = (
     [
         path("admin/", admin.site.urls),
         path("health-check/", lambda _: HttpResponse("OK")),
+        path("metrics", metrics_view),
         path("api/core/", include("apps.core.api.urls")),
+        path("api/async/core/", include("apps.core.api.async_urls")),
         path("api/auth/", include("apps.authentication.urls", namespace="authentication")),
     ]
     + staticfiles_urlpatterns()
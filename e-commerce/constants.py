@@ -1,4 +1,6 @@
 CANNOT_ADD_PRODUCT = "Cannot add product, order is not in CREATED status"
 CANNOT_REMOVE_PRODUCT = "Cannot remove product, order is not in CREATED status"
+CANNOT_CHANGE_PRODUCTS = "Cannot change products, order is not in CREATED status"
 WRONG_SEQUENCE = "Wrong sequence of actions"
 EMPTY_ORDER = "Cannot pay for an empty order"
+OUT_OF_STOCK = "Not enough stock for products: {product_ids}"
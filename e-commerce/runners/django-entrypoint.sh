@@ -32,21 +32,43 @@ until postgres_is_not_ready; do
 done
 >&2 echo 'PostgreSQL is available'
 
+# Auxiliary services run a management command instead of the web server.
+if [ "$#" -gt 0 ]; then
+  exec "$@"
+fi
+
 NUM_WORKERS=${NUM_WORKERS:-1}
 TIMEOUT=${TIMEOUT:-180}
 
 
 python manage.py collectstatic --no-input
 python manage.py migrate
+# Best effort: a cold cache only slows the first requests, so never block startup on it.
+python manage.py warm_catalog_cache || >&2 echo 'Warming the catalog cache failed, starting cold'
+
+# Workers share metrics through files here; samples of earlier runs are stale.
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# "wsgi" serves the sync API on gevent, "asgi" adds uvicorn for the async views.
+SERVER_MODE=${SERVER_MODE:-wsgi}
 
-gunicorn config.wsgi:application \
+if [ "$SERVER_MODE" = "asgi" ]; then
+  APPLICATION=config.asgi:application
+  WORKER_CLASS=uvicorn.workers.UvicornWorker
+else
+  APPLICATION=config.wsgi:application
+  WORKER_CLASS=gevent
+fi
+
+gunicorn $APPLICATION \
+        --config config/gunicorn.py \
         --reload \
         --workers $NUM_WORKERS \
         --timeout $TIMEOUT \
         --keep-alive 1 \
         --bind 0.0.0.0:8000 \
-        --log-level=debug \
+        --log-level=${LOG_LEVEL:-info} \
         --log-file=- \
-        -k gevent
-
-exec "$@"
+        -k $WORKER_CLASS
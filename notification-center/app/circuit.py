@@ -0,0 +1,53 @@
+import os
+import time
+
+from dotenv import load_dotenv
+
+from .store import redis_client
+
+load_dotenv()
+
+SMS_CIRCUIT_FAILURES = int(os.getenv("SMS_CIRCUIT_FAILURES", "5"))
+SMS_CIRCUIT_WINDOW = int(os.getenv("SMS_CIRCUIT_WINDOW", "30"))
+SMS_CIRCUIT_COOLDOWN = int(os.getenv("SMS_CIRCUIT_COOLDOWN", "30"))
+# How long a worker trusts its last look at the shared circuit state.
+CHECK_INTERVAL = 1.0
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker shared by every worker through Redis.
+
+    failures retryable errors within window seconds open the circuit for cooldown
+    seconds, during which calls fail fast instead of waiting on a degraded
+    provider. When it expires, traffic resumes and the next failures reopen it.
+    Successful calls never touch Redis.
+    """
+
+    def __init__(self, name: str, failures: int, window: int, cooldown: int):
+        self.failures = failures
+        self.window = window
+        self.cooldown = cooldown
+        self.failures_key = f"notify:circuit:{name}:failures"
+        self.open_key = f"notify:circuit:{name}:open"
+        self._open_until = 0.0
+        self._checked_at = float("-inf")
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        if now - self._checked_at >= CHECK_INTERVAL:
+            ttl = redis_client.pttl(self.open_key)
+            self._open_until = now + ttl / 1000 if ttl > 0 else 0.0
+            self._checked_at = now
+        return now >= self._open_until
+
+    def record_failure(self) -> None:
+        failures = redis_client.incr(self.failures_key)
+        if failures == 1:
+            redis_client.expire(self.failures_key, self.window)
+        if failures >= self.failures:
+            with redis_client.pipeline() as pipe:
+                pipe.set(self.open_key, 1, ex=self.cooldown)
+                pipe.delete(self.failures_key)
+                pipe.execute()
+            self._open_until = time.monotonic() + self.cooldown
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from .store import redis_client
+
+load_dotenv()
+
+SMS_COALESCE_WINDOW = float(os.getenv("SMS_COALESCE_WINDOW", "5"))
+SMS_DEDUP_WINDOW = int(os.getenv("SMS_DEDUP_WINDOW", "600"))
+# Messages are merged into one SMS only up to this many characters; Twilio's limit.
+SMS_MAX_MERGED_LENGTH = int(os.getenv("SMS_MAX_MERGED_LENGTH", "1600"))
+# Seconds a flush has to deliver what it took before another flush takes it over.
+SMS_FLUSH_LEASE = int(os.getenv("SMS_FLUSH_LEASE", "300"))
+
+# One hash tag puts every coalescing key in the same Redis Cluster slot, so each
+# script can touch several of them. Scripts only use keys passed in KEYS.
+DUE_KEY = "notify:{coalesce}:due"
+BUFFER_PREFIX = "notify:{coalesce}:buffer:"
+DEDUP_PREFIX = "notify:{coalesce}:dedup:"
+# Flushes that took buffers and have not acknowledged delivering them, by lease deadline.
+IN_FLIGHT_KEY = "notify:{coalesce}:in-flight"
+IN_FLIGHT_PREFIX = "notify:{coalesce}:in-flight:"
+
+# KEYS: dedup, buffer, due. ARGV: dedup ttl, message, deadline, member, buffer ttl.
+_buffer_script = redis_client.register_script(
+    """
+    if not redis.call('SET', KEYS[1], 1, 'NX', 'EX', ARGV[1]) then
+        return 0
+    end
+    redis.call('RPUSH', KEYS[2], ARGV[2])
+    redis.call('EXPIRE', KEYS[2], ARGV[5])
+    redis.call('ZADD', KEYS[3], 'NX', ARGV[3], ARGV[4])
+    return 1
+    """
+)
+
+# Moves due buffers into the flush's in-flight hash, one field per member holding
+# its messages joined by newlines, and leases the flush. Members another flush
+# took first are skipped.
+# KEYS: due, in-flight, flush, then one buffer per member.
+# ARGV: now, lease deadline, flush id, flush ttl, then the members.
+_take_due_script = redis_client.register_script(
+    """
+    local taken = {}
+    for i = 4, #KEYS do
+        local member = ARGV[i + 1]
+        local due_at = redis.call('ZSCORE', KEYS[1], member)
+        if due_at and tonumber(due_at) <= tonumber(ARGV[1]) then
+            redis.call('ZREM', KEYS[1], member)
+            local entries = redis.call('LRANGE', KEYS[i], 0, -1)
+            redis.call('DEL', KEYS[i])
+            if #entries > 0 then
+                local joined = table.concat(entries, '\\n')
+                redis.call('HSET', KEYS[3], member, joined)
+                taken[#taken + 1] = member
+                taken[#taken + 1] = joined
+            end
+        end
+    end
+    if #taken > 0 then
+        redis.call('EXPIRE', KEYS[3], ARGV[4])
+        redis.call('ZADD', KEYS[2], ARGV[2], ARGV[3])
+    end
+    return taken
+    """
+)
+
+# Renews the lease of a flush whose lease ran out and returns what it took.
+# KEYS: in-flight, flush. ARGV: now, lease deadline, flush id.
+_reclaim_script = redis_client.register_script(
+    """
+    local lease = redis.call('ZSCORE', KEYS[1], ARGV[3])
+    if not lease or tonumber(lease) > tonumber(ARGV[1]) then
+        return nil
+    end
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3])
+    return redis.call('HGETALL', KEYS[2])
+    """
+)
+
+Batches = Dict[Tuple[str, str], Dict[str, List[str]]]
+
+
+def buffer_message(sender: str, number: str, message: str, notification_id: str) -> bool:
+    """
+    Adds message to the number's buffer, to be sent SMS_COALESCE_WINDOW seconds
+    after the first buffered message. Returns False, buffering nothing, if the
+    same message went to the number within SMS_DEDUP_WINDOW seconds.
+    """
+    member = f"{sender}:{number}"
+    digest = hashlib.sha1(message.encode()).hexdigest()
+    return bool(
+        _buffer_script(
+            keys=[f"{DEDUP_PREFIX}{member}:{digest}", f"{BUFFER_PREFIX}{member}", DUE_KEY],
+            args=[
+                SMS_DEDUP_WINDOW,
+                json.dumps([notification_id, message]),
+                time.time() + SMS_COALESCE_WINDOW,
+                member,
+                # Outlives the window so a late flush still finds the messages.
+                int(SMS_COALESCE_WINDOW) + SMS_DEDUP_WINDOW,
+            ],
+        )
+    )
+
+
+def take_due(limit: int) -> Tuple[int, str, Batches]:
+    """
+    Takes up to limit buffers whose window has closed. Returns how many were due,
+    an id to acknowledge() once they are delivered, and the numbers grouped by
+    (sender, merged message), each with the ids of the notifications merged into
+    its SMS. Messages that landed in the same window are merged in arrival order,
+    so the latest status comes last. Taken buffers that are not acknowledged
+    within SMS_FLUSH_LEASE seconds are handed out again by take_expired().
+    """
+    now = time.time()
+    members = [
+        member.decode()
+        for member in redis_client.zrangebyscore(DUE_KEY, "-inf", now, start=0, num=limit)
+    ]
+    if not members:
+        return 0, "", {}
+    flush_id = uuid.uuid4().hex
+    taken = _take_due_script(
+        keys=[
+            DUE_KEY,
+            IN_FLIGHT_KEY,
+            f"{IN_FLIGHT_PREFIX}{flush_id}",
+            *(f"{BUFFER_PREFIX}{member}" for member in members),
+        ],
+        args=[now, now + SMS_FLUSH_LEASE, flush_id, _flush_ttl(), *members],
+    )
+    return len(members), flush_id, _batches(zip(taken[::2], taken[1::2]))
+
+
+def take_expired() -> Optional[Tuple[str, Batches]]:
+    """
+    Takes over the oldest flush that did not acknowledge its buffers in time,
+    most likely because its worker died. Returns its id and batches, as
+    take_due() does, or None if there is none.
+    """
+    now = time.time()
+    for flush_id in redis_client.zrangebyscore(IN_FLIGHT_KEY, "-inf", now, start=0, num=1):
+        flush_id = flush_id.decode()
+        taken = _reclaim_script(
+            keys=[IN_FLIGHT_KEY, f"{IN_FLIGHT_PREFIX}{flush_id}"],
+            args=[now, now + SMS_FLUSH_LEASE, flush_id],
+        )
+        if taken is not None:
+            return flush_id, _batches(zip(taken[::2], taken[1::2]))
+    return None
+
+
+def acknowledge(flush_id: str) -> None:
+    """Drops the buffers of a flush once delivered, outcomes recorded."""
+    with redis_client.pipeline(transaction=False) as pipe:
+        pipe.zrem(IN_FLIGHT_KEY, flush_id)
+        pipe.delete(f"{IN_FLIGHT_PREFIX}{flush_id}")
+        pipe.execute()
+
+
+def _flush_ttl() -> int:
+    # Expires flushes nobody came back for, long after any reclaim would have.
+    return SMS_FLUSH_LEASE + int(SMS_COALESCE_WINDOW) + SMS_DEDUP_WINDOW
+
+
+def _batches(taken: Iterable[Tuple[bytes, bytes]]) -> Batches:
+    batches = defaultdict(dict)
+    for member, joined in taken:
+        sender, number = member.decode().split(":", 1)
+        entries = [json.loads(entry) for entry in joined.decode().split("\n")]
+        for merged, notification_ids in _merge(entries):
+            batches[(sender, merged)][number] = notification_ids
+    return batches
+
+
+def _merge(entries: List[List[str]]) -> List[Tuple[str, List[str]]]:
+    """
+    Joins messages in order into SMS of at most SMS_MAX_MERGED_LENGTH characters,
+    each with the ids of its notifications. A longer message goes out on its own.
+    """
+    merged = []
+    for notification_id, message in entries:
+        if merged and len(merged[-1][0]) + 1 + len(message) <= SMS_MAX_MERGED_LENGTH:
+            text, notification_ids = merged[-1]
+            merged[-1] = (f"{text}\n{message}", notification_ids + [notification_id])
+        else:
+            merged.append((message, [notification_id]))
+    return [(text, list(dict.fromkeys(notification_ids))) for text, notification_ids in merged]
@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from dotenv import load_dotenv
+
+from .store import redis_client
+
+load_dotenv()
+
+NOTIFICATION_LEDGER_TTL = int(os.getenv("NOTIFICATION_LEDGER_TTL", str(7 * 24 * 3600)))
+NOTIFICATION_LEDGER_BATCH_SIZE = int(os.getenv("NOTIFICATION_LEDGER_BATCH_SIZE", "500"))
+NOTIFICATION_CACHE_TIMEOUT = float(os.getenv("NOTIFICATION_CACHE_TIMEOUT", "2"))
+NOTIFICATION_FINAL_CACHE_TIMEOUT = float(os.getenv("NOTIFICATION_FINAL_CACHE_TIMEOUT", "60"))
+
+QUEUED = "queued"
+SENT = "sent"
+FAILED = "failed"
+DUPLICATE = "duplicate"
+STATUSES = {"q": QUEUED, "s": SENT, "f": FAILED, "d": DUPLICATE}
+STATUS_CODES = {status: code for code, status in STATUSES.items()}
+MAX_DETAIL_LENGTH = 200
+
+# One hash of number -> "<status code>:<message id or error>" per notification, and
+# one beside it counting its numbers and their outcomes. Each number is counted
+# once, however often a request lists it: total is the size of the hash.
+# KEYS: results, summary. ARGV: ttl, then the numbers.
+_expect_script = redis_client.register_script(
+    """
+    local added = 0
+    for i = 2, #ARGV do
+        added = added + redis.call('HSETNX', KEYS[1], ARGV[i], 'q:')
+    end
+    redis.call('HINCRBY', KEYS[2], 'total', added)
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+    redis.call('EXPIRE', KEYS[2], ARGV[1])
+    """
+)
+
+# A redelivered outcome, or one for a number listed twice, replaces the earlier one.
+# KEYS: results, summary. ARGV: number, value, status, ttl.
+_record_script = redis_client.register_script(
+    """
+    local previous = redis.call('HGET', KEYS[1], ARGV[1])
+    if not previous then
+        redis.call('HINCRBY', KEYS[2], 'total', 1)
+    elseif string.sub(previous, 1, 1) ~= 'q' then
+        redis.call('HINCRBY', KEYS[2], string.sub(previous, 1, 1), -1)
+    end
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    redis.call('HINCRBY', KEYS[2], ARGV[3], 1)
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    redis.call('EXPIRE', KEYS[2], ARGV[4])
+    """
+)
+
+
+def results_key(notification_id: str) -> str:
+    return f"notify:ledger:{notification_id}"
+
+
+def summary_key(notification_id: str) -> str:
+    return f"notify:ledger:{notification_id}:summary"
+
+
+def expect(notification_id: str, numbers: Iterable[str]) -> None:
+    """
+    Lists numbers as recipients of a notification, queued until their outcome is
+    recorded. Bulk uploads call it chunk by chunk. Numbers already listed, by an
+    earlier chunk or a redelivered task, are not counted again.
+    """
+    _expect_script(
+        keys=[results_key(notification_id), summary_key(notification_id)],
+        args=[NOTIFICATION_LEDGER_TTL, *numbers],
+    )
+
+
+class LedgerWriter:
+    """Buffers per-recipient outcomes and writes them in pipelined batches."""
+
+    def __init__(self, batch_size: int = NOTIFICATION_LEDGER_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def record(self, notification_id: str, number: str, status: str, detail: str = "") -> None:
+        self.pending.append((notification_id, number, STATUS_CODES[status], detail))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def record_results(self, notification_ids, successes, failures) -> None:
+        """Records send results; notification_ids maps each number to its notifications."""
+        for success in successes:
+            for notification_id in notification_ids[success["number"]]:
+                self.record(notification_id, success["number"], SENT, success["message_id"])
+        for failure in failures:
+            for notification_id in notification_ids[failure["number"]]:
+                self.record(notification_id, failure["number"], FAILED, failure["error"])
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        with redis_client.pipeline(transaction=False) as pipe:
+            for notification_id, number, code, detail in self.pending:
+                _record_script(
+                    keys=[results_key(notification_id), summary_key(notification_id)],
+                    args=[
+                        number,
+                        f"{code}:{detail[:MAX_DETAIL_LENGTH]}",
+                        code,
+                        NOTIFICATION_LEDGER_TTL,
+                    ],
+                    client=pipe,
+                )
+            pipe.execute()
+        self.pending = []
+
+
+class TTLCache:
+    """Small in-process cache for ledger reads, which clients tend to poll."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            expires_at, value = self._entries.get(key, (0, None))
+            return value if expires_at > time.monotonic() else None
+
+    def set(self, key, value, timeout: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+_read_cache = TTLCache()
+
+
+def read_notification(notification_id: str, cursor: int = 0, count: int = 100) -> Optional[dict]:
+    """
+    Returns the status counts of a notification and one page of per-recipient
+    results, or None if it is unknown or expired. Pages are cached briefly while
+    recipients are still queued and longer once every outcome is in.
+    """
+    key = (notification_id, cursor, count)
+    if (cached := _read_cache.get(key)) is not None:
+        return cached
+
+    with redis_client.pipeline(transaction=False) as pipe:
+        pipe.hgetall(summary_key(notification_id))
+        pipe.hscan(results_key(notification_id), cursor, count=count)
+        summary, (next_cursor, page) = pipe.execute()
+    if not summary:
+        return None
+
+    total = int(summary.get(b"total", 0))
+    outcomes = {
+        status: int(summary.get(code.encode(), 0))
+        for code, status in STATUSES.items()
+        if status != QUEUED
+    }
+    counts = {QUEUED: max(total - sum(outcomes.values()), 0), **outcomes}
+    results = []
+    for number, value in page.items():
+        code, detail = value.decode().split(":", 1)
+        result = {"number": number.decode(), "status": STATUSES[code]}
+        if code == STATUS_CODES[SENT]:
+            result["message_id"] = detail
+        elif code == STATUS_CODES[FAILED]:
+            result["error"] = detail
+        results.append(result)
+
+    data = {
+        "id": notification_id,
+        "total": total,
+        **counts,
+        "results": results,
+        "next_cursor": next_cursor or None,
+    }
+    final = data[QUEUED] == 0
+    data["final"] = final
+    _read_cache.set(
+        key, data, NOTIFICATION_FINAL_CACHE_TIMEOUT if final else NOTIFICATION_CACHE_TIMEOUT
+    )
+    return data
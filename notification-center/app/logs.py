@@ -0,0 +1,198 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from celery.signals import before_task_publish, setup_logging, task_postrun, task_prerun
+from dotenv import load_dotenv
+from opentelemetry import trace
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Fraction of lines kept per level, e.g. "DEBUG=0.01,INFO=0.1". Unlisted levels keep all.
+LOG_SAMPLE_RATES = {
+    level.strip().upper(): float(rate)
+    for level, rate in (
+        item.split("=", 1) for item in os.getenv("LOG_SAMPLE_RATES", "").split(",") if item
+    )
+}
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# The e-commerce request, or API call, a task was sent for. Set from the task
+# headers while it runs and passed on to the tasks it sends.
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    """The id of the sampled trace the caller is in, to find its spans from a log line."""
+    span_context = trace.get_current_span().get_span_context()
+    return format(span_context.trace_id, "032x") if span_context.trace_flags.sampled else None
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        record.trace_id = current_trace_id()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps the given fraction of records per level name, e.g. {"DEBUG": 0.01} or
+    {"debug": 0.01}. Levels not listed are always kept, so warnings and errors are
+    never dropped unless configured to be.
+    """
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.rates = {
+            logging.getLevelName(level.upper()): rate for level, rate in (rates or {}).items()
+        }
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        if trace_id := getattr(record, "trace_id", None):
+            entry["trace_id"] = trace_id
+        if record.exc_info:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class QueueStreamHandler(QueueHandler):
+    """
+    Hands records to a background thread that formats them as JSON and writes them
+    to stdout, so the logging call only pays for a queue put. When the queue is
+    full, records are dropped rather than blocking the request; how many is
+    logged once there is room again, and at exit.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        self.reported = 0
+        self.target = logging.StreamHandler(sys.stdout)
+        self.target.setFormatter(JsonFormatter())
+        self._start()
+        atexit.register(self._stop)
+        # A forked worker, gunicorn or Celery prefork, inherits the handler but not the thread.
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self) -> None:
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def _stop(self) -> None:
+        self.listener.stop()
+        if self.dropped > self.reported:
+            self.target.handle(self._dropped_record())
+            self.reported = self.dropped
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args and render the traceback now: the listener formats later, and
+        # arguments may have changed by then.
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped > self.reported:
+            # Room again: say how many lines are missing before the ones that follow.
+            try:
+                self.queue.put_nowait(self._dropped_record())
+            except queue.Full:
+                return
+            self.reported = self.dropped
+
+    def _dropped_record(self) -> logging.LogRecord:
+        return logging.LogRecord(
+            __name__,
+            logging.WARNING,
+            __file__,
+            0,
+            f"Dropped {self.dropped - self.reported} log records: the log queue was full",
+            None,
+            None,
+        )
+
+
+_configured = False
+
+
+def configure_logging() -> None:
+    """Sends every logger, uvicorn's and Celery's included, through one JSON handler."""
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    handler = QueueStreamHandler(LOG_QUEUE_SIZE)
+    handler.addFilter(SamplingFilter(LOG_SAMPLE_RATES))
+    handler.addFilter(RequestIdFilter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL)
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logger = logging.getLogger(name)
+        logger.handlers = []
+        logger.propagate = True
+    # One line per provider call otherwise; outcomes are logged by the tasks.
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+@setup_logging.connect
+def on_setup_logging(**kwargs):
+    # Connected, so Celery leaves the root logger to us.
+    configure_logging()
+
+
+@task_prerun.connect
+def on_task_prerun(task, **kwargs):
+    task.request.request_id_token = request_id.set(getattr(task.request, "request_id", None))
+
+
+@task_postrun.connect
+def on_task_postrun(task, **kwargs):
+    token = getattr(task.request, "request_id_token", None)
+    if token is not None:
+        request_id.reset(token)
+
+
+@before_task_publish.connect
+def on_before_task_publish(headers, **kwargs):
+    current = request_id.get()
+    if current and "request_id" not in headers:
+        headers["request_id"] = current
@@ -1,13 +1,53 @@
-from typing import List
+import os
+import uuid
+from typing import AsyncIterator, List
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field, field_validator
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, ValidationError, field_validator
 
-from .tasks import send_notification_task
+from .ledger import (
+    NOTIFICATION_CACHE_TIMEOUT,
+    NOTIFICATION_FINAL_CACHE_TIMEOUT,
+    expect,
+    read_notification,
+)
+from .logs import REQUEST_ID_HEADER, configure_logging, request_id
+from .queues import queue_depths
+from .sms_senders import SMS_SENDERS
+from .tasks import send_bulk_notification_task, send_notification_task
+
+load_dotenv()
+configure_logging()
+
+SMS_BULK_BATCH_SIZE = int(os.getenv("SMS_BULK_BATCH_SIZE", "1000"))
+SMS_BULK_MAX_LINE = int(os.getenv("SMS_BULK_MAX_LINE", "4096"))
+SMS_BULK_MAX_ERRORS = 100
 
 app = FastAPI(title="Notification Center API")
 
 
+@app.middleware("http")
+async def bind_request_id(request: Request, call_next):
+    # Tasks sent while handling the request carry the ID in their headers.
+    current = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    token = request_id.set(current)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id.reset(token)
+    response.headers[REQUEST_ID_HEADER] = current
+    return response
+
+
+def validate_phone_number(number: str) -> str:
+    if not number.startswith("+") or not number[1:].isdigit():
+        raise ValueError(f"Invalid phone number format: {number}")
+    return number
+
+
 class NotificationRequest(BaseModel):
     phone_numbers: List[str] = Field(..., example=["+1234567890", "+0987654321"])
     message: str = Field(..., example="Your verification code is 123456")
@@ -18,15 +58,156 @@ class NotificationRequest(BaseModel):
         if not v:
             raise ValueError("At least one phone number must be provided")
         for number in v:
-            if not number.startswith("+") or not number[1:].isdigit():
-                raise ValueError(f"Invalid phone number format: {number}")
+            validate_phone_number(number)
         return v
 
+    @field_validator("sender")
+    def validate_sender(cls, v):
+        if v not in SMS_SENDERS:
+            raise ValueError(f"Unsupported sender: {v}")
+        return v
+
+
+class BulkRecord(BaseModel):
+    phone: str
+    message: str = Field(..., min_length=1)
+
+    @field_validator("phone")
+    def validate_phone(cls, v):
+        return validate_phone_number(v)
+
+
+class LineTooLong(Exception):
+    pass
+
+
+async def iter_lines(request: Request) -> AsyncIterator[bytes]:
+    """
+    Yields the request body line by line as it arrives. Raises LineTooLong at the
+    first line longer than SMS_BULK_MAX_LINE, without reading the rest of it.
+    """
+    pending = b""
+    async for chunk in request.stream():
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            if len(line) > SMS_BULK_MAX_LINE:
+                raise LineTooLong
+            yield line
+        if len(pending) > SMS_BULK_MAX_LINE:
+            raise LineTooLong
+    yield pending
+
 
 @app.post("/send-notification", summary="Send SMS Notifications")
 async def send_notification(notification: NotificationRequest):
     try:
-        task = send_notification_task.delay(notification.dict())
+        task_id = str(uuid.uuid4())
+        await run_in_threadpool(expect, task_id, notification.phone_numbers)
+        task = await run_in_threadpool(
+            send_notification_task.apply_async, (notification.dict(),), task_id=task_id
+        )
         return {"task_id": task.id, "status": "queued"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post(
+    "/send-notification/bulk",
+    status_code=202,
+    summary="Send SMS Notifications in Bulk",
+    description=(
+        "Streams an NDJSON body of {phone, message} records into batched tasks without "
+        "buffering it. Invalid records are skipped and reported by line number. A line "
+        "over the maximum length ends the upload with a 413 that still carries the "
+        "batch_id: the records before it are queued, none after it."
+    ),
+)
+async def send_bulk_notification(request: Request, sender: str = Query("twilio")):
+    if sender not in SMS_SENDERS:
+        raise HTTPException(status_code=422, detail=f"Unsupported sender: {sender}")
+
+    batch_id = uuid.uuid4().hex
+    batch = []
+    accepted = rejected = tasks = 0
+    errors = []
+
+    async def enqueue():
+        await run_in_threadpool(expect, batch_id, [number for number, _ in batch])
+        await run_in_threadpool(send_bulk_notification_task.delay, batch_id, sender, batch)
+
+    line_number = 0
+    too_long = None
+    try:
+        async for line in iter_lines(request):
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                record = BulkRecord.model_validate_json(line)
+            except ValidationError as e:
+                rejected += 1
+                if len(errors) < SMS_BULK_MAX_ERRORS:
+                    message = e.errors(include_url=False)[0]["msg"]
+                    errors.append({"line": line_number, "error": message})
+                continue
+
+            batch.append((record.phone, record.message))
+            accepted += 1
+            if len(batch) >= SMS_BULK_BATCH_SIZE:
+                await enqueue()
+                batch = []
+                tasks += 1
+    except LineTooLong:
+        too_long = line_number + 1
+
+    if batch:
+        await enqueue()
+        tasks += 1
+
+    result = {
+        "batch_id": batch_id,
+        "status": "queued",
+        "accepted": accepted,
+        "rejected": rejected,
+        "tasks": tasks,
+        "errors": errors,
+    }
+    if too_long is not None:
+        # Earlier batches are already on their way: tell the client where to look.
+        detail = f"Line {too_long} exceeds the maximum line length of {SMS_BULK_MAX_LINE} bytes"
+        return JSONResponse({"detail": detail, **result}, status_code=413)
+    return result
+
+
+@app.get(
+    "/notifications/{notification_id}",
+    summary="Get Delivery Status",
+    description=(
+        "Status counts and per-recipient results of a notification, by the task_id of "
+        "a send or the batch_id of a bulk upload. Results are paged with next_cursor."
+    ),
+)
+async def get_notification(
+    notification_id: str,
+    response: Response,
+    cursor: int = Query(0, ge=0),
+    count: int = Query(100, ge=1, le=1000),
+):
+    data = await run_in_threadpool(read_notification, notification_id, cursor, count)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Notification not found")
+    timeout = NOTIFICATION_FINAL_CACHE_TIMEOUT if data["final"] else NOTIFICATION_CACHE_TIMEOUT
+    response.headers["Cache-Control"] = f"max-age={int(timeout)}"
+    return data
+
+
+@app.get(
+    "/queues",
+    summary="Queue Depths",
+    description="Ready messages and consumers of the transactional, bulk and dead-letter queues.",
+)
+async def get_queues():
+    try:
+        return await run_in_threadpool(queue_depths)
+    except OSError as e:
+        raise HTTPException(status_code=503, detail=str(e))
@@ -0,0 +1,31 @@
+from typing import Dict, Optional
+
+from amqp.exceptions import NotFound
+
+from .tasks import BULK_QUEUE, SMS_DEAD_LETTER_QUEUE, TRANSACTIONAL_QUEUE, celery_app
+
+LANES = {
+    "transactional": TRANSACTIONAL_QUEUE,
+    "bulk": BULK_QUEUE,
+    "dead_letter": SMS_DEAD_LETTER_QUEUE,
+}
+
+
+def queue_depths() -> Dict[str, Optional[dict]]:
+    """
+    Ready messages and consumers per lane, read with passive declares so nothing
+    is created. Lanes whose queue does not exist yet report None. Ready messages
+    per consumer of a lane is the signal to scale its worker pool on.
+    """
+    depths = {}
+    with celery_app.connection_for_read() as connection:
+        for lane, queue in LANES.items():
+            # A failed passive declare closes the channel, so each gets its own.
+            with connection.channel() as channel:
+                try:
+                    _, messages, consumers = channel.queue_declare(queue=queue, passive=True)
+                except NotFound:
+                    depths[lane] = None
+                    continue
+            depths[lane] = {"queue": queue, "messages": messages, "consumers": consumers}
+    return depths
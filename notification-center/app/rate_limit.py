@@ -0,0 +1,49 @@
+import time
+
+from .store import redis_client
+
+# Reserves the next token, letting the balance go negative: a caller that finds the
+# bucket empty is told how long until its token is due, rather than coming back to
+# ask again. KEYS: bucket. ARGV: rate, capacity, now.
+_acquire_script = redis_client.register_script(
+    """
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local tokens = tonumber(state[1]) or capacity
+    local updated_at = tonumber(state[2]) or now
+    if now > updated_at then
+        tokens = math.min(capacity, tokens + (now - updated_at) * rate)
+        updated_at = now
+    end
+    tokens = tokens - 1
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(updated_at))
+    redis.call('EXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate) + 1)
+    if tokens >= 0 then
+        return '0'
+    end
+    return tostring(-tokens / rate)
+    """
+)
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every worker through Redis: rate tokens per second, at
+    most capacity banked, for all prefork children of all worker containers
+    together. Each call takes one round trip; workers' clocks are assumed to be
+    in sync, as a clock running behind only refills the bucket later.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.key = f"notify:rate:{name}"
+
+    def acquire(self) -> float:
+        """Takes a token, sleeping until it is due. Returns the seconds slept."""
+        wait = float(_acquire_script(keys=[self.key], args=[self.rate, self.capacity, time.time()]))
+        if wait > 0:
+            time.sleep(wait)
+        return wait
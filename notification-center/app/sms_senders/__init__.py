@@ -1,5 +1,36 @@
-from .twilio import send_sms as send_sms_twilio
+import os
+from typing import Dict, List
 
-SMS_SENDERS = {
-    "twilio": send_sms_twilio,
-}
+from dotenv import load_dotenv
+
+from .base import SmsSender
+from .twilio import twilio_sender
+
+load_dotenv()
+
+SMS_FAILOVER = os.getenv("SMS_FAILOVER", "true").lower() in ("1", "true", "yes")
+
+SMS_SENDERS: Dict[str, SmsSender] = {}
+
+
+def register_sender(sender: SmsSender) -> SmsSender:
+    SMS_SENDERS[sender.name] = sender
+    return sender
+
+
+def get_sender(name: str) -> SmsSender:
+    try:
+        return SMS_SENDERS[name]
+    except KeyError:
+        raise ValueError(f"Unsupported sender: {name}")
+
+
+def failover_order(name: str) -> List[SmsSender]:
+    """The requested sender, then every other registered one unless failover is off."""
+    preferred = get_sender(name)
+    if not SMS_FAILOVER:
+        return [preferred]
+    return [preferred] + [sender for sender in SMS_SENDERS.values() if sender is not preferred]
+
+
+register_sender(twilio_sender)
@@ -0,0 +1,88 @@
+import os
+import threading
+
+import httpx
+from opentelemetry.trace import SpanKind
+
+from ..circuit import SMS_CIRCUIT_COOLDOWN, SMS_CIRCUIT_FAILURES, SMS_CIRCUIT_WINDOW, CircuitBreaker
+from ..rate_limit import TokenBucket
+from ..tracing import tracer
+
+RETRYABLE_STATUS_CODES = {408, 429}
+
+
+class ProviderUnavailable(Exception):
+    """The provider failed in a way worth retrying, or its circuit is open."""
+
+
+class SmsSender:
+    """
+    An SMS provider. Subclasses set name and implement send(), which returns the
+    provider's message id and raises on failure.
+
+    Each sender owns a keep-alive HTTP connection pool, created lazily so every
+    forked worker process gets its own, and a token bucket, shared by all workers
+    through Redis, capping the rate at which they call the provider together.
+    Retryable errors count towards the
+    provider's circuit breaker and are raised as ProviderUnavailable; anything
+    else, such as a rejected number, is raised as is.
+    """
+
+    name: str = ""
+    base_url: str = ""
+
+    def __init__(self, rate: float, burst: int, max_connections: int):
+        self.rate_limit = TokenBucket(self.name, rate, burst)
+        self.circuit = CircuitBreaker(
+            self.name, SMS_CIRCUIT_FAILURES, SMS_CIRCUIT_WINDOW, SMS_CIRCUIT_COOLDOWN
+        )
+        self.max_connections = max_connections
+        self._client = None
+        self._client_pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> httpx.Client:
+        if self._client_pid != os.getpid():
+            with self._lock:
+                if self._client_pid != os.getpid():
+                    self._client = self.create_client()
+                    self._client_pid = os.getpid()
+        return self._client
+
+    def create_client(self) -> httpx.Client:
+        return httpx.Client(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(10.0, connect=3.0),
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+            ),
+        )
+
+    def __call__(self, to_number: str, message: str) -> str:
+        with tracer.start_as_current_span(
+            f"sms.send {self.name}", kind=SpanKind.CLIENT, attributes={"sms.provider": self.name}
+        ) as span:
+            if not self.circuit.allow():
+                span.set_attribute("sms.circuit_open", True)
+                raise ProviderUnavailable(f"{self.name}: circuit open")
+            span.set_attribute("sms.throttled_seconds", self.rate_limit.acquire())
+            try:
+                return self.send(to_number, message)
+            except Exception as e:
+                if not self.is_retryable(e):
+                    raise
+                self.circuit.record_failure()
+                raise ProviderUnavailable(f"{self.name}: {e}") from e
+
+    def is_retryable(self, exc: Exception) -> bool:
+        if isinstance(exc, httpx.TransportError):
+            return True
+        if isinstance(exc, httpx.HTTPStatusError):
+            status_code = exc.response.status_code
+            return status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+        return False
+
+    def send(self, to_number: str, message: str) -> str:
+        raise NotImplementedError
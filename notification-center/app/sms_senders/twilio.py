@@ -1,17 +1,38 @@
 import os
 
 from dotenv import load_dotenv
-from twilio.rest import Client
+
+from .base import SmsSender
 
 load_dotenv()
 
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_FROM_NUMBER = os.getenv("TWILIO_FROM_NUMBER")
+# Messages per second across all workers; the bucket is shared through Redis.
+TWILIO_RATE_LIMIT = float(os.getenv("TWILIO_RATE_LIMIT", "10"))
+TWILIO_BURST = int(os.getenv("TWILIO_BURST", "20"))
+TWILIO_MAX_CONNECTIONS = int(os.getenv("TWILIO_MAX_CONNECTIONS", "32"))
+
+
+class TwilioSender(SmsSender):
+    """Twilio Messages REST API, called directly over the pooled client."""
+
+    name = "twilio"
+    base_url = "https://api.twilio.com/2010-04-01"
+
+    def create_client(self):
+        client = super().create_client()
+        client.auth = (TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        return client
 
-client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    def send(self, to_number: str, message: str) -> str:
+        response = self.client.post(
+            f"/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json",
+            data={"To": to_number, "From": TWILIO_FROM_NUMBER, "Body": message},
+        )
+        response.raise_for_status()
+        return response.json()["sid"]
 
 
-def send_sms(to_number: str, message: str):
-    message = client.messages.create(body=message, from_=TWILIO_FROM_NUMBER, to=to_number)
-    return message.sid
+twilio_sender = TwilioSender(TWILIO_RATE_LIMIT, TWILIO_BURST, TWILIO_MAX_CONNECTIONS)
@@ -0,0 +1,10 @@
+import os
+
+import redis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/1")
+
+redis_client = redis.Redis.from_url(REDIS_URL)
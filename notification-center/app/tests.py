@@ -0,0 +1,625 @@
+import json
+import logging
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+import fakeredis
+import httpx
+from fastapi.testclient import TestClient
+from opentelemetry import trace
+from opentelemetry.trace import NonRecordingSpan, SpanContext, TraceFlags
+from redis.crc import key_slot
+
+from . import logs, store, tracing
+from .circuit import CHECK_INTERVAL
+from .coalesce import DUE_KEY, SMS_FLUSH_LEASE, buffer_message
+from .ledger import DUPLICATE, QUEUED, SENT, LedgerWriter, TTLCache, expect, read_notification
+from .logs import QueueStreamHandler, SamplingFilter
+from .main import app
+from .rate_limit import TokenBucket
+from .sms_senders import SMS_SENDERS
+from .sms_senders.base import ProviderUnavailable, SmsSender
+from .sms_senders.twilio import TwilioSender
+from .tasks import (
+    BULK_QUEUE,
+    SMS_DEAD_LETTER_QUEUE,
+    SMS_MAX_RETRIES,
+    TRANSACTIONAL_QUEUE,
+    celery_app,
+    deliver,
+    flush_notifications_task,
+    retry_delay,
+    retry_notification_task,
+    schedule_flush,
+    send_bulk_notification_task,
+    send_notification_task,
+    send_to_each,
+)
+
+
+class FakeSender(SmsSender):
+    """Records what it sends; numbers in errors fail with the given exception."""
+
+    name = "fake"
+
+    def __init__(self):
+        super().__init__(rate=1000, burst=1000, max_connections=1)
+        self.sent = []
+        self.errors = {}
+
+    def send(self, to_number: str, message: str) -> str:
+        if (error := self.errors.get(to_number)) is not None:
+            raise error
+        self.sent.append((to_number, message))
+        return f"SM{len(self.sent)}"
+
+
+class BackupSender(FakeSender):
+    name = "backup"
+
+
+class RedisTestCase(unittest.TestCase):
+    """Runs against an in-memory Redis, tasks run inline, and FakeSender as the only sender."""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        # Lua scripts are bound to the shared client, so swap what it talks to.
+        for patcher in (
+            mock.patch.object(store.redis_client, "connection_pool", self.redis.connection_pool),
+            mock.patch("app.coalesce.SMS_COALESCE_WINDOW", 0),
+            mock.patch("app.ledger._read_cache", TTLCache()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        celery_app.conf.update(task_always_eager=True, task_eager_propagates=True)
+        self.addCleanup(
+            celery_app.conf.update, task_always_eager=False, task_eager_propagates=False
+        )
+        self.sender = FakeSender()
+        patcher = mock.patch.dict(SMS_SENDERS, {"fake": self.sender}, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TokenBucketTests(RedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = 1_700_000_000.0
+
+        def sleep(seconds):
+            self.now += seconds
+
+        patcher = mock.patch("app.rate_limit.time", time=lambda: self.now, sleep=sleep)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_is_free_then_calls_are_spaced_by_the_rate(self):
+        bucket = TokenBucket("fake", rate=2, capacity=3)
+        started = self.now
+
+        self.assertEqual([bucket.acquire() for _ in range(3)], [0, 0, 0])
+        self.assertEqual(bucket.acquire(), 0.5)
+        self.assertEqual(bucket.acquire(), 0.5)
+        self.assertEqual(self.now - started, 1.0)
+
+    def test_workers_share_one_bucket(self):
+        worker, other_worker = (TokenBucket("fake", rate=1, capacity=1) for _ in range(2))
+        unrelated = TokenBucket("backup", rate=1, capacity=1)
+
+        # Time stands still: all three ask at once and are told when their turn is.
+        with mock.patch("app.rate_limit.time.sleep"):
+            waits = [worker.acquire(), other_worker.acquire(), worker.acquire()]
+
+        self.assertEqual(waits, [0, 1.0, 2.0])
+        self.assertEqual(unrelated.acquire(), 0)
+
+    def test_idle_time_refills_up_to_capacity(self):
+        bucket = TokenBucket("fake", rate=1, capacity=2)
+        bucket.acquire()
+        bucket.acquire()
+
+        self.now += 60
+
+        self.assertEqual([bucket.acquire() for _ in range(2)], [0, 0])
+        self.assertEqual(bucket.acquire(), 1.0)
+
+
+class TwilioSenderTests(RedisTestCase):
+    def _sender(self, handler):
+        sender = TwilioSender(rate=1000, burst=1000, max_connections=1)
+        sender._client = httpx.Client(
+            base_url=sender.base_url, transport=httpx.MockTransport(handler)
+        )
+        sender._client_pid = os.getpid()
+        return sender
+
+    def _failures(self, sender):
+        return int(self.redis.get(sender.circuit.failures_key) or 0)
+
+    def test_returns_the_message_sid(self):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(201, json={"sid": "SM123"})
+
+        self.assertEqual(self._sender(handler)("+15550001", "Paid"), "SM123")
+        self.assertIn(b"Body=Paid", requests[0].content)
+
+    def test_throttling_timeouts_and_server_errors_are_retryable(self):
+        for response in (
+            httpx.Response(429),
+            httpx.Response(408),
+            httpx.Response(503),
+            httpx.ConnectError("refused"),
+        ):
+            with self.subTest(response):
+
+                def handler(request, response=response):
+                    if isinstance(response, Exception):
+                        raise response
+                    return response
+
+                sender = self._sender(handler)
+                with self.assertRaises(ProviderUnavailable):
+                    sender("+15550001", "Paid")
+        self.assertEqual(self._failures(sender), 4)
+
+    def test_rejected_requests_are_permanent(self):
+        sender = self._sender(lambda request: httpx.Response(400, json={"code": 21211}))
+
+        with self.assertRaises(httpx.HTTPStatusError):
+            sender("+15550001", "Paid")
+        self.assertEqual(self._failures(sender), 0)
+
+
+class CircuitBreakerTests(RedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = 1000.0
+        patcher = mock.patch("app.circuit.time", monotonic=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.circuit = self.sender.circuit
+        self.sender.errors["+15550001"] = httpx.ConnectError("refused")
+
+    def _fail(self, times):
+        for _ in range(times):
+            with self.assertRaises(ProviderUnavailable):
+                self.sender("+15550001", "Paid")
+
+    def test_failures_open_the_circuit_and_calls_fail_fast(self):
+        self._fail(self.circuit.failures)
+
+        with mock.patch.object(self.sender, "send") as send:
+            with self.assertRaisesRegex(ProviderUnavailable, "circuit open"):
+                self.sender("+15550002", "Paid")
+        send.assert_not_called()
+
+    def test_other_workers_see_the_open_circuit(self):
+        self._fail(self.circuit.failures)
+        other = FakeSender()
+
+        self.now += CHECK_INTERVAL
+        self.assertFalse(other.circuit.allow())
+
+    def test_traffic_resumes_after_the_cooldown(self):
+        self._fail(self.circuit.failures)
+
+        self.redis.delete(self.circuit.open_key)  # expired in Redis
+        self.now += self.circuit.cooldown
+
+        self.assertTrue(self.circuit.allow())
+        self.assertEqual(self.sender("+15550002", "Paid"), "SM1")
+
+    def test_failures_below_the_threshold_keep_it_closed(self):
+        self._fail(self.circuit.failures - 1)
+
+        self.assertTrue(self.circuit.allow())
+        self.assertEqual(self.sender("+15550002", "Paid"), "SM1")
+
+    def test_an_open_circuit_fails_over_to_the_next_sender(self):
+        self._fail(self.circuit.failures)
+        backup = BackupSender()
+
+        with mock.patch.dict(SMS_SENDERS, {"backup": backup}):
+            with LedgerWriter() as ledger:
+                successes, failures, retrying = deliver(
+                    "fake", "Paid", {"+15550002": ["n1"]}, ledger, TRANSACTIONAL_QUEUE
+                )
+
+        self.assertEqual(self.sender.sent, [])
+        self.assertEqual(backup.sent, [("+15550002", "Paid")])
+        self.assertEqual((len(successes), failures, retrying), (1, [], []))
+
+
+class RetryTests(RedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sender.errors["+15550001"] = httpx.ConnectError("refused")
+        patcher = mock.patch("app.tasks.dead_letter_task.delay")
+        self.dead_letter = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retry_delay_doubles_up_to_the_maximum_with_jitter(self):
+        with mock.patch("app.tasks.random.uniform", lambda low, high: high):
+            delays = [retry_delay(attempt) for attempt in range(8)]
+        with mock.patch("app.tasks.random.uniform", lambda low, high: low):
+            shortest = retry_delay(0)
+
+        self.assertEqual(delays, [10, 20, 40, 80, 160, 320, 600, 600])
+        self.assertEqual(shortest, 5)
+
+    def test_retryable_failures_are_retried_later_on_their_lane(self):
+        with mock.patch("app.tasks.retry_notification_task.apply_async") as apply_async:
+            with mock.patch("app.tasks.random.uniform", lambda low, high: high):
+                with LedgerWriter() as ledger:
+                    deliver(
+                        "fake",
+                        "Paid",
+                        {"+15550001": ["n1"], "+15550002": ["n2"]},
+                        ledger,
+                        BULK_QUEUE,
+                    )
+
+        self.assertEqual(self.sender.sent, [("+15550002", "Paid")])
+        apply_async.assert_called_once_with(
+            ("fake", "Paid", {"+15550001": ["n1"]}, 1),
+            {"queue": BULK_QUEUE},
+            countdown=10,
+            queue=BULK_QUEUE,
+        )
+
+    def test_numbers_are_dead_lettered_once_retries_are_spent(self):
+        expect("n1", ["+15550001"])
+
+        # Eager: every retry runs right away, until the last one dead-letters.
+        with mock.patch("app.tasks.send_to_each", wraps=send_to_each) as send:
+            with LedgerWriter() as ledger:
+                deliver("fake", "Paid", {"+15550001": ["n1"]}, ledger, TRANSACTIONAL_QUEUE)
+
+        self.assertEqual(send.call_count, SMS_MAX_RETRIES + 1)
+        (sender, message, pending, errors), kwargs = self.dead_letter.call_args
+        self.assertEqual((sender, message, pending), ("fake", "Paid", {"+15550001": ["n1"]}))
+        self.assertEqual(kwargs, {"queue": TRANSACTIONAL_QUEUE})
+        self.assertTrue(errors[0]["error"].startswith("Retries exhausted"))
+        data = read_notification("n1")
+        self.assertEqual((data["failed"], data["final"]), (1, True))
+        self.assertTrue(data["results"][0]["error"].startswith("Retries exhausted"))
+
+    def test_permanent_failures_are_not_retried(self):
+        self.sender.errors["+15550001"] = ValueError("Invalid number")
+
+        with mock.patch("app.tasks.retry_notification_task.apply_async") as apply_async:
+            with LedgerWriter() as ledger:
+                _, failures, retrying = deliver(
+                    "fake", "Paid", {"+15550001": ["n1"]}, ledger, TRANSACTIONAL_QUEUE
+                )
+
+        apply_async.assert_not_called()
+        self.dead_letter.assert_not_called()
+        self.assertEqual((failures[0]["error"], retrying), ("Invalid number", []))
+
+
+class CoalescingTests(RedisTestCase):
+    def test_messages_in_one_window_go_out_as_one_sms(self):
+        buffer_message("fake", "+15550001", "Order 1 is paid", "n1")
+        buffer_message("fake", "+15550001", "Order 1 is shipped", "n2")
+        buffer_message("fake", "+15550002", "Order 2 is paid", "n3")
+
+        flush_notifications_task.delay()
+
+        self.assertCountEqual(
+            self.sender.sent,
+            [
+                ("+15550001", "Order 1 is paid\nOrder 1 is shipped"),
+                ("+15550002", "Order 2 is paid"),
+            ],
+        )
+        self.assertEqual(read_notification("n1")[SENT], 1)
+        self.assertEqual(read_notification("n2")[SENT], 1)
+
+    def test_repeated_messages_are_sent_once(self):
+        data = {"phone_numbers": ["+15550001"], "message": "Your code is 1234", "sender": "fake"}
+
+        first = send_notification_task.apply(args=(data,), task_id="n1").get()
+        second = send_notification_task.apply(args=(data,), task_id="n2").get()
+
+        self.assertEqual(first, {"buffered": ["+15550001"], "duplicates": []})
+        self.assertEqual(second, {"buffered": [], "duplicates": ["+15550001"]})
+        self.assertEqual(self.sender.sent, [("+15550001", "Your code is 1234")])
+        self.assertEqual(read_notification("n2")[DUPLICATE], 1)
+
+    def test_buffers_outlive_a_flush_that_dies_before_delivering(self):
+        buffer_message("fake", "+15550001", "Order 1 is paid", "n1")
+
+        with mock.patch("app.tasks.deliver_all", side_effect=RuntimeError("worker lost")):
+            with self.assertRaises(RuntimeError):
+                flush_notifications_task.delay()
+        flush_notifications_task.delay()  # still leased to the dead flush
+        self.assertEqual(self.sender.sent, [])
+
+        lease_over = time.time() + SMS_FLUSH_LEASE + 1
+        with mock.patch("app.coalesce.time", time=lambda: lease_over):
+            flush_notifications_task.delay()
+            flush_notifications_task.delay()
+
+        self.assertEqual(self.sender.sent, [("+15550001", "Order 1 is paid")])
+        self.assertEqual(read_notification("n1")[SENT], 1)
+        self.assertEqual(self.redis.keys("notify:{coalesce}:in-flight*"), [])
+
+    def test_distinct_messages_of_a_flush_are_sent_concurrently(self):
+        numbers = [f"+1555000{i}" for i in range(5)]
+        for i, number in enumerate(numbers):
+            buffer_message("fake", number, f"Order {i} is paid", f"n{i}")
+        # Every send waits for the others, so sending one message after another fails.
+        barrier = threading.Barrier(len(numbers), timeout=5)
+        send = self.sender.send
+
+        def send_together(to_number, message):
+            barrier.wait()
+            return send(to_number, message)
+
+        with mock.patch.object(self.sender, "send", side_effect=send_together):
+            result = flush_notifications_task.delay().get()
+
+        self.assertEqual(result["failures"], [])
+        self.assertCountEqual(
+            self.sender.sent, [(number, f"Order {i} is paid") for i, number in enumerate(numbers)]
+        )
+
+    def test_merged_sms_stay_under_the_length_limit(self):
+        for notification_id, message in enumerate(
+            ["Order 1 is paid", "Order 1 is shipped", "x" * 30]
+        ):
+            buffer_message("fake", "+15550001", message, str(notification_id))
+
+        with mock.patch("app.coalesce.SMS_MAX_MERGED_LENGTH", 40):
+            flush_notifications_task.delay()
+
+        self.assertCountEqual(
+            self.sender.sent,
+            [("+15550001", "Order 1 is paid\nOrder 1 is shipped"), ("+15550001", "x" * 30)],
+        )
+
+    def test_the_flush_is_sent_outside_the_request_and_its_trace(self):
+        headers = {}
+
+        def apply_async(**options):
+            logs.on_before_task_publish(headers)
+            tracing.on_before_task_publish(headers)
+
+        span = NonRecordingSpan(
+            SpanContext(0xA1, 0xB2, is_remote=True, trace_flags=TraceFlags(TraceFlags.SAMPLED))
+        )
+        token = logs.request_id.set("checkout-1")
+        self.addCleanup(logs.request_id.reset, token)
+        with trace.use_span(span), mock.patch.object(
+            flush_notifications_task, "apply_async", side_effect=apply_async
+        ):
+            schedule_flush()
+            self.assertEqual(logs.request_id.get(), "checkout-1")
+
+        self.assertEqual(headers, {})
+
+    def test_coalescing_keys_share_one_cluster_slot(self):
+        buffer_message("fake", "+15550001", "Order 1 is paid", "n1")
+        with mock.patch("app.tasks.deliver_all", side_effect=RuntimeError("worker lost")):
+            with self.assertRaises(RuntimeError):
+                flush_notifications_task.delay()
+        buffer_message("fake", "+15550002", "Order 2 is paid", "n2")
+
+        keys = self.redis.keys("notify:{coalesce}:*")
+
+        self.assertEqual(len(keys), 6)  # two dedup keys, buffer, due, flush, in-flight
+        self.assertEqual({key_slot(key) for key in keys}, {key_slot(DUE_KEY.encode())})
+
+
+class BulkUploadTests(RedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = TestClient(app)
+
+    def _upload(self, lines):
+        return self.client.post(
+            "/send-notification/bulk?sender=fake",
+            content="\n".join(lines),
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+
+    def test_valid_records_are_sent_and_invalid_ones_reported_by_line(self):
+        response = self._upload(
+            [
+                json.dumps({"phone": "+15550001", "message": "Sale"}),
+                "",
+                json.dumps({"phone": "15550002", "message": "Sale"}),
+                "{not json",
+                json.dumps({"phone": "+15550003", "message": "Sale"}),
+            ]
+        )
+
+        self.assertEqual(response.status_code, 202)
+        body = response.json()
+        self.assertEqual((body["accepted"], body["rejected"], body["tasks"]), (2, 2, 1))
+        self.assertEqual([error["line"] for error in body["errors"]], [3, 4])
+        self.assertCountEqual(self.sender.sent, [("+15550001", "Sale"), ("+15550003", "Sale")])
+        status = self.client.get(f"/notifications/{body['batch_id']}").json()
+        self.assertEqual((status["total"], status[SENT], status["final"]), (2, 2, True))
+
+    @mock.patch("app.main.SMS_BULK_BATCH_SIZE", 1)
+    @mock.patch("app.main.SMS_BULK_MAX_LINE", 60)
+    def test_an_overlong_line_ends_the_upload_but_returns_the_batch_id(self):
+        records = [
+            json.dumps({"phone": f"+1555000{number}", "message": message})
+            for number, message in enumerate(["Sale", "Sale", "Sale" * 20, "Sale"])
+        ]
+
+        # Sent in one chunk: the overlong line is complete, not the trailing fragment.
+        response = self._upload(records)
+
+        self.assertEqual(response.status_code, 413)
+        body = response.json()
+        self.assertIn("Line 3", body["detail"])
+        self.assertEqual((body["accepted"], body["tasks"]), (2, 2))
+        self.assertEqual(len(self.sender.sent), 2)
+        status = self.client.get(f"/notifications/{body['batch_id']}").json()
+        self.assertEqual((status["total"], status[SENT]), (2, 2))
+
+    def test_unknown_sender_is_rejected(self):
+        response = self.client.post("/send-notification/bulk?sender=nexmo", content="")
+
+        self.assertEqual(response.status_code, 422)
+
+
+class LedgerTests(RedisTestCase):
+    def test_recipients_without_an_outcome_are_queued(self):
+        expect("n1", ["+15550001", "+15550002"])
+        with LedgerWriter() as ledger:
+            ledger.record("n1", "+15550001", SENT, "SM1")
+
+        data = read_notification("n1")
+
+        self.assertEqual((data["total"], data[QUEUED], data[SENT], data["final"]), (2, 1, 1, False))
+        self.assertCountEqual(
+            data["results"],
+            [
+                {"number": "+15550001", "status": SENT, "message_id": "SM1"},
+                {"number": "+15550002", "status": QUEUED},
+            ],
+        )
+
+    def test_redelivered_outcomes_replace_earlier_ones(self):
+        expect("n1", ["+15550001"])
+        expect("n1", ["+15550001"])  # redelivered task
+        with LedgerWriter(batch_size=1) as ledger:
+            ledger.record_results(
+                {"+15550001": ["n1"]}, [], [{"number": "+15550001", "error": "busy"}]
+            )
+            ledger.record_results(
+                {"+15550001": ["n1"]}, [{"number": "+15550001", "message_id": "SM1"}], []
+            )
+
+        data = read_notification("n1")
+
+        self.assertEqual(
+            (data["total"], data["failed"], data[SENT], data["final"]), (1, 0, 1, True)
+        )
+
+    def test_numbers_listed_twice_are_counted_once(self):
+        data = {"phone_numbers": ["+15550001", "+15550001"], "message": "Paid", "sender": "fake"}
+
+        send_notification_task.apply(args=(data,), task_id="n1")
+
+        self.assertEqual(self.sender.sent, [("+15550001", "Paid")])
+        data = read_notification("n1")
+        self.assertEqual((data["total"], data[SENT], data["final"]), (1, 1, True))
+
+    @mock.patch("app.main.SMS_BULK_BATCH_SIZE", 2)
+    def test_bulk_numbers_repeated_across_chunks_are_counted_once(self):
+        records = [
+            {"phone": "+15550001", "message": "Sale"},
+            {"phone": "+15550002", "message": "Sale"},
+            {"phone": "+15550001", "message": "Last day of the sale"},
+        ]
+
+        client = TestClient(app)
+        response = client.post(
+            "/send-notification/bulk?sender=fake",
+            content="\n".join(json.dumps(record) for record in records),
+        )
+
+        self.assertEqual(len(self.sender.sent), 3)
+        data = client.get(f"/notifications/{response.json()['batch_id']}").json()
+        self.assertEqual((data["total"], data[SENT], data[QUEUED], data["final"]), (2, 2, 0, True))
+
+    def test_bulk_chunks_from_other_producers_list_their_recipients(self):
+        # The e-commerce outbox enqueues chunks without going through the API.
+        self.sender.errors["+15550002"] = httpx.ConnectError("refused")
+        records = [["+15550001", "Sale"], ["+15550002", "Sale"]]
+
+        with mock.patch.object(retry_notification_task, "apply_async"):
+            send_bulk_notification_task.apply(args=("b1", "fake", records))
+
+        data = read_notification("b1")
+        self.assertEqual((data["total"], data[SENT], data[QUEUED], data["final"]), (2, 1, 1, False))
+
+    def test_unknown_notifications_read_as_none(self):
+        self.assertIsNone(read_notification("missing"))
+
+
+class QueueRoutingTests(RedisTestCase):
+    def _queue(self, task_name):
+        return celery_app.amqp.router.route({}, task_name)["queue"].name
+
+    def test_tasks_are_routed_to_their_lane(self):
+        self.assertEqual(self._queue("send_notification_task"), TRANSACTIONAL_QUEUE)
+        self.assertEqual(self._queue("flush_notifications_task"), TRANSACTIONAL_QUEUE)
+        self.assertEqual(self._queue("send_bulk_notification_task"), BULK_QUEUE)
+        self.assertEqual(self._queue("dead_letter_task"), SMS_DEAD_LETTER_QUEUE)
+
+    def test_retries_stay_on_the_lane_they_came_from(self):
+        self.sender.errors["+15550001"] = httpx.ConnectError("refused")
+        lines = json.dumps({"phone": "+15550001", "message": "Sale"})
+
+        with mock.patch.object(retry_notification_task, "apply_async") as apply_async:
+            TestClient(app).post("/send-notification/bulk?sender=fake", content=lines)
+
+        self.assertEqual(apply_async.call_args.kwargs["queue"], BULK_QUEUE)
+
+    def test_messages_without_a_lane_retry_on_the_transactional_one(self):
+        # Queued before the lanes existed: four positional arguments, no queue.
+        self.sender.errors["+15550001"] = httpx.ConnectError("refused")
+
+        with mock.patch.object(retry_notification_task, "apply_async") as apply_async:
+            retry_notification_task.apply(("fake", "Paid", {"+15550001": ["n1"]}, 1))
+
+        self.assertEqual(apply_async.call_args.args[1], {"queue": TRANSACTIONAL_QUEUE})
+        self.assertEqual(apply_async.call_args.kwargs["queue"], TRANSACTIONAL_QUEUE)
+
+
+class LoggingTests(unittest.TestCase):
+    def record(self, level=logging.INFO, message="Sent"):
+        return logging.LogRecord("tests", level, __file__, 0, message, None, None)
+
+    def test_sampling_keeps_the_configured_fraction_per_level(self):
+        sampling = SamplingFilter({"debug": 0, "INFO": 0.5})
+
+        self.assertFalse(sampling.filter(self.record(logging.DEBUG)))
+        with mock.patch("app.logs.random.random", side_effect=[0.4, 0.6]):
+            self.assertTrue(sampling.filter(self.record()))
+            self.assertFalse(sampling.filter(self.record()))
+        self.assertTrue(sampling.filter(self.record(logging.WARNING)))
+
+    def test_records_are_dropped_when_the_queue_is_full_and_counted_later(self):
+        handler = QueueStreamHandler(maxsize=2)
+        handler.listener.stop()  # nothing drains the queue
+        self.addCleanup(handler._start)
+
+        for message in ("kept", "kept", "dropped", "dropped"):
+            handler.handle(self.record(message=message))
+        self.assertEqual((handler.dropped, handler.reported), (2, 0))
+
+        for _ in range(2):
+            handler.queue.get_nowait()
+        handler.handle(self.record(message="after"))
+
+        self.assertEqual(
+            [handler.queue.get_nowait().getMessage() for _ in range(2)],
+            ["after", "Dropped 2 log records: the log queue was full"],
+        )
+        self.assertEqual(handler.reported, 2)
+
+    def test_drops_not_yet_reported_are_logged_at_exit(self):
+        handler = QueueStreamHandler()
+        self.addCleanup(handler._start)
+        handler.dropped = 3
+
+        with mock.patch.object(handler.target, "handle") as handle:
+            handler._stop()
+
+        self.assertEqual(
+            handle.call_args.args[0].getMessage(), "Dropped 3 log records: the log queue was full"
+        )
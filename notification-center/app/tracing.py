@@ -0,0 +1,96 @@
+import os
+
+from celery.signals import before_task_publish, task_postrun, task_prerun, worker_init
+from dotenv import load_dotenv
+from opentelemetry import context, propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, StatusCode
+
+load_dotenv()
+
+# "otlp" sends spans to OTEL_EXPORTER_OTLP_ENDPOINT, "file" appends them to
+# TRACING_FILE as JSON lines, "none" turns tracing off.
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none")
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+# For traces started here; tasks from e-commerce keep the decision made there.
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", "0.05"))
+TRACING_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "notification-center")
+
+tracer = trace.get_tracer("notification-center")
+
+_configured = False
+
+
+def configure_tracing() -> None:
+    global _configured
+    if _configured or TRACING_EXPORTER == "none":
+        return
+    _configured = True
+
+    if TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        exporter = OTLPSpanExporter()
+    elif TRACING_EXPORTER == "file":
+        exporter = ConsoleSpanExporter(
+            out=open(TRACING_FILE, "a", buffering=1),
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+    else:
+        raise ValueError(f"Unknown TRACING_EXPORTER: {TRACING_EXPORTER}")
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": TRACING_SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATIO)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+
+
+@worker_init.connect
+def on_worker_init(**kwargs):
+    configure_tracing()
+
+
+@task_prerun.connect
+def on_task_prerun(task, **kwargs):
+    # Headers sent with the task, traceparent included, are attributes of the request.
+    carrier = {
+        key: value
+        for key in ("traceparent", "tracestate")
+        if (value := getattr(task.request, key, None))
+    }
+    span = tracer.start_span(
+        f"process {task.name}",
+        context=propagate.extract(carrier),
+        kind=SpanKind.CONSUMER,
+        attributes={
+            "messaging.system": "rabbitmq",
+            "messaging.message.id": task.request.id,
+            "messaging.destination.name": (task.request.delivery_info or {}).get("routing_key", ""),
+        },
+    )
+    task.request.trace_span = span
+    task.request.trace_token = context.attach(trace.set_span_in_context(span))
+
+
+@task_postrun.connect
+def on_task_postrun(task, state=None, retval=None, **kwargs):
+    span = getattr(task.request, "trace_span", None)
+    if span is None:
+        return
+    context.detach(task.request.trace_token)
+    if state == "FAILURE" and isinstance(retval, BaseException):
+        span.record_exception(retval)
+        span.set_status(StatusCode.ERROR)
+    span.end()
+
+
+@before_task_publish.connect
+def on_before_task_publish(headers, **kwargs):
+    # Retries and dead letters join the trace of the task that sent them.
+    if "traceparent" not in headers:
+        propagate.inject(headers)